@@ -0,0 +1,693 @@
+"""
+Benchmarks for the data paths behind the CLI menu and the helpers.
+
+Builds (or reuses) a seeded database per scale, runs each operation with
+its prompts answered from a script, and records latency percentiles,
+queries per operation and peak Python memory. Results are written as JSON
+so a run can be compared against an earlier one.
+
+    python bench.py --scales 1000,100000,1000000 --out bench_results.json
+    python bench.py --scales 1000 --baseline bench_results.json
+    python bench.py --startup --budget-ms 800
+    python bench.py --load http://127.0.0.1:8080 --concurrency 64
+    python bench.py --records 1000000
+    python bench.py --writers 16 --writes 200
+    python bench.py --backup 0,1,6 --scales 1000000
+"""
+import gc
+import os
+import sys
+import json
+import random
+import sqlite3
+import subprocess
+import asyncio
+import argparse
+import platform
+import threading
+import tracemalloc
+import time as clock
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from unittest import mock
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import joinedload
+from rich.console import Console
+from rich.table import Table
+
+import cli
+import helpers
+import schedule
+from db import backup as snapshots
+from db.config import create_db_engine, load_settings
+from db.models import Trip, Booking, Activity, engine, ensure_schema, read_session, session_scope
+from db.read_models import select_trips, load_trips, trips as trip_table
+from service import ItineraryService, ServiceError
+from write_queue import WriteQueue
+from db.seed import bulk_seed, DEFAULT_ANCHOR as SEED_ANCHOR, START_SPREAD_DAYS, ACTIVITY_NAMES, HOTEL_CHAINS
+
+console = Console()
+
+class QueryCounter:
+    """Counts statements sent to the database"""
+
+    def __init__(self, bind):
+        self.count = 0
+        event.listen(bind, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+class Scenario:
+    """Random existing trips for the operations to work on"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        with read_session() as session:
+            self.max_trip_id = session.scalar(select(func.max(Trip.id))) or 0
+
+    def random_trip(self):
+        while True:
+            trip = helpers.get_trip_by_id(self.rng.randint(1, self.max_trip_id))
+            if trip is not None:
+                return trip
+
+    def throwaway_trip(self):
+        """A trip with children that a delete benchmark may remove"""
+        trip = Trip(destination="Benchmark", start_date=datetime(2030, 1, 1).date(),
+                    end_date=datetime(2030, 1, 5).date())
+        trip.bookings = [Booking(flight="BM 100", hotel="Bench Inn")]
+        trip.activities = [Activity(name="Bench", date=trip.start_date) for _ in range(5)]
+        with session_scope() as session:
+            session.add(trip)
+        return trip
+
+# Each benchmark takes the scenario and returns (operation, prompt answers)
+def bench_list_trips(scenario):
+    return cli.list_trips, []
+
+def bench_trip_details(scenario):
+    return cli.trip_details, [str(scenario.random_trip().id)]
+
+def bench_add_trip(scenario):
+    return cli.add_trip, ["Benchmark City", "2030-01-01", "2030-01-07"]
+
+def bench_add_activity(scenario):
+    trip = scenario.random_trip()
+    return cli.add_activity, [str(trip.id), "Benchmark", str(trip.start_date), "10:00", "60"]
+
+def bench_add_booking(scenario):
+    return cli.add_booking, [str(scenario.random_trip().id), "BM 200", "Bench Hotel"]
+
+def bench_update_trip(scenario):
+    trip = scenario.random_trip()
+    return cli.update_trip, [str(trip.id), trip.destination, str(trip.start_date), str(trip.end_date)]
+
+def bench_delete_trip(scenario):
+    return cli.delete_trip, [str(scenario.throwaway_trip().id)]
+
+def bench_get_trip_by_id(scenario):
+    trip_id = scenario.random_trip().id
+    return lambda: helpers.get_trip_by_id(trip_id), []
+
+def bench_get_activities_for_trip(scenario):
+    trip_id = scenario.random_trip().id
+    return lambda: helpers.get_activities_for_trip(trip_id), []
+
+def bench_create_daily_schedule(scenario):
+    activities = helpers.get_activities_for_trip(scenario.random_trip().id)
+    return lambda: helpers.create_daily_schedule(activities), []
+
+def bench_schedule_conflicts(scenario):
+    activities = helpers.get_activities_for_trip(scenario.random_trip().id)
+    return lambda: schedule.conflicts(activities), []
+
+def bench_schedule_free_slots(scenario):
+    trip = scenario.random_trip()
+    activities = helpers.get_activities_for_trip(trip.id)
+    return lambda: schedule.free_slots(trip.start_date, trip.end_date, activities, 90), []
+
+def bench_first_trip_page(scenario):
+    return lambda: next(helpers.iter_trip_pages(), None), []
+
+def random_week(scenario):
+    """A week somewhere in the range bulk_seed spreads trips over"""
+    start = SEED_ANCHOR + timedelta(days=scenario.rng.randrange(START_SPREAD_DAYS))
+    return start, start + timedelta(days=6)
+
+def bench_trips_overlapping(scenario):
+    start, end = random_week(scenario)
+    return lambda: next(helpers.trips_overlapping(start, end), None), []
+
+def bench_count_overlapping(scenario):
+    start, end = random_week(scenario)
+    return lambda: helpers.count_trips_in_window(start, end), []
+
+def _count_overlapping_sql(hint):
+    """The same count straight from trips, for comparison with the R*Tree"""
+    def bench(scenario):
+        start, end = random_week(scenario)
+        sql = f"SELECT count(*) FROM trips {hint} WHERE start_date <= ? AND end_date >= ?"
+        def count():
+            with engine.connect() as connection:
+                return connection.exec_driver_sql(sql, (str(end), str(start))).scalar()
+        return count, []
+    return bench
+
+def random_search_word(scenario):
+    return scenario.rng.choice(ACTIVITY_NAMES + HOTEL_CHAINS).split()[0]
+
+def bench_search_trips(scenario):
+    word = random_search_word(scenario)
+    return lambda: cli.service.search_trips(word), []
+
+def bench_search_like(scenario):
+    """The LIKE scan full-text search replaces, for comparison"""
+    pattern = f"%{random_search_word(scenario)}%"
+    sql = ("SELECT trip_id FROM activities WHERE name LIKE ? "
+           "UNION SELECT trip_id FROM bookings WHERE flight LIKE ? OR hotel LIKE ? "
+           "UNION SELECT id FROM trips WHERE destination LIKE ? LIMIT 20")
+    def search():
+        with engine.connect() as connection:
+            return connection.exec_driver_sql(sql, (pattern,) * 4).all()
+    return search, []
+
+def _page_counts(sql):
+    """A page of 50 trips with their activity and booking counts"""
+    def bench(scenario):
+        after_id = scenario.random_trip().id
+        def page():
+            with engine.connect() as connection:
+                return connection.exec_driver_sql(sql, (after_id,)).all()
+        return page, []
+    return bench
+
+bench_page_counts = _page_counts(
+    "SELECT id, activity_count, booking_count FROM trips JOIN trip_summaries ON trip_id = id "
+    "WHERE id > ? ORDER BY id LIMIT 50"
+)
+# Counting children per trip, as trip_summaries replaces
+bench_page_counts_sql = _page_counts(
+    "SELECT id, (SELECT count(*) FROM activities WHERE trip_id = trips.id), "
+    "(SELECT count(*) FROM bookings WHERE trip_id = trips.id) "
+    "FROM trips WHERE id > ? ORDER BY id LIMIT 50"
+)
+
+BENCHMARKS = {
+    "list_trips": bench_list_trips,
+    "trip_details": bench_trip_details,
+    "add_trip": bench_add_trip,
+    "add_activity": bench_add_activity,
+    "add_booking": bench_add_booking,
+    "update_trip": bench_update_trip,
+    "delete_trip": bench_delete_trip,
+    "helpers.get_trip_by_id": bench_get_trip_by_id,
+    "helpers.get_activities_for_trip": bench_get_activities_for_trip,
+    "helpers.create_daily_schedule": bench_create_daily_schedule,
+    "schedule.conflicts": bench_schedule_conflicts,
+    "schedule.free_slots": bench_schedule_free_slots,
+    "helpers.iter_trip_pages": bench_first_trip_page,
+    "helpers.trips_overlapping": bench_trips_overlapping,
+    "count_overlapping.rtree": bench_count_overlapping,
+    "count_overlapping.btree": _count_overlapping_sql("INDEXED BY ix_trips_start_end"),
+    "count_overlapping.scan": _count_overlapping_sql("NOT INDEXED"),
+    "search.fts": bench_search_trips,
+    "search.like": bench_search_like,
+    "page_counts.summary": bench_page_counts,
+    "page_counts.count": bench_page_counts_sql,
+}
+
+def scripted(answers):
+    """Patch the rich prompts: Prompt.ask pops answers, Confirm.ask only confirms deletes"""
+    answers = list(answers)
+    return (
+        mock.patch.object(cli.Prompt, "ask", side_effect=lambda *args, **kwargs: answers.pop(0)),
+        mock.patch.object(cli.Confirm, "ask", side_effect=lambda prompt, **kwargs: "sure" in prompt),
+    )
+
+def run_once(scenario, benchmark, counter):
+    """Run one operation; returns (seconds, queries)"""
+    operation, answers = benchmark(scenario)
+    prompt_patch, confirm_patch = scripted(answers)
+    with prompt_patch, confirm_patch:
+        queries = counter.count
+        started = clock.perf_counter()
+        operation()
+        elapsed = clock.perf_counter() - started
+    return elapsed, counter.count - queries
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def measure(name, benchmark, scenario, counter, iterations):
+    latencies, queries = [], []
+    for _ in range(iterations):
+        elapsed, count = run_once(scenario, benchmark, counter)
+        latencies.append(elapsed)
+        queries.append(count)
+
+    # Peak memory comes from a separate run, tracemalloc slows everything down
+    tracemalloc.start()
+    try:
+        run_once(scenario, benchmark, counter)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "case": name,
+        "iterations": iterations,
+        "mean_ms": sum(latencies) / iterations * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "queries_per_op": sum(queries) / iterations,
+        "peak_kib": peak / 1024,
+    }
+
+def prepare_database(directory, trips, seed):
+    """
+    Path of the database in `directory`, seeded first if it is new
+    Seeding goes through an engine of its own; the app's engine is never
+    pointed elsewhere in this process (see in_worker).
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "travel_itinerary.db")
+    seeded = os.path.exists(path)
+    bind = create_db_engine(f"sqlite:///{path}")
+    try:
+        # Also brings databases seeded by older versions up to the current schema
+        ensure_schema(bind)
+        if not seeded:
+            console.print(f"[yellow]Seeding {trips:,} trips in {directory}...[/yellow]")
+            bulk_seed(trips, seed, bind=bind, report=lambda message: None)
+    finally:
+        bind.dispose()
+    return path
+
+def in_worker(path, *arguments):
+    """
+    Run this script again with `arguments` against the database at `path`
+    The menu, helpers and service all share db.models.engine, which is
+    built from the configuration at import, so each database gets a process
+    whose TRAVEL_DB_URL names it; the profile and other settings still
+    come from the configuration.
+    """
+    subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], *arguments, "--database", path],
+                   env={**os.environ, "TRAVEL_DB_URL": f"sqlite:///{path}"}, check=True)
+
+def run_cases(scale, names, iterations, seed):
+    """Every case against the database this process was started on (see in_worker)"""
+    counter = QueryCounter(engine)
+    # Operations print through cli.console; render into the void instead
+    cli.console = Console(file=open(os.devnull, "w"), width=120)
+    scenario = Scenario(random.Random(seed))
+    results = []
+    for name in names:
+        result = measure(name, BENCHMARKS[name], scenario, counter, iterations)
+        result["scale"] = scale
+        results.append(result)
+        console.print(f"  {scale:>9,} {name:<34} p50 {result['p50_ms']:9.2f} ms")
+    return results
+
+def run(scales, data_dir, seed, out_path):
+    """One worker per scale, each writing its results next to `out_path`"""
+    results = []
+    for scale in scales:
+        path = prepare_database(os.path.join(data_dir, f"trips_{scale}"), scale, seed)
+        part = f"{out_path}.{scale}.part"
+        in_worker(path, "--scales", str(scale), "--out", part)
+        with open(part) as handle:
+            results.extend(json.load(handle))
+        os.remove(part)
+    return results
+
+def measure_startup(runs, data_dir):
+    """
+    Wall time of `python cli.py` from launch until the menu has been shown
+    and exited, against an already initialized database
+    """
+    path = prepare_database(os.path.join(data_dir, "startup"), 10, 0)
+    cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    timings = []
+    for _ in range(runs):
+        started = clock.perf_counter()
+        subprocess.run([sys.executable, cli_path], input="0\n", text=True, stdout=subprocess.DEVNULL,
+                       env={**os.environ, "TRAVEL_DB_URL": f"sqlite:///{path}"}, check=True)
+        timings.append((clock.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings
+
+# Ways to load the first n trips with their counts, for --records
+def _orm_trips(session, rows):
+    return session.scalars(
+        select(Trip).options(joinedload(Trip.summary)).order_by(Trip.id).limit(rows)
+    ).unique().all()
+
+def _core_rows(session, rows):
+    return session.execute(select_trips().order_by(trip_table.c.id).limit(rows)).all()
+
+def _trip_records(session, rows):
+    return load_trips(session, select_trips().order_by(trip_table.c.id).limit(rows))
+
+RECORD_LOADERS = {"orm": _orm_trips, "core_rows": _core_rows, "records": _trip_records}
+
+def compare_records(rows):
+    """
+    Load `rows` trips as ORM entities, Core rows and read-model records
+    Reports throughput from an untraced run, then the memory the result
+    still holds once its session is closed and the peak while loading.
+    """
+    results = []
+    for name, load in RECORD_LOADERS.items():
+        gc.collect()
+        started = clock.perf_counter()
+        with read_session() as session:
+            loaded = len(load(session, rows))
+        elapsed = clock.perf_counter() - started
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with read_session() as session:
+                result = load(session, rows)
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del result
+        results.append({
+            "loader": name,
+            "rows": loaded,
+            "rows_per_sec": loaded / elapsed,
+            "retained_bytes_per_row": retained / loaded,
+            "peak_bytes_per_row": peak / loaded,
+        })
+        console.print(f"  {name:<10} {loaded / elapsed:>10,.0f} rows/s  {retained / loaded:>6,.0f} B/row retained  "
+                      f"{peak / loaded:>6,.0f} B/row peak")
+    return results
+
+def _produce(service, trip_ids, rng, writes, latencies, failures):
+    for _ in range(writes):
+        started = clock.perf_counter()
+        try:
+            service.add_booking(rng.choice(trip_ids), "WQ 100", "Queue Inn")
+        except ServiceError:
+            failures.append(1)
+        latencies.append(clock.perf_counter() - started)
+
+def compare_write_paths(producers, writes, seed):
+    """
+    `producers` threads each add `writes` bookings, waiting for every one
+    to be committed before the next, first with one transaction per write
+    and then through a WriteQueue
+    """
+    with read_session() as session:
+        trip_ids = session.scalars(select(Trip.id).limit(10_000)).all()
+    results = []
+    for name in ("commit_per_write", "group_commit"):
+        writer = WriteQueue() if name == "group_commit" else None
+        service = ItineraryService(writer=writer)
+        rng = random.Random(seed)
+        latencies, failures = [], []
+        threads = [
+            threading.Thread(target=_produce, args=(service, trip_ids, random.Random(rng.random()), writes,
+                                                    latencies, failures))
+            for _ in range(producers)
+        ]
+        started = clock.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = clock.perf_counter() - started
+        if writer is not None:
+            writer.close()
+        latencies.sort()
+        result = {
+            "path": name,
+            "producers": producers,
+            "writes": len(latencies),
+            "writes_per_sec": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "failures": len(failures),
+            **(writer.info() if writer is not None else {}),
+        }
+        results.append(result)
+        console.print(f"  {name:<17} {result['writes_per_sec']:>8,.0f} writes/s  p50 {result['p50_ms']:6.2f} ms  "
+                      f"p99 {result['p99_ms']:7.2f} ms  {result['failures']} failed"
+                      + (f"  ({writer.commits:,} commits, {writer.busy_retries} busy retries)" if writer else ""))
+    return results
+
+def _write_during(service, trip_ids, rng, stop, latencies):
+    while not stop.is_set():
+        started = clock.perf_counter()
+        service.add_booking(rng.choice(trip_ids), "BK 100", "Backup Inn")
+        latencies.append(clock.perf_counter() - started)
+
+def compare_backups(levels, pages, seed):
+    """
+    Snapshot the database at each gzip level while one thread keeps adding
+    bookings, one commit each; reports copy and compress throughput and the
+    writer's commit latency during the backup
+    """
+    with read_session() as session:
+        trip_ids = session.scalars(select(Trip.id).limit(10_000)).all()
+    results = []
+    for level in levels:
+        path = os.path.join(os.path.dirname(snapshots.database_path()), f"bench_snapshot.db{'.gz' if level else ''}")
+        stop = threading.Event()
+        latencies = []
+        writer = threading.Thread(target=_write_during,
+                                  args=(ItineraryService(), trip_ids, random.Random(seed), stop, latencies))
+        writer.start()
+        try:
+            snapshot = snapshots.backup(path, pages, level=level)
+        finally:
+            stop.set()
+            writer.join()
+        verify_started = clock.perf_counter()
+        snapshots.verify_snapshot(path)
+        verify_seconds = clock.perf_counter() - verify_started
+        for leftover in (path, path + ".sha256"):
+            os.remove(leftover)
+        latencies.sort()
+        megabytes = snapshot.database_bytes / 1e6
+        result = {
+            "level": level,
+            "database_mb": megabytes,
+            "snapshot_mb": snapshot.snapshot_bytes / 1e6,
+            "copy_mb_per_sec": megabytes / snapshot.copy_seconds,
+            "compress_mb_per_sec": megabytes / snapshot.compress_seconds,
+            "verify_mb_per_sec": megabytes / verify_seconds,
+            "restarts": snapshot.restarts,
+            "writes": len(latencies),
+            "write_p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+            "write_p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        }
+        results.append(result)
+        console.print(f"  level {level}  {megabytes:,.0f} MB -> {result['snapshot_mb']:,.0f} MB  "
+                      f"copy {result['copy_mb_per_sec']:,.0f} MB/s  compress {result['compress_mb_per_sec']:,.0f} MB/s  "
+                      f"verify {result['verify_mb_per_sec']:,.0f} MB/s  {snapshot.restarts} restarts  "
+                      f"{len(latencies):,} writes, p99 {result['write_p99_ms'] or 0:.1f} ms")
+    return results
+
+async def _request(reader, writer, method, path, payload=None):
+    """One keep-alive request; returns the status code"""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    await reader.readexactly(length)
+    return status
+
+async def _load_client(host, port, trip_ids, rng, remaining, write_ratio, latencies, failures):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while remaining:
+            remaining.pop()
+            trip_id = rng.choice(trip_ids)
+            started = clock.perf_counter()
+            if rng.random() < write_ratio:
+                status = await _request(reader, writer, "POST", f"/trips/{trip_id}/bookings",
+                                        {"flight": "LT 100", "hotel": "Load Test Inn"})
+            else:
+                status = await _request(reader, writer, "GET", f"/trips/{trip_id}")
+            latencies.append(clock.perf_counter() - started)
+            if status >= 400:
+                failures.append(status)
+    finally:
+        writer.close()
+
+async def load_test(url, concurrency, requests, write_ratio, seed):
+    """
+    Drive a running server.py with `concurrency` keep-alive connections
+    Reads fetch a random trip's details; writes add a booking to one
+    """
+    address = urlsplit(url)
+    host, port = address.hostname, address.port or 80
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"GET /trips?limit=1000 HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    trip_ids = [trip["id"] for trip in json.loads(await reader.readexactly(length))["trips"]]
+    writer.close()
+    if not trip_ids:
+        raise SystemExit("The server has no trips to load test against")
+
+    rng = random.Random(seed)
+    remaining = list(range(requests))
+    latencies, failures = [], []
+    started = clock.perf_counter()
+    await asyncio.gather(*(
+        _load_client(host, port, trip_ids, random.Random(rng.random()), remaining, write_ratio, latencies, failures)
+        for _ in range(concurrency)
+    ))
+    elapsed = clock.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_sec": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "failures": len(failures),
+    }
+
+def show(results, baseline=None):
+    previous = {(r["scale"], r["case"]): r for r in (baseline or {}).get("results", [])}
+    table = Table(title="Benchmark results", header_style="bold magenta")
+    for column in ("Trips", "Case", "p50 ms", "p90 ms", "p99 ms", "Queries/op", "Peak KiB"):
+        if column == "Case":
+            table.add_column(column, no_wrap=True)
+        else:
+            table.add_column(column, justify="right")
+    if previous:
+        table.add_column("p50 vs baseline", justify="right")
+    for result in results:
+        row = [
+            f"{result['scale']:,}", result["case"],
+            f"{result['p50_ms']:.2f}", f"{result['p90_ms']:.2f}", f"{result['p99_ms']:.2f}",
+            f"{result['queries_per_op']:.1f}", f"{result['peak_kib']:,.0f}",
+        ]
+        if previous:
+            old = previous.get((result["scale"], result["case"]))
+            row.append(f"{(result['p50_ms'] / old['p50_ms'] - 1) * 100:+.0f}%" if old else "-")
+        table.add_row(*row)
+    console.print(table)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the itinerary data paths")
+    parser.add_argument("--scales", default="1000,100000,1000000",
+                        help="comma separated trip counts")
+    parser.add_argument("--cases", default=",".join(BENCHMARKS),
+                        help="comma separated benchmark names")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default="bench_data",
+                        help="where the seeded databases are kept between runs")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--startup", action="store_true",
+                        help="only time CLI cold start and fail if the median is over --budget-ms")
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    parser.add_argument("--load", metavar="URL",
+                        help="load test a running server.py (e.g. http://127.0.0.1:8080) instead")
+    parser.add_argument("--concurrency", type=int, default=64, help="connections for --load")
+    parser.add_argument("--requests", type=int, default=10_000, help="total requests for --load")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="share of --load requests that write")
+    parser.add_argument("--records", type=int, metavar="ROWS",
+                        help="only compare loading ROWS trips as ORM entities, Core rows and read-model records")
+    parser.add_argument("--writers", type=int, metavar="N",
+                        help="only compare N threads writing one commit each against a group-commit WriteQueue")
+    parser.add_argument("--writes", type=int, default=200, help="bookings added per --writers thread")
+    parser.add_argument("--backup", metavar="LEVELS",
+                        help="only time snapshots at these gzip levels (e.g. 0,1,6) under a concurrent writer")
+    parser.add_argument("--pages", type=int, default=snapshots.PAGES_PER_STEP, help="pages per --backup step")
+    # Set by in_worker: this process's engine already points at the database
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    data_dir = os.path.abspath(args.data_dir)
+    scale = int(args.scales.split(",")[0])
+
+    if args.database:
+        if args.backup:
+            compare_backups([int(level) for level in args.backup.split(",")], args.pages, args.seed)
+        elif args.writers:
+            compare_write_paths(args.writers, args.writes, args.seed)
+        elif args.records:
+            compare_records(args.records)
+        else:
+            with open(args.out, "w") as handle:
+                json.dump(run_cases(scale, args.cases.split(","), args.iterations, args.seed), handle)
+        sys.exit(0)
+
+    if args.backup:
+        console.print(f"Snapshots of {scale:,} trips, {args.pages:,} pages per step:")
+        in_worker(prepare_database(os.path.join(data_dir, f"trips_{scale}"), scale, args.seed))
+        sys.exit(0)
+
+    if args.writers:
+        console.print(f"{args.writers} producers x {args.writes} bookings on {scale:,} trips "
+                      f"({load_settings()['profile']} profile):")
+        in_worker(prepare_database(os.path.join(data_dir, f"trips_{scale}"), scale, args.seed))
+        sys.exit(0)
+
+    if args.records:
+        console.print(f"Loading {args.records:,} trips:")
+        in_worker(prepare_database(os.path.join(data_dir, f"trips_{args.records}"), args.records, args.seed))
+        sys.exit(0)
+
+    if args.load:
+        result = asyncio.run(load_test(args.load, args.concurrency, args.requests, args.write_ratio, args.seed))
+        console.print(f"{result['requests']:,} requests over {result['concurrency']} connections in "
+                      f"{result['seconds']:.2f}s: {result['requests_per_sec']:,.0f} req/s, "
+                      f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+                      f"{result['failures']} failed")
+        sys.exit(1 if result["failures"] else 0)
+
+    if args.startup:
+        timings = measure_startup(args.iterations, data_dir)
+        median = percentile(timings, 0.5)
+        console.print(f"Cold start over {len(timings)} runs: median {median:.0f} ms, "
+                      f"min {timings[0]:.0f} ms, max {timings[-1]:.0f} ms (budget {args.budget_ms:.0f} ms)")
+        if median > args.budget_ms:
+            console.print("[red]✗ Cold start is over budget[/red]")
+            sys.exit(1)
+        console.print("[green]✓ Cold start within budget[/green]")
+        sys.exit(0)
+
+    out_path = os.path.abspath(args.out)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    results = run([int(scale) for scale in args.scales.split(",")], data_dir, args.seed, out_path)
+    with open(out_path, "w") as handle:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "iterations": args.iterations,
+            "results": results,
+        }, handle, indent=2)
+    show(results, baseline)
+    console.print(f"[green]✓ Results written to {out_path}[/green]")
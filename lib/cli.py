@@ -1,15 +1,15 @@
-import time
-from datetime import datetime
-from typing import Optional
-from sqlalchemy import select, delete
-from db.models import Trip, Booking, Activity, session, Base, engine
+import argparse
+from contextlib import nullcontext
+from datetime import date, timedelta
+from db.models import ensure_schema, engine
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from rich.prompt import Prompt, Confirm
-from rich.progress import track
 from rich.style import Style
-from rich.markdown import Markdown
+from rich.markup import escape
+from helpers import iter_trip_pages, validate_date, validate_time, validate_duration
+from service import ItineraryService, ServiceError, TripNotFound, sorted_activities, recurrence
 
 # Initialize Rich console
 console = Console()
@@ -20,40 +20,108 @@ success_style = Style(color="green", bold=True)
 warning_style = Style(color="yellow")
 highlight_style = Style(bold=True, underline=True)
 
+# Trips rendered per table when listing
+PAGE_SIZE = 50
+
+# The menu is one client of the service; server.py is another
+service = ItineraryService()
+
+# Set by --profile: books the SQL of every command and menu action
+instrumentation = None
+
+def _instrumented(name):
+    return instrumentation.command(name) if instrumentation is not None else nullcontext()
+
 def initialize_database():
-    """Create database tables if they don't exist"""
-    with console.status("[bold green]Initializing database...[/bold green]"):
-        Base.metadata.create_all(engine)
-        time.sleep(1)  # Simulate work for progress visualization
-    console.print("[green]✓ Database initialized successfully![/green]")
-
-def list_trips():
-    """Display all trips in a rich table"""
-    trips = session.scalars(select(Trip)).all()
-    
-    if not trips:
-        console.print("[bold red]No trips found.[/bold red]")
-        return
-    
-    table = Table(title="✈️ Your Trips", show_header=True, header_style="bold magenta")
+    """Create database tables unless the stored schema version is current"""
+    if ensure_schema(engine):
+        console.print("[green]✓ Database initialized successfully![/green]")
+
+def _trips_table(title=None):
+    table = Table(title=title, show_header=True, header_style="bold magenta")
     table.add_column("ID", style="cyan", justify="right")
     table.add_column("Destination", style="green")
     table.add_column("Start Date", style="yellow")
     table.add_column("End Date", style="yellow")
     table.add_column("Duration", justify="right")
-    
+    table.add_column("Activities", justify="right")
+    table.add_column("Bookings", justify="right")
+    return table
+
+def _add_trip_row(table, trip):
+    duration = (trip.end_date - trip.start_date).days + 1
+    table.add_row(
+        str(trip.id),
+        f"[bold]{trip.destination}[/bold]",
+        str(trip.start_date),
+        str(trip.end_date),
+        f"{duration} days",
+        str(trip.activity_count),
+        str(trip.booking_count),
+    )
+
+def list_trips(page_size=PAGE_SIZE, destination=None, window_start=None, window_end=None, interactive=True,
+               match="overlapping"):
+    """Display trips in rich tables, one page at a time"""
+    shown = 0
+    if interactive and window_start is None and window_end is None:
+        pages = _service_pages(page_size, destination)
+    else:
+        pages = iter_trip_pages(page_size, destination, window_start, window_end, match=match)
+    for page in pages:
+        table = _trips_table("✈️ Your Trips" if shown == 0 else None)
+        for trip in page:
+            _add_trip_row(table, trip)
+        console.print(table)
+        shown += len(page)
+
+        if interactive and len(page) == page_size:
+            if not Confirm.ask(f"Showing {shown} trips. Show more?", default=False):
+                break
+
+    if not shown:
+        console.print("[bold red]No trips found.[/bold red]")
+
+def _service_pages(page_size, destination=None):
+    """Keyset pages from the service, so a page already shown comes from its cache"""
+    after_id = 0
+    while True:
+        page = service.list_trips(after_id, page_size, destination)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1].id
+
+def _trip_matches(text, limit=10):
+    """Show trips whose destination starts with `text`"""
+    trips = service.list_trips(0, limit, text)
+    if not trips:
+        console.print(f"[yellow]No destinations start with '{escape(text)}'[/yellow]")
+        return
+    table = _trips_table()
     for trip in trips:
-        duration = (trip.end_date - trip.start_date).days + 1
-        table.add_row(
-            str(trip.id),
-            f"[bold]{trip.destination}[/bold]",
-            str(trip.start_date),
-            str(trip.end_date),
-            f"{duration} days"
-        )
-    
+        _add_trip_row(table, trip)
     console.print(table)
 
+def _choose_trip(action, load=None):
+    """
+    Ask for a trip ID instead of printing every trip first
+    Text looks trips up by destination prefix and '?' lists them all, then
+    the question is asked again. Raises TripNotFound for an unknown ID.
+    """
+    load = load or service.get_trip
+    while True:
+        answer = Prompt.ask(
+            f"\nEnter trip ID to {action} ([cyan]?[/cyan] lists trips, text finds destinations)", default="0"
+        ).strip()
+        if answer == "?":
+            list_trips()
+        elif answer.isdigit():
+            return load(int(answer))
+        else:
+            _trip_matches(answer)
+
 def add_trip():
     """Add a new trip with rich prompts"""
     console.print(Panel("➕ Add New Trip", style="bold blue"))
@@ -65,37 +133,21 @@ def add_trip():
         end_date = Prompt.ask("📅 [bold]End date[/bold] (YYYY-MM-DD)")
         
         try:
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-            
-            if end_date_obj < start_date_obj:
-                console.print("[red]Error: End date must be after start date[/red]")
-                continue
-                
-            trip = Trip(
-                destination=destination, 
-                start_date=start_date_obj, 
-                end_date=end_date_obj
-            )
-            session.add(trip)
-            session.commit()
-            console.print(f"[green]✓ Added trip to [bold]{destination}[/bold] (ID: {trip.id})[/green]")
-            break
-        except ValueError:
-            console.print("[red]Invalid date format. Please use YYYY-MM-DD.[/red]")
+            trip = service.create_trip(destination, start_date, end_date)
+        except ServiceError as error:
+            console.print(f"[red]✗ {error}[/red]")
+            if not destination.strip():
+                destination = Prompt.ask("🏝️ [bold]Destination[/bold]")
+            continue
+        console.print(f"[green]✓ Added trip to [bold]{trip.destination}[/bold] (ID: {trip.id})[/green]")
+        break
 
 def update_trip():
     """Update trip details with rich interface"""
     console.print(Panel("🔄 Update Trip", style="bold blue"))
-    list_trips()
     
     try:
-        trip_id = Prompt.ask("\nEnter trip ID to update", default="0")
-        trip = session.get(Trip, int(trip_id))
-        
-        if not trip:
-            console.print("[red]✗ No trip found with that ID[/red]")
-            return
+        trip = _choose_trip("update")
 
         console.print("\n[bold]Leave blank to keep current value:[/bold]")
         new_destination = Prompt.ask(
@@ -113,76 +165,45 @@ def update_trip():
             default=str(trip.end_date)
         )
 
-        # Update fields if changed
-        if getattr(trip, "destination") != new_destination:
-            setattr(trip, "destination", new_destination)
-        
-        try:
-            start_date = datetime.strptime(new_start_date, "%Y-%m-%d").date()
-            end_date = datetime.strptime(new_end_date, "%Y-%m-%d").date()
-            
-            if end_date < start_date:
-                console.print("[red]Error: End date must be after start date[/red]")
-                return
-            
-            setattr(trip, "start_date", start_date)
-            setattr(trip, "end_date", end_date)
-            
-            session.commit()
-            console.print("[green]✓ Trip updated successfully![/green]")
-        except ValueError:
-            console.print("[red]Invalid date format. Changes not saved.[/red]")
-            
-    except ValueError:
-        console.print("[red]Invalid input. Please enter a number.[/red]")
+        service.update_trip(trip.id, new_destination, new_start_date, new_end_date)
+        console.print("[green]✓ Trip updated successfully![/green]")
+    except TripNotFound:
+        console.print("[red]✗ No trip found with that ID[/red]")
+    except ServiceError as error:
+        console.print(f"[red]✗ {error} Changes not saved.[/red]")
 
 def delete_trip():
     """Delete a trip with confirmation"""
     console.print(Panel("❌ Delete Trip", style="bold red"))
-    list_trips()
     
     try:
-        trip_id = Prompt.ask("\nEnter trip ID to delete", default="0")
-        trip = session.get(Trip, int(trip_id))
-        
-        if not trip:
-            console.print("[red]✗ No trip found with that ID[/red]")
-            return
-        
+        trip = _choose_trip("delete")
+        activity_count, booking_count = trip.activity_count, trip.booking_count
+
         console.print(Panel.fit(
             f"[bold]You are about to delete:[/bold]\n"
             f"Destination: [red]{trip.destination}[/red]\n"
             f"Dates: {trip.start_date} to {trip.end_date}\n"
-            f"This will also delete {len(trip.activities)} activities and {len(trip.bookings)} bookings",
+            f"This will also delete {activity_count} activities and {booking_count} bookings",
             title="⚠️ Warning",
             border_style="red"
         ))
         
         if Confirm.ask("[bold red]Are you sure?[/bold red]", default=False):
             with console.status("[red]Deleting trip...[/red]"):
-                session.execute(delete(Booking).where(Booking.trip_id == trip.id))
-                session.execute(delete(Activity).where(Activity.trip_id == trip.id))
-                session.delete(trip)
-                session.commit()
-                time.sleep(1)
+                service.delete_trip(trip.id)
             console.print("[green]✓ Trip deleted successfully![/green]")
         else:
             console.print("[yellow]Deletion cancelled[/yellow]")
-    except ValueError:
-        console.print("[red]Invalid input. Please enter a number.[/red]")
+    except TripNotFound:
+        console.print("[red]✗ No trip found with that ID[/red]")
 
 def trip_details():
     """Show detailed trip information"""
     console.print(Panel("🔍 Trip Details", style="bold blue"))
-    list_trips()
     
     try:
-        trip_id = Prompt.ask("\nEnter trip ID to view details", default="0")
-        trip = session.get(Trip, int(trip_id))
-        
-        if not trip:
-            console.print("[red]✗ No trip found with that ID[/red]")
-            return
+        trip = _choose_trip("view details", service.trip_details)
         
         # Main trip panel
         console.print(Panel.fit(
@@ -193,8 +214,10 @@ def trip_details():
             border_style="blue"
         ))
         
+        bookings = trip.bookings
+        activities = sorted_activities(trip.activities)
+        
         # Bookings section
-        bookings = session.scalars(select(Booking).where(Booking.trip_id == trip.id)).all()
         if bookings:
             bookings_table = Table(title="📚 Bookings", show_lines=True)
             bookings_table.add_column("Type", style="cyan")
@@ -209,12 +232,6 @@ def trip_details():
             console.print("[italic]No bookings added yet.[/italic]")
         
         # Activities section
-        activities = session.scalars(
-            select(Activity)
-            .where(Activity.trip_id == trip.id)
-            .order_by(Activity.date, Activity.time)
-        ).all()
-        
         if activities:
             console.print("\n[bold underline]📅 Itinerary:[/bold underline]")
             current_date = None
@@ -225,71 +242,93 @@ def trip_details():
                     current_date = activity_date
                 activity_time = getattr(activity, "time", None)
                 activity_name = getattr(activity, "name", "")
+                duration = getattr(activity, "duration", None)
                 console.print(
                     f"  ⏰ [cyan]{activity_time.strftime('%H:%M') if activity_time is not None else 'All day':<6}[/cyan] "
-                    f"- [bold]{activity_name}[/bold]"
+                    f"- [bold]{activity_name}[/bold]" + (f" [dim]({duration} min)[/dim]" if duration else "")
                 )
         else:
             console.print("[italic]No activities planned yet.[/italic]")
             
-    except ValueError:
-        console.print("[red]Invalid input. Please enter a number.[/red]")
+    except TripNotFound:
+        console.print("[red]✗ No trip found with that ID[/red]")
 
 def add_activity():
     """Add an activity to a trip"""
     console.print(Panel("➕ Add Activity", style="bold blue"))
-    list_trips()
     
     try:
-        trip_id = Prompt.ask("\nEnter trip ID to add activity", default="0")
-        trip = session.get(Trip, int(trip_id))
-        
-        if not trip:
-            console.print("[red]✗ No trip found with that ID[/red]")
-            return
+        trip = _choose_trip("add activity")
+    except TripNotFound:
+        console.print("[red]✗ No trip found with that ID[/red]")
+        return
             
-        name = Prompt.ask("🎯 [bold]Activity name[/bold]")
-        
-        while True:
-            date_str = Prompt.ask("📅 [bold]Date[/bold] (YYYY-MM-DD)")
-            time_str = Prompt.ask("⏰ [bold]Time[/bold] (HH:MM, leave blank if all day)", default="")
-            date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                
-            trip_start = getattr(trip, "start_date")
-            trip_end = getattr(trip, "end_date")
-            if date < trip_start or date > trip_end:
-                console.print(f"[red]✗ Date must be between {trip_start} and {trip_end}[/red]")
-                continue
-                
-                time_obj = datetime.strptime(time_str, "%H:%M").time() if time_str else None
-                    
-                time_obj = datetime.strptime(time_str, "%H:%M").time() if time_str else None
-                
-                activity = Activity(
-                    name=name, 
-                    date=date, 
-                    time=time_obj, 
-                    trip_id=trip.id
-                )
-                session.add(activity)
-                session.commit()
-                console.print(f"[green]✓ Added activity '[bold]{name}[/bold]' to trip ID {trip.id}[/green]")
-                break
-    except ValueError:
-            console.print("[red]✗ Invalid format. Use YYYY-MM-DD for date and HH:MM for time.[/red]")
+    name = Prompt.ask("🎯 [bold]Activity name[/bold]")
+    
+    while True:
+        date_str = Prompt.ask("📅 [bold]Date[/bold] (YYYY-MM-DD)")
+        time_str = Prompt.ask("⏰ [bold]Time[/bold] (HH:MM, leave blank if all day)", default="")
+        duration_str = Prompt.ask(
+            "⌛ [bold]Duration[/bold] (minutes, leave blank if unknown)", default=""
+        ) if time_str.strip() else ""
+        try:
+            activity = service.add_activity(trip.id, name, date_str, time_str, duration_str)
+        except TripNotFound as error:
+            console.print(f"[red]✗ {error}[/red]")
+            return
+        except ServiceError as error:
+            console.print(f"[red]✗ {error}[/red]")
+            if not name.strip():
+                name = Prompt.ask("🎯 [bold]Activity name[/bold]")
+            continue
+        console.print(f"[green]✓ Added activity '[bold]{activity.name}[/bold]' to trip ID {trip.id}[/green]")
+        _warn_clashes(trip.id, activity)
+        break
+
+def _warn_clashes(trip_id, activity):
+    """Point out activities the new one overlaps; adding it is still allowed"""
+    if activity.time is None:
+        return
+    for conflict in service.trip_conflicts(trip_id):
+        others = [other.name for other in conflict.activities if other.id != activity.id]
+        if len(others) < len(conflict.activities):
+            console.print(f"[yellow]⚠ Overlaps {escape(', '.join(others))} "
+                          f"({conflict.start:%Y-%m-%d %H:%M} to {conflict.end:%H:%M})[/yellow]")
+
+def add_recurring_activity():
+    """Add an activity that repeats over the days of a trip"""
+    console.print(Panel("🔁 Add Recurring Activity", style="bold blue"))
+
+    try:
+        trip = _choose_trip("add recurring activity")
+    except TripNotFound:
+        console.print("[red]✗ No trip found with that ID[/red]")
+        return
+
+    name = Prompt.ask("🎯 [bold]Activity name[/bold]")
+    repeat = Prompt.ask("🔁 [bold]Repeat[/bold]", choices=["daily", "weekly", "every"], default="daily")
+    weekdays = Prompt.ask("📆 [bold]On[/bold] (e.g. mon,wed,fri, weekdays, weekends)") if repeat == "weekly" else None
+    every = Prompt.ask("🔢 [bold]Every how many days[/bold]", default="2") if repeat == "every" else 1
+    time_str = Prompt.ask("⏰ [bold]Time[/bold] (HH:MM, leave blank if all day)", default="")
+    duration_str = Prompt.ask(
+        "⌛ [bold]Duration[/bold] (minutes, leave blank if unknown)", default=""
+    ) if time_str.strip() else ""
+    starts = Prompt.ask(f"📅 [bold]First date[/bold] (YYYY-MM-DD, blank for {trip.start_date})", default="")
+    until = Prompt.ask(f"📅 [bold]Last date[/bold] (YYYY-MM-DD, blank for {trip.end_date})", default="")
+    try:
+        rule = recurrence(every, weekdays, starts, until)
+        added = service.add_recurring_activity(trip.id, name, rule, time_str, duration_str)
+    except ServiceError as error:
+        console.print(f"[red]✗ {error}[/red]")
+        return
+    console.print(f"[green]✓ Added '[bold]{escape(name.strip())}[/bold]' on {added} days of trip ID {trip.id}[/green]")
 
 def add_booking():
     """Add booking information"""
     console.print(Panel("➕ Add Booking", style="bold blue"))
-    list_trips()
     
     try:
-        trip_id = Prompt.ask("\nEnter trip ID to add booking", default="0")
-        trip = session.get(Trip, int(trip_id))
-        
-        if not trip:
-            console.print("[red]✗ No trip found with that ID[/red]")
-            return
+        trip = _choose_trip("add booking")
             
         flight = Prompt.ask("✈️ [bold]Flight details[/bold] (leave blank if none)", default="")
         hotel = Prompt.ask("🏨 [bold]Hotel details[/bold] (leave blank if none)", default="")
@@ -298,16 +337,114 @@ def add_booking():
             console.print("[yellow]No booking details provided. Nothing was added.[/yellow]")
             return
             
-        booking = Booking(
-            flight=flight if flight else None,
-            hotel=hotel if hotel else None,
-            trip_id=trip.id
-        )
-        session.add(booking)
-        session.commit()
+        service.add_booking(trip.id, flight, hotel)
         console.print("[green]✓ Booking added successfully![/green]")
-    except ValueError:
-        console.print("[red]Invalid input. Please enter a number.[/red]")
+    except TripNotFound:
+        console.print("[red]✗ No trip found with that ID[/red]")
+    except ServiceError as error:
+        console.print(f"[red]✗ {error}[/red]")
+
+def _matches_text(matches, limit=3):
+    shown = [f"{field}: {value}" for field, value in matches[:limit]]
+    if len(matches) > limit:
+        shown.append(f"+{len(matches) - limit} more")
+    return "\n".join(shown)
+
+def search_trips(text=None, limit=20):
+    """Full-text search over destinations, activities and bookings"""
+    if text is None:
+        console.print(Panel("🔎 Search Trips", style="bold blue"))
+        text = Prompt.ask("Search for (destination, activity, flight or hotel)")
+
+    results = service.search_trips(text, limit)
+    if not results:
+        console.print(f"[bold red]No trips match '{escape(text)}'.[/bold red]")
+        return
+
+    table = Table(title=f"🔎 Trips matching '{escape(text)}'", show_header=True, header_style="bold magenta",
+                  show_lines=True)
+    table.add_column("#", justify="right")
+    table.add_column("ID", style="cyan", justify="right")
+    table.add_column("Destination", style="green")
+    table.add_column("Dates", style="yellow")
+    table.add_column("Matched")
+    for rank, (trip, matches) in enumerate(results, start=1):
+        table.add_row(
+            str(rank),
+            str(trip.id),
+            f"[bold]{escape(trip.destination or '')}[/bold]",
+            f"{trip.start_date} to {trip.end_date}",
+            escape(_matches_text(matches)),
+        )
+    console.print(table)
+
+def rebuild_search(chunk_size):
+    """Reindex every trip, activity and booking for search"""
+    from db.maintenance import rebuild_search_index
+
+    with console.status("[yellow]Rebuilding the search index...[/yellow]") as status:
+        indexed = rebuild_search_index(chunk_size, report=status.update)
+    console.print(f"[green]✓ Indexed {indexed:,} rows[/green]")
+
+def verify_summaries(chunk_size, repair=False):
+    """Recount every trip and report summaries the triggers got wrong"""
+    from db.maintenance import verify_trip_summaries
+
+    with console.status("[yellow]Verifying trip summaries...[/yellow]") as status:
+        stale = verify_trip_summaries(chunk_size, repair, report=status.update)
+    if not stale:
+        console.print("[green]✓ Every trip summary is correct[/green]")
+        return
+    shown = ", ".join(map(str, stale[:20])) + (", ..." if len(stale) > 20 else "")
+    console.print(f"[red]✗ {len(stale):,} wrong summaries (trip IDs {shown})[/red]")
+    if repair:
+        console.print("[green]✓ Recounted the affected trips[/green]")
+
+def rebuild_summaries(chunk_size):
+    """Recount every trip summary from scratch"""
+    from db.maintenance import rebuild_trip_summaries
+
+    with console.status("[yellow]Rebuilding trip summaries...[/yellow]") as status:
+        counted = rebuild_trip_summaries(chunk_size, report=status.update)
+    console.print(f"[green]✓ Counted {counted:,} trips[/green]")
+
+def show_stats(top=10, chunk_size=250_000):
+    """Activity and trip statistics across the whole database"""
+    from stats import itinerary_stats
+
+    with console.status("[yellow]Counting activities...[/yellow]") as status:
+        stats = itinerary_stats(top, chunk_size, report=status.update)
+
+    total = stats["activities"]
+    if not total:
+        console.print("[bold red]No activities found.[/bold red]")
+        return
+    console.print(f"[bold]{total:,} activities[/bold], {stats['all_day']:,} of them all-day, "
+                  f"{stats['distinct_names']:,} distinct names")
+    hours = Table(title="Activities per hour", show_header=True, header_style="bold magenta")
+    hours.add_column("Hour", style="cyan", justify="right")
+    hours.add_column("Activities", justify="right")
+    hours.add_column("")
+    busiest_hour = max(stats["hours"]) or 1
+    for hour, count in enumerate(stats["hours"]):
+        if count:
+            hours.add_row(f"{hour:02d}:00", f"{count:,}", "█" * round(30 * count / busiest_hour))
+    console.print(hours)
+
+    for title, column, rows in (("Busiest dates", "Date", stats["busiest_dates"]),
+                                ("Most common activities", "Activity", stats["top_names"])):
+        table = Table(title=title, show_header=True, header_style="bold magenta")
+        table.add_column(column, style="green")
+        table.add_column("Activities", justify="right")
+        table.add_column("Share", justify="right")
+        for value, count in rows:
+            table.add_row(escape(str(value)), f"{count:,}", f"{count / total:.1%}")
+        console.print(table)
+
+    lengths = stats["trip_lengths"]
+    if lengths["trips"]:
+        console.print(f"[bold]Trip length[/bold] over {lengths['trips']:,} trips: mean {lengths['mean']:.1f} days, "
+                      f"median {lengths['median']}, 90th percentile {lengths['p90']}, longest {lengths['longest']}")
 
 def main_menu():
     """Main menu with rich interface"""
@@ -321,6 +458,8 @@ def main_menu():
         "5": ("Trip Details", trip_details),
         "6": ("Add Activity", add_activity),
         "7": ("Add Booking", add_booking),
+        "8": ("Search Trips", search_trips),
+        "9": ("Add Recurring Activity", add_recurring_activity),
         "0": ("Exit", None)
     }
     
@@ -346,17 +485,545 @@ def main_menu():
                 "Safe travels! ✈️",
                 border_style="green"
             ))
-            session.close()
             break
-            
-        menu_options[choice][1]()
+
+        with _instrumented(menu_options[choice][0]):
+            menu_options[choice][1]()
+
+def _time_arg(value):
+    time = validate_time(value)
+    if time is None:
+        raise argparse.ArgumentTypeError(f"invalid time '{value}', use HH:MM")
+    return time
+
+def _minutes_arg(value):
+    minutes = validate_duration(value)
+    if minutes is None:
+        raise argparse.ArgumentTypeError(f"invalid number of minutes '{value}'")
+    return minutes
+
+def _positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"invalid number '{value}', use a whole number of at least 1")
+    return number
+
+def _date_arg(value):
+    date = validate_date(value)
+    if date is None:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', use YYYY-MM-DD")
+    return date
+
+# Commands that only read, so they can run --with-archive
+ARCHIVE_READERS = {"list-trips", "dump", "export", "conflicts", "free-slots", "search", "stats"}
+
+def build_parser():
+    """Command line interface; running without a command opens the menu"""
+    parser = argparse.ArgumentParser(description="Travel Itinerary Planner")
+    parser.add_argument("--profile", action="store_true",
+                        help="report queries and SQL time per command (and menu action) on exit")
+    parser.add_argument("--profile-dump", metavar="PATH",
+                        help="also write cProfile stats to PATH (implies --profile)")
+    parser.add_argument("--slow-ms", type=float, default=100,
+                        help="with --profile, log statements slower than this")
+    parser.add_argument("--with-archive", action="store_true",
+                        help="read archived trips too, through UNION views (read-only)")
+    commands = parser.add_subparsers(dest="command")
+
+    list_parser = commands.add_parser("list-trips", help="Stream trips page by page")
+    list_parser.add_argument("--page-size", type=_positive_int, default=PAGE_SIZE)
+    list_parser.add_argument("--destination", help="Only destinations starting with this text")
+    list_parser.add_argument("--from", dest="window_start", type=_date_arg,
+                             help="Only trips still running on or after this date")
+    list_parser.add_argument("--to", dest="window_end", type=_date_arg,
+                             help="Only trips starting on or before this date")
+    list_parser.add_argument("--containing", action="store_true",
+                             help="Only trips covering the whole --from/--to window")
+    list_parser.add_argument("--upcoming", type=int, metavar="DAYS",
+                             help="Only trips starting within the next DAYS days")
+
+    import_parser = commands.add_parser("import", help="Bulk import trips, activities and bookings from CSV/JSONL")
+    import_parser.add_argument("--trips", help="trips file (.csv or .jsonl)")
+    import_parser.add_argument("--activities", help="activities file (.csv or .jsonl)")
+    import_parser.add_argument("--bookings", help="bookings file (.csv or .jsonl)")
+    import_parser.add_argument("--rejects", default="rejects.jsonl", help="where rejected rows are written")
+    import_parser.add_argument("--chunk-size", type=_positive_int, default=10_000, help="rows per transaction")
+    import_parser.add_argument("--bulk", action="store_true",
+                               help="skip the summary and search triggers, counting and indexing each chunk at once")
+
+    purge_parser = commands.add_parser("purge", help="Delete trips that ended before a date, in small batches")
+    purge_parser.add_argument("--ended-before", required=True, type=_date_arg)
+    purge_parser.add_argument("--chunk-size", type=_positive_int, default=1000, help="trips deleted per transaction")
+    purge_parser.add_argument("--yes", action="store_true", help="don't ask for confirmation")
+
+    archive_parser = commands.add_parser("archive", help="Move finished trips into the archive file, in small batches")
+    archive_parser.add_argument("--ended-before", type=_date_arg, default=date.today(),
+                                help="archive trips that ended before this date (default: today)")
+    archive_parser.add_argument("--chunk-size", type=_positive_int, default=1000, help="trips moved per transaction")
+    archive_parser.add_argument("--vacuum", action="store_true",
+                                help="then VACUUM the database to give the freed pages back (locks it meanwhile)")
+    archive_parser.add_argument("--yes", action="store_true", help="don't ask for confirmation")
+
+    dump_parser = commands.add_parser("dump", help="Stream trips with their bookings and activities as JSON Lines")
+    dump_parser.add_argument("--out", default="-", help="output file, '-' for stdout")
+    dump_parser.add_argument("--from-id", type=int, help="first trip id to include")
+    dump_parser.add_argument("--to-id", type=int, help="last trip id to include")
+    dump_parser.add_argument("--batch-size", type=_positive_int, default=500, help="trips loaded per batch")
+
+    export_parser = commands.add_parser("export", help="Write .ics calendars and Markdown itineraries for trips")
+    export_parser.add_argument("--out", default="itineraries", help="directory for trip-<id>.ics/.md files")
+    export_parser.add_argument("--format", dest="formats", default="ics,md",
+                               type=lambda value: [part.strip() for part in value.split(",") if part.strip()],
+                               help="comma-separated: ics, md")
+    export_parser.add_argument("--from-id", type=int, help="first trip id to include")
+    export_parser.add_argument("--to-id", type=int, help="last trip id to include")
+    export_parser.add_argument("--from", dest="window_start", type=_date_arg,
+                               help="Only trips still running on or after this date")
+    export_parser.add_argument("--to", dest="window_end", type=_date_arg,
+                               help="Only trips starting on or before this date")
+    export_parser.add_argument("--workers", type=_positive_int, help="rendering processes (default: one per CPU)")
+    export_parser.add_argument("--batch-size", type=_positive_int, default=500, help="trips per worker task")
+
+    recurring_parser = commands.add_parser(
+        "add-recurring", help="Add a repeating activity to every matching trip in one transaction")
+    recurring_parser.add_argument("--name", required=True, help="activity name")
+    recurring_parser.add_argument("--time", default="", help="HH:MM, all day if left out")
+    recurring_parser.add_argument("--duration", type=_minutes_arg, help="minutes from --time")
+    repeat = recurring_parser.add_mutually_exclusive_group()
+    repeat.add_argument("--every", type=int, default=1, metavar="DAYS", help="repeat every N days (default: daily)")
+    repeat.add_argument("--on", dest="weekdays", metavar="DAYS",
+                        help="repeat weekly on these days, e.g. mon,wed,fri, weekdays or weekends")
+    recurring_parser.add_argument("--starts", type=_date_arg, help="first date to add it on (default: trip start)")
+    recurring_parser.add_argument("--until", type=_date_arg, help="last date to add it on (default: trip end)")
+    recurring_parser.add_argument("--trip-id", dest="trip_ids", type=int, action="append",
+                                  help="a trip to add it to; repeat for more")
+    recurring_parser.add_argument("--destination", help="trips whose destination starts with this text")
+    recurring_parser.add_argument("--from", dest="window_start", type=_date_arg,
+                                  help="trips active on or after this date (YYYY-MM-DD)")
+    recurring_parser.add_argument("--to", dest="window_end", type=_date_arg,
+                                  help="trips active on or before this date (YYYY-MM-DD)")
+
+    conflicts_parser = commands.add_parser(
+        "conflicts", help="Find overlapping activities in one trip, or stream them for many as JSON Lines")
+    free_parser = commands.add_parser(
+        "free-slots", help="Find free time of a given length in one trip, or stream it for many as JSON Lines")
+    free_parser.add_argument("--minutes", required=True, type=_minutes_arg, help="shortest slot wanted")
+    free_parser.add_argument("--count", type=_positive_int, default=5, help="slots to find per trip")
+    free_parser.add_argument("--day-start", type=_time_arg, default="08:00", help="earliest time of day (HH:MM)")
+    free_parser.add_argument("--day-end", type=_time_arg, default="22:00", help="latest time of day (HH:MM)")
+    for schedule_parser in (conflicts_parser, free_parser):
+        schedule_parser.add_argument("--trip-id", type=int, help="show one trip as a table")
+        schedule_parser.add_argument("--from-id", type=int, help="first trip id to check")
+        schedule_parser.add_argument("--to-id", type=int, help="last trip id to check")
+        schedule_parser.add_argument("--out", default="-", help="JSON Lines output file, '-' for stdout")
+        schedule_parser.add_argument("--default-minutes", type=_minutes_arg, default=60,
+                                     help="length of activities without a duration")
+        schedule_parser.add_argument("--batch-size", type=_positive_int, default=1000, help="trips loaded per batch")
+
+    search_parser = commands.add_parser("search", help="Full-text search over destinations, activities and bookings")
+    search_parser.add_argument("text")
+    search_parser.add_argument("--limit", type=_positive_int, default=20, help="most trips to show")
+
+    rebuild_parser = commands.add_parser("rebuild-search", help="Rebuild the full-text search index in chunks")
+    rebuild_parser.add_argument("--chunk-size", type=_positive_int, default=50_000, help="source rows indexed per transaction")
+
+    verify_parser = commands.add_parser("verify-summaries",
+                                        help="Check the per-trip activity/booking counts against a recount")
+    verify_parser.add_argument("--repair", action="store_true", help="recount trips whose summary is wrong")
+    verify_parser.add_argument("--chunk-size", type=_positive_int, default=10_000, help="trips checked per query")
+
+    summaries_parser = commands.add_parser("rebuild-summaries", help="Recount every per-trip summary in chunks")
+    summaries_parser.add_argument("--chunk-size", type=_positive_int, default=10_000, help="trips recounted per transaction")
+
+    stats_parser = commands.add_parser("stats", help="Activity and trip statistics across all trips")
+    stats_parser.add_argument("--top", type=_positive_int, default=10, help="busiest dates and activity names to show")
+    stats_parser.add_argument("--chunk-size", type=_positive_int, default=250_000, help="activity ids counted per query")
+
+    serve_parser = commands.add_parser("serve", help="Run the local JSON API (see server.py)")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+
+    backup_parser = commands.add_parser(
+        "backup", help="Write a compressed, checksummed snapshot while the database stays in use")
+    backup_parser.add_argument("--out", help="snapshot file (default: backups/travel_itinerary-<time>.db.gz)")
+    backup_parser.add_argument("--pages", type=_positive_int, default=1024, help="pages copied per step")
+    backup_parser.add_argument("--pause-ms", type=float, default=0, help="pause between steps, for writers")
+    backup_parser.add_argument("--level", type=int, default=1, choices=range(10), metavar="0-9",
+                               help="gzip level, 0 for an uncompressed database file")
+
+    restore_parser = commands.add_parser("restore", help="Replace the database with a verified snapshot")
+    restore_parser.add_argument("snapshot")
+    restore_parser.add_argument("--pages", type=_positive_int, default=1024, help="pages restored per step")
+    restore_parser.add_argument("--yes", action="store_true", help="don't ask for confirmation")
+
+    verify_backup_parser = commands.add_parser(
+        "verify-backup", help="Check a snapshot's checksum and integrity without restoring it")
+    verify_backup_parser.add_argument("snapshot")
+
+    commands.add_parser("pragmas", help="Show the database URL, profile and SQLite settings in effect")
+    return parser
+
+def purge_trips(ended_before, chunk_size, assume_yes=False):
+    """Bulk delete finished trips with their activities and bookings"""
+    from db.maintenance import purge_trips as purge
+
+    if not assume_yes and not Confirm.ask(
+        f"[bold red]Delete every trip that ended before {ended_before}?[/bold red]", default=False
+    ):
+        console.print("[yellow]Purge cancelled[/yellow]")
+        return
+    with console.status("[red]Purging trips...[/red]") as status:
+        deleted = purge(ended_before, chunk_size, report=status.update)
+    console.print(f"[green]✓ Purged {deleted:,} trips[/green]")
+
+def archive_trips(ended_before, chunk_size, vacuum=False, assume_yes=False):
+    """Move finished trips with their activities and bookings to the archive file"""
+    from db.archive import archive_trips as archive, archive_path, working_set, ArchiveError
+
+    path = archive_path()
+    if not assume_yes and not Confirm.ask(
+        f"[bold yellow]Move every trip that ended before {ended_before} to {path}?[/bold yellow]", default=False
+    ):
+        console.print("[yellow]Archiving cancelled[/yellow]")
+        return
+    try:
+        with console.status("[yellow]Archiving trips...[/yellow]") as status:
+            moved = archive(ended_before, chunk_size, report=status.update)
+    except ArchiveError as error:
+        console.print(f"[red]✗ {error}[/red]")
+        return
+    console.print(f"[green]✓ Archived {moved:,} trips to {path}[/green]")
+    if vacuum:
+        with console.status("[yellow]Vacuuming...[/yellow]"):
+            with engine.connect() as connection:
+                connection.exec_driver_sql("VACUUM")
+    pages, free, page_size = working_set()
+    console.print(f"  Hot database: {pages * page_size / 1e6:,.1f} MB in use, {free * page_size / 1e6:,.1f} MB free"
+                  + ("" if vacuum or not free else " (--vacuum gives it back)"))
+
+def dump(path, start_id=None, end_id=None, batch_size=500):
+    """Write trips as JSON Lines to a file or stdout"""
+    import sys
+    from debug import dump_trips
+
+    if path == "-":
+        dump_trips(sys.stdout, start_id, end_id, batch_size)
+        return
+    with open(path, "w", encoding="utf-8") as out:
+        count = dump_trips(out, start_id, end_id, batch_size)
+    console.print(f"[green]✓ Wrote {count:,} trips to {path}[/green]")
+
+def export(out_dir, formats, first_id=None, last_id=None, window_start=None, window_end=None,
+           workers=None, batch_size=500):
+    """Write .ics calendars and Markdown itineraries for a set of trips"""
+    from export import export_itineraries
+
+    with console.status("[yellow]Exporting itineraries...[/yellow]") as status:
+        trips, written = export_itineraries(out_dir, formats, first_id, last_id, window_start, window_end,
+                                            workers, batch_size, report=status.update)
+    console.print(f"[green]✓ Exported {trips:,} trips ({written / 1e6:,.1f} MB) to {out_dir}[/green]")
+
+def add_recurring(name, time, every, weekdays, starts, until, trip_ids=None, destination=None,
+                  window_start=None, window_end=None, duration=None):
+    """Expand one recurrence over a filtered set of trips"""
+    try:
+        rule = recurrence(every, weekdays, starts, until)
+        with console.status("[yellow]Adding activities...[/yellow]"):
+            added = service.apply_recurring_activity(name, rule, time, duration, trip_ids, destination,
+                                                     window_start, window_end)
+    except ServiceError as error:
+        console.print(f"[red]✗ {error}[/red]")
+        return
+    console.print(f"[green]✓ Added {added:,} '{escape(name.strip())}' activities[/green]")
+
+def _schedule_report(path, write):
+    """
+    Run write(out, report) into `path` under a progress line, or straight
+    to stdout (no progress, so the JSON Lines stay clean). Returns its counts,
+    or None for stdout.
+    """
+    import sys
+
+    if path == "-":
+        write(sys.stdout, None)
+        return None
+    with open(path, "w", encoding="utf-8") as out, console.status("[yellow]Checking schedules...[/yellow]") as status:
+        return write(out, status.update)
+
+def show_conflicts(trip_id=None, first_id=None, last_id=None, path="-", default_minutes=60, batch_size=1000):
+    """One trip's clashes as a table, or every trip's as JSON Lines"""
+    if trip_id is None:
+        from schedule import write_conflicts
+
+        counts = _schedule_report(path, lambda out, report: write_conflicts(
+            out, first_id, last_id, default_minutes, batch_size, report=report))
+        if counts is not None:
+            console.print(f"[green]✓ Checked {counts[0]:,} trips, found {counts[1]:,} conflicts[/green]")
+        return
+    try:
+        conflicts = service.trip_conflicts(trip_id, default_minutes)
+    except ServiceError as error:
+        console.print(f"[red]✗ {error}[/red]")
+        return
+    if not conflicts:
+        console.print(f"[green]✓ Nothing overlaps in trip ID {trip_id}[/green]")
+        return
+    table = Table(title=f"Overlapping activities in trip {trip_id}", show_header=True, header_style="bold magenta")
+    table.add_column("When", style="cyan")
+    table.add_column("Activities")
+    for conflict in conflicts:
+        table.add_row(
+            f"{conflict.start:%Y-%m-%d %H:%M} to {conflict.end:%H:%M}",
+            "\n".join(f"{activity.time:%H:%M} {escape(activity.name)} ({activity.duration or default_minutes} min)"
+                      for activity in conflict.activities),
+        )
+    console.print(table)
+
+def show_free_slots(minutes, count=5, day_start=None, day_end=None, trip_id=None, first_id=None, last_id=None,
+                    path="-", default_minutes=60, batch_size=1000):
+    """One trip's free time as a table, or every trip's as JSON Lines"""
+    if day_end <= day_start:
+        console.print("[red]✗ The day must end after it starts[/red]")
+        return
+    if trip_id is None:
+        from schedule import write_free_slots
+
+        counts = _schedule_report(path, lambda out, report: write_free_slots(
+            out, minutes, count, day_start, day_end, first_id, last_id, default_minutes, batch_size, report=report))
+        if counts is not None:
+            console.print(f"[green]✓ Checked {counts[0]:,} trips, {counts[1]:,} have free slots[/green]")
+        return
+    try:
+        slots = service.free_slots(trip_id, minutes, count, day_start, day_end, default_minutes)
+    except ServiceError as error:
+        console.print(f"[red]✗ {error}[/red]")
+        return
+    if not slots:
+        console.print(f"[yellow]No free {minutes}-minute slot in trip ID {trip_id}[/yellow]")
+        return
+    table = Table(title=f"Free time in trip {trip_id}", show_header=True, header_style="bold magenta")
+    table.add_column("Date", style="cyan")
+    table.add_column("From")
+    table.add_column("To")
+    table.add_column("Minutes", justify="right")
+    for slot in slots:
+        table.add_row(f"{slot.start:%Y-%m-%d}", f"{slot.start:%H:%M}", f"{slot.end:%H:%M}",
+                      str(int((slot.end - slot.start).total_seconds() // 60)))
+    console.print(table)
+
+def backup_database(path=None, pages=1024, pause_ms=0, level=1):
+    """Snapshot the live database with the online backup API"""
+    from datetime import datetime
+    from db.backup import backup, BackupError
+
+    if path is None:
+        path = f"backups/travel_itinerary-{datetime.now():%Y%m%d-%H%M%S}.db" + (".gz" if level else "")
+    try:
+        with console.status("[yellow]Backing up...[/yellow]") as status:
+            snapshot = backup(path, pages, pause_ms / 1000, level, report=status.update)
+    except BackupError as error:
+        console.print(f"[red]✗ {error}[/red]")
+        return
+    console.print(
+        f"[green]✓ Backed up {snapshot.database_bytes / 1e6:,.1f} MB to {snapshot.path} "
+        f"({snapshot.snapshot_bytes / 1e6:,.1f} MB)[/green]\n"
+        f"  copy {snapshot.copy_seconds:.1f}s ({snapshot.database_bytes / 1e6 / max(snapshot.copy_seconds, 1e-9):,.0f} MB/s), "
+        f"compress {snapshot.compress_seconds:.1f}s, {snapshot.restarts} restarts, sha256 {snapshot.sha256[:16]}..."
+    )
+
+def verify_backup(path):
+    from db.backup import verify_snapshot, BackupError
+
+    try:
+        with console.status("[yellow]Verifying...[/yellow]") as status:
+            verify_snapshot(path, report=status.update)
+    except (BackupError, OSError) as error:
+        console.print(f"[red]✗ {error}[/red]")
+        return
+    console.print(f"[green]✓ {path} matches its checksum and passes quick_check[/green]")
+
+def restore_database(path, pages=1024, assume_yes=False):
+    """Verify a snapshot, then copy it over the live database"""
+    from db.backup import restore, BackupError
+
+    if not assume_yes and not Confirm.ask(
+        f"[bold red]Replace everything in {engine.url.database} with {path}?[/bold red]", default=False
+    ):
+        console.print("[yellow]Restore cancelled[/yellow]")
+        return
+    try:
+        with console.status("[yellow]Restoring...[/yellow]") as status:
+            restored = restore(path, pages, report=status.update)
+    except (BackupError, OSError) as error:
+        console.print(f"[red]✗ {error}[/red]")
+        return
+    console.print(f"[green]✓ Restored {restored:,} pages from {path}[/green]")
+
+def show_pragmas():
+    """Compare the configured profile with what SQLite reports"""
+    from db.config import PROFILES, PRAGMA_NAMES, load_settings, effective_pragmas
+
+    profile = load_settings()["profile"]
+    console.print(f"[bold]Database:[/bold] {engine.url}")
+    console.print(f"[bold]Profile:[/bold] {profile}")
+    if engine.dialect.name != "sqlite":
+        return
+
+    effective = effective_pragmas(engine)
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("PRAGMA", style="cyan")
+    table.add_column("Profile")
+    table.add_column("In effect", style="green")
+    for name in PRAGMA_NAMES:
+        table.add_row(name, str(PROFILES[profile].get(name, "(sqlite default)")), str(effective[name]))
+    console.print(table)
+
+def run_command(args):
+    # Commands may read tables added after the database was created
+    ensure_schema(engine)
+    if args.command == "list-trips":
+        match = "containing" if args.containing else "overlapping"
+        window_start, window_end = args.window_start, args.window_end
+        if args.upcoming is not None:
+            match = "starting"
+            window_start = date.today()
+            window_end = window_start + timedelta(days=args.upcoming)
+        list_trips(args.page_size, args.destination, window_start, window_end, interactive=False, match=match)
+    elif args.command == "import":
+        from importer import import_files
+        import_files(args.trips, args.activities, args.bookings, args.rejects, args.chunk_size,
+                     report=console.print, bulk=args.bulk)
+    elif args.command == "purge":
+        purge_trips(args.ended_before, args.chunk_size, args.yes)
+    elif args.command == "archive":
+        archive_trips(args.ended_before, args.chunk_size, args.vacuum, args.yes)
+    elif args.command == "dump":
+        dump(args.out, args.from_id, args.to_id, args.batch_size)
+    elif args.command == "export":
+        export(args.out, args.formats, args.from_id, args.to_id, args.window_start, args.window_end,
+               args.workers, args.batch_size)
+    elif args.command == "add-recurring":
+        add_recurring(args.name, args.time, args.every, args.weekdays, args.starts, args.until,
+                      args.trip_ids, args.destination, args.window_start, args.window_end, args.duration)
+    elif args.command == "conflicts":
+        show_conflicts(args.trip_id, args.from_id, args.to_id, args.out, args.default_minutes, args.batch_size)
+    elif args.command == "free-slots":
+        show_free_slots(args.minutes, args.count, args.day_start, args.day_end, args.trip_id, args.from_id,
+                        args.to_id, args.out, args.default_minutes, args.batch_size)
+    elif args.command == "search":
+        search_trips(args.text, args.limit)
+    elif args.command == "rebuild-search":
+        rebuild_search(args.chunk_size)
+    elif args.command == "verify-summaries":
+        verify_summaries(args.chunk_size, args.repair)
+    elif args.command == "rebuild-summaries":
+        rebuild_summaries(args.chunk_size)
+    elif args.command == "stats":
+        show_stats(args.top, args.chunk_size)
+    elif args.command == "serve":
+        import asyncio
+        from server import serve
+        asyncio.run(serve(args.host, args.port, log=console.print))
+    elif args.command == "backup":
+        backup_database(args.out, args.pages, args.pause_ms, args.level)
+    elif args.command == "restore":
+        restore_database(args.snapshot, args.pages, args.yes)
+    elif args.command == "verify-backup":
+        verify_backup(args.snapshot)
+    elif args.command == "pragmas":
+        show_pragmas()
+
+def show_profile(instrumentation, out=None, top=5):
+    """Per-command query counts and timings, the costliest statements, then suspected N+1s"""
+    out = out or Console(stderr=True)
+    table = Table(title="Queries per command", show_header=True, header_style="bold magenta")
+    table.add_column("Command", style="cyan")
+    for column in ("Runs", "Queries", "Per run", "SQL ms", "Wall ms", "Slow"):
+        table.add_column(column, justify="right")
+    commands = sorted(instrumentation.commands.values(), key=lambda stats: stats.sql_seconds, reverse=True)
+    for stats in commands:
+        table.add_row(
+            stats.name, f"{stats.runs:,}", f"{stats.queries:,}",
+            f"{stats.queries / stats.runs:,.1f}" if stats.runs else "-",
+            f"{stats.sql_seconds * 1000:,.1f}",
+            f"{stats.wall_seconds * 1000:,.1f}" if stats.runs else "-",
+            f"{stats.slow:,}",
+        )
+    out.print(table)
+
+    statements = Table(title="Most time per statement", show_header=True, header_style="bold magenta")
+    statements.add_column("Command", style="cyan")
+    statements.add_column("Runs", justify="right")
+    statements.add_column("Total ms", justify="right")
+    statements.add_column("Slowest ms", justify="right")
+    statements.add_column("Statement")
+    ranked = sorted(
+        ((stats.name, statement, timing) for stats in commands for statement, timing in stats.statements.items()),
+        key=lambda found: found[2].seconds, reverse=True,
+    )
+    for command, statement, timing in ranked[:top]:
+        statements.add_row(command, f"{timing.count:,}", f"{timing.seconds * 1000:,.1f}",
+                           f"{timing.slowest * 1000:,.1f}", escape(" ".join(statement.split())[:160]))
+    out.print(statements)
+
+    for command, statement, count in instrumentation.suspected_n_plus_one():
+        out.print(f"[yellow]⚠ Possible N+1 in {command}: ran {count:,} times on one connection:[/yellow] "
+                  f"{escape(' '.join(statement.split())[:200])}")
+
+def run_profiled(args, run):
+    """Run `run` with instrumentation installed, cProfile too when asked; report on the way out"""
+    global instrumentation
+    from instrumentation import Instrumentation
+
+    errors = Console(stderr=True)
+    instrumentation = Instrumentation(
+        engine, args.slow_ms, log=lambda message: errors.print(f"[dim yellow]{escape(message)}[/dim yellow]")
+    ).install()
+    profiler = None
+    if args.profile_dump:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with _instrumented(args.command or "menu"):
+            run()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_dump)
+        instrumentation.remove()
+        show_profile(instrumentation, errors)
+        if profiler is not None:
+            errors.print(f"cProfile stats written to {args.profile_dump} "
+                         f"(python -m pstats {args.profile_dump})")
 
 if __name__ == '__main__':
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command == "list-trips":
+        if args.upcoming is not None and (args.window_start or args.window_end or args.containing):
+            parser.error("--upcoming cannot be combined with --from, --to or --containing")
+        if args.containing and not (args.window_start or args.window_end):
+            parser.error("--containing needs --from and/or --to")
+    if args.with_archive:
+        if args.command not in ARCHIVE_READERS:
+            parser.error(f"--with-archive is read-only; it works with {', '.join(sorted(ARCHIVE_READERS))}")
+        from db.archive import include_archive, ArchiveError
+        ensure_schema(engine)
+        try:
+            include_archive(engine)
+        except ArchiveError as error:
+            parser.error(str(error))
+    run = (lambda: run_command(args)) if args.command else main_menu
     try:
-        main_menu()
+        if args.profile or args.profile_dump:
+            run_profiled(args, run)
+        else:
+            run()
     except KeyboardInterrupt:
         console.print("\n[red]Program interrupted. Exiting gracefully...[/red]")
-        session.close()
     except Exception as e:
         console.print(f"[red]An error occurred: {str(e)}[/red]")
-        session.close()
\ No newline at end of file
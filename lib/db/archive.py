@@ -0,0 +1,196 @@
+# archive.py
+"""
+Hot/archive split: finished trips move to a second SQLite file.
+
+Almost everything the CLI does touches current and upcoming trips, yet
+every lookup walks indexes that also cover years of finished ones.
+archive_trips() moves trips that ended before a date, with their bookings,
+activities, summaries and date-index boxes, into the archive file
+(travel_itinerary.archive.db next to the database unless configured, see
+config.py), `chunk_size` trips per transaction:
+
+    archive connection (main) + ATTACH DATABASE travel_itinerary.db AS hot
+    BEGIN IMMEDIATE
+        copy the chunk into main, replacing an earlier partial copy
+        DELETE FROM hot.trips (children go by ON DELETE CASCADE)
+    COMMIT
+
+A transaction over two files is atomic in rollback-journal mode. In WAL
+mode each file commits on its own, main first, so a crash can leave a
+chunk in both files but never in neither, and the next run copies it
+again. Trips keep their ids, and trips.id is AUTOINCREMENT, so SQLite
+never hands out an archived trip's id again, even once every trip above
+it is gone; each run also raises the hot file's sqlite_sequence to the
+archive's highest id. Bookings and activities get new ids in the archive.
+
+Normal views never see the archive. include_archive(engine) is the opt-in:
+every new connection ATTACHes the archive and gets TEMP views named like
+the tables, `trips` = main.trips UNION ALL archive.trips and so on, which
+SQLite resolves before the real tables. Those connections are read-only,
+and full-text search still covers hot trips only.
+"""
+import os
+import time as clock
+from functools import partial
+from sqlalchemy import event
+try:
+    from .config import create_db_engine, load_settings
+    from .date_index import DDL as DATE_INDEX_DDL
+    from .models import Base, Trip, Booking, Activity, TripSummary, engine, _add_missing_columns
+    from .backup import database_path
+    from . import read_models
+except ImportError:  # run from lib/db
+    from config import create_db_engine, load_settings
+    from date_index import DDL as DATE_INDEX_DDL
+    from models import Base, Trip, Booking, Activity, TripSummary, engine, _add_missing_columns
+    from backup import database_path
+    import read_models
+
+ARCHIVE_CHUNK_SIZE = 1000
+
+TABLES = [Trip.__table__, Booking.__table__, Activity.__table__, TripSummary.__table__]
+
+class ArchiveError(RuntimeError):
+    """The archive is missing, or cannot take a chunk without losing data"""
+
+def archive_path(bind=None):
+    """The configured archive file, or <database>.archive.db beside the database"""
+    configured = load_settings()['archive']
+    if configured:
+        return os.path.abspath(configured)
+    stem, extension = os.path.splitext(database_path(bind))
+    return f"{stem}.archive{extension or '.db'}"
+
+def _columns(table, with_id=True):
+    return ", ".join(column.name for column in table.c if with_id or column.name != 'id')
+
+# The chunk's trips, by id range; the rows cannot change while
+# BEGIN IMMEDIATE holds both files' write locks
+CHUNK = "SELECT id FROM hot.trips WHERE id BETWEEN :first AND :last AND end_date < :before"
+
+COPY = [
+    # Whatever an interrupted run left of these trips goes first; its
+    # bookings, activities and summaries follow by ON DELETE CASCADE
+    f"DELETE FROM main.trips WHERE id IN ({CHUNK})",
+    f"DELETE FROM main.trip_date_index WHERE id IN ({CHUNK})",
+    f"INSERT INTO main.trips ({_columns(Trip.__table__)}) "
+    f"SELECT {_columns(Trip.__table__)} FROM hot.trips WHERE id IN ({CHUNK})",
+    f"INSERT INTO main.bookings ({_columns(Booking.__table__, False)}) "
+    f"SELECT {_columns(Booking.__table__, False)} FROM hot.bookings WHERE trip_id IN ({CHUNK}) ORDER BY id",
+    f"INSERT INTO main.activities ({_columns(Activity.__table__, False)}) "
+    f"SELECT {_columns(Activity.__table__, False)} FROM hot.activities WHERE trip_id IN ({CHUNK}) ORDER BY id",
+    f"INSERT INTO main.trip_summaries ({_columns(TripSummary.__table__)}) "
+    f"SELECT {_columns(TripSummary.__table__)} FROM hot.trip_summaries WHERE trip_id IN ({CHUNK})",
+    f"INSERT INTO main.trip_date_index SELECT id, start_day, end_day FROM hot.trip_date_index WHERE id IN ({CHUNK})",
+    f"DELETE FROM hot.trips WHERE id IN ({CHUNK})",
+]
+
+# An archived trip whose id now belongs to a different hot trip
+REUSED_ID = (
+    "SELECT hot_trip.id FROM hot.trips AS hot_trip JOIN main.trips AS archived ON archived.id = hot_trip.id "
+    "WHERE hot_trip.id BETWEEN :first AND :last AND hot_trip.end_date < :before "
+    "AND (archived.destination IS NOT hot_trip.destination OR archived.start_date IS NOT hot_trip.start_date "
+    "OR archived.end_date IS NOT hot_trip.end_date) LIMIT 1"
+)
+
+# Keep the hot file's next trip id above every archived one; the row is
+# missing until trips gets its first row
+RAISE_SEQUENCE = [
+    "UPDATE hot.sqlite_sequence SET seq = max(seq, coalesce((SELECT max(id) FROM main.trips), 0)) "
+    "WHERE name = 'trips'",
+    "INSERT INTO hot.sqlite_sequence (name, seq) SELECT 'trips', max(id) FROM main.trips "
+    "HAVING max(id) IS NOT NULL AND NOT EXISTS (SELECT 1 FROM hot.sqlite_sequence WHERE name = 'trips')",
+]
+
+def create_archive(connection):
+    """The archive's tables and indexes; no triggers, archived rows only change by archive_trips()"""
+    Base.metadata.create_all(connection, tables=TABLES)
+    _add_missing_columns(connection)
+    connection.exec_driver_sql(DATE_INDEX_DDL[0])
+
+def archive_trips(ended_before, chunk_size=ARCHIVE_CHUNK_SIZE, bind=None, path=None, report=print):
+    """
+    Move every trip that ended before `ended_before` into the archive,
+    `chunk_size` trips per transaction
+    Returns the number of trips moved.
+    """
+    bind = bind if bind is not None else engine
+    hot_path = database_path(bind)
+    path = os.path.abspath(path) if path else archive_path(bind)
+    before = ended_before.isoformat()
+    archive = create_db_engine(f"sqlite:///{path}")
+    moved = 0
+    started = clock.perf_counter()
+    try:
+        with archive.begin() as connection:
+            create_archive(connection)
+        with archive.connect() as connection:
+            connection.exec_driver_sql("ATTACH DATABASE ? AS hot", (hot_path,))
+            ddl = connection.exec_driver_sql("SELECT sql FROM hot.sqlite_master WHERE name = 'trips'").scalar()
+            if ddl is None or 'AUTOINCREMENT' not in ddl.upper():
+                raise ArchiveError(f"trips in {hot_path} would reuse archived ids; "
+                                   "upgrade it first (alembic upgrade head, or run the CLI once)")
+            # For archives written before trips had AUTOINCREMENT
+            for statement in RAISE_SEQUENCE:
+                connection.exec_driver_sql(statement)
+            connection.commit()
+            last_id = 0
+            while True:
+                with connection.begin():
+                    # Both write locks up front, so no writer sneaks in between
+                    # the read of the chunk and the move
+                    connection.exec_driver_sql("BEGIN IMMEDIATE")
+                    ids = connection.exec_driver_sql(
+                        "SELECT id FROM hot.trips WHERE id > ? AND end_date < ? ORDER BY id LIMIT ?",
+                        (last_id, before, chunk_size),
+                    ).scalars().all()
+                    if not ids:
+                        break
+                    chunk = {'first': ids[0], 'last': ids[-1], 'before': before}
+                    reused = connection.exec_driver_sql(REUSED_ID, chunk).scalar()
+                    if reused is not None:
+                        raise ArchiveError(f"Trip {reused} has the id of a different, already archived trip; "
+                                           "it was left where it is")
+                    for statement in COPY:
+                        connection.exec_driver_sql(statement, chunk)
+                moved += len(ids)
+                last_id = ids[-1]
+                report(f"Archived {moved:,} trips ({moved / (clock.perf_counter() - started):,.0f} trips/sec)")
+            connection.exec_driver_sql("DETACH DATABASE hot")
+    finally:
+        archive.dispose()
+    return moved
+
+def working_set(bind=None):
+    """(pages in use, free pages, page size) of the hot database"""
+    bind = bind if bind is not None else engine
+    with bind.connect() as connection:
+        pages, free, page_size = (connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+                                  for name in ('page_count', 'freelist_count', 'page_size'))
+    return pages - free, free, page_size
+
+def _attach_archive(path, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("ATTACH DATABASE ? AS archive", (path,))
+    for table in TABLES:
+        columns = _columns(table)
+        cursor.execute(f"CREATE TEMP VIEW {table.name} AS SELECT {columns} FROM main.{table.name} "
+                       f"UNION ALL SELECT {columns} FROM archive.{table.name}")
+    cursor.execute("CREATE TEMP VIEW trip_date_index AS SELECT id, start_day, end_day FROM main.trip_date_index "
+                   "UNION ALL SELECT id, start_day, end_day FROM archive.trip_date_index")
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+def include_archive(bind=None, path=None):
+    """
+    Make every new connection of `bind` read hot and archived trips together
+    Pooled connections are dropped so none is left without the views.
+    """
+    bind = bind if bind is not None else engine
+    path = os.path.abspath(path) if path else archive_path(bind)
+    if not os.path.exists(path):
+        raise ArchiveError(f"No archive at {path}; `python cli.py archive` creates it")
+    event.listen(bind, 'connect', partial(_attach_archive, path))
+    bind.dispose()
+    read_models.correlated_summaries = True
+    return path
@@ -0,0 +1,253 @@
+# backup.py
+"""
+Online snapshots of the database, and restoring them.
+
+Copying travel_itinerary.db while another connection writes can tear the
+copy, and misses whatever still sits in the WAL. Snapshots use SQLite's
+online backup API instead, `pages` pages per step. The source is only
+read-locked during a step, so writers wait at most one step (in WAL mode
+they never wait). A write from another connection between steps makes
+SQLite start the copy over. After `max_restarts` of those, the rest is
+copied in one step, which in WAL mode still does not block writers.
+
+    backup(path)          copy -> PRAGMA quick_check -> gzip, plus path.sha256
+    verify_snapshot(path) checksum -> gunzip -> PRAGMA quick_check
+    restore(path)         verify_snapshot -> backup API into the live database
+
+The .sha256 file uses sha256sum's format, so `sha256sum -c` checks it too.
+Restoring holds the live database's write lock until it finishes.
+"""
+import os
+import hashlib
+import sqlite3
+import zlib
+import time as clock
+from collections import namedtuple
+try:
+    from .models import engine
+except ImportError:  # run from lib/db
+    from models import engine
+
+PAGES_PER_STEP = 1024
+MAX_RESTARTS = 3
+COMPRESS_LEVEL = 1
+CHUNK_SIZE = 1024 * 1024
+# zlib window bits for the gzip container, so `gunzip` reads snapshots too
+GZIP_WBITS = 31
+GZIP_MAGIC = b'\x1f\x8b'
+
+Snapshot = namedtuple('Snapshot', 'path pages page_size database_bytes snapshot_bytes sha256 '
+                                  'copy_seconds compress_seconds restarts')
+
+class BackupError(RuntimeError):
+    """A snapshot that cannot be trusted: bad checksum, corrupt or unreadable"""
+
+class _Restarted(Exception):
+    pass
+
+def database_path(bind=None):
+    bind = bind if bind is not None else engine
+    if bind.dialect.name != 'sqlite' or bind.url.database in (None, '', ':memory:'):
+        raise BackupError(f"Only SQLite database files can be backed up, not {bind.url}")
+    return os.path.abspath(bind.url.database)
+
+def _copy(source, target_path, pages, pause, max_restarts, report):
+    """Backup API copy of `source` into a new file; returns (pages, page_size, restarts)"""
+    restarts = 0
+    last_remaining = None
+    started = clock.perf_counter()
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _Restarted()
+        last_remaining = remaining
+        if report is not None:
+            done = total - remaining
+            report(f"Copied {done:,} of {total:,} pages "
+                   f"({done * page_size / 1e6 / (clock.perf_counter() - started):,.0f} MB/s)")
+        if pause:
+            clock.sleep(pause)
+
+    page_size = source.execute("PRAGMA page_size").fetchone()[0]
+    for step in (pages, -1):
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=step, progress=progress)
+            total = target.execute("PRAGMA page_count").fetchone()[0]
+            return total, page_size, restarts
+        except _Restarted:
+            # Writes keep landing between steps: take the rest in one go
+            if report is not None:
+                report(f"Restarted {restarts} times under writes, copying in one step")
+        finally:
+            target.close()
+
+def _quick_check(path):
+    # Read-write, so the WAL-mode copy's -wal/-shm files go away on close
+    connection = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in connection.execute("PRAGMA quick_check")]
+    except sqlite3.DatabaseError as error:
+        raise BackupError(f"{path} is not a readable database: {error}")
+    finally:
+        connection.close()
+    if problems != ['ok']:
+        raise BackupError(f"{path} failed PRAGMA quick_check: {'; '.join(problems[:5])}")
+
+def _write_checksum(path, digest):
+    with open(path + '.sha256.tmp', 'w', encoding='utf-8') as out:
+        out.write(f"{digest}  {os.path.basename(path)}\n")
+    os.replace(path + '.sha256.tmp', path + '.sha256')
+
+def _stream(source_path, target_path, transform, report, verb):
+    """Copy a file through transform(chunk) -> bytes; returns the sha256 of what was written"""
+    digest = hashlib.sha256()
+    total = os.path.getsize(source_path)
+    done = 0
+    started = clock.perf_counter()
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            for data in transform(chunk):
+                digest.update(data)
+                target.write(data)
+            done += len(chunk)
+            if report is not None:
+                report(f"{verb} {done / 1e6:,.0f} of {total / 1e6:,.0f} MB "
+                       f"({done / 1e6 / (clock.perf_counter() - started):,.0f} MB/s)")
+        for data in transform(None):
+            digest.update(data)
+            target.write(data)
+        target.flush()
+        os.fsync(target.fileno())
+    return digest.hexdigest()
+
+def _gzip(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+    def transform(chunk):
+        return [compressor.compress(chunk) if chunk is not None else compressor.flush()]
+    return transform
+
+def _plain(chunk):
+    return [chunk] if chunk is not None else []
+
+def backup(path, pages=PAGES_PER_STEP, pause=0.0, level=COMPRESS_LEVEL, max_restarts=MAX_RESTARTS,
+           bind=None, report=None):
+    """
+    Write a consistent snapshot of the live database to `path`
+    gzip-compressed at `level` (0 keeps a plain database file), with a
+    sha256 checksum in `path`.sha256. `pause` seconds are slept between steps
+    to let writers of a rollback-journal database in. Returns a Snapshot.
+    """
+    bind = bind if bind is not None else engine
+    database_path(bind)
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    copy_path = path + '.partial.db'
+
+    started = clock.perf_counter()
+    source = bind.raw_connection()
+    try:
+        page_count, page_size, restarts = _copy(source.driver_connection, copy_path, pages, pause,
+                                                max_restarts, report)
+    finally:
+        source.close()
+    copied = clock.perf_counter()
+    try:
+        _quick_check(copy_path)
+        checked = clock.perf_counter()
+        database_bytes = os.path.getsize(copy_path)
+        if level:
+            digest = _stream(copy_path, path + '.tmp', _gzip(level), report, "Compressed")
+            os.replace(path + '.tmp', path)
+        else:
+            digest = _stream(copy_path, path + '.tmp', _plain, None, "Wrote")
+            os.replace(path + '.tmp', path)
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+    _write_checksum(path, digest)
+    return Snapshot(path, page_count, page_size, database_bytes, os.path.getsize(path), digest,
+                    copied - started, clock.perf_counter() - checked, restarts)
+
+def _expected_checksum(path):
+    try:
+        with open(path + '.sha256', encoding='utf-8') as checksum:
+            return checksum.read().split()[0]
+    except (OSError, IndexError):
+        raise BackupError(f"No checksum found for {path} (expected {path}.sha256)")
+
+def _is_gzip(path):
+    with open(path, 'rb') as snapshot:
+        return snapshot.read(2) == GZIP_MAGIC
+
+def _gunzip():
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+
+    def transform(chunk):
+        if chunk is None:
+            if not decompressor.eof:
+                raise BackupError("The snapshot is truncated")
+            return [decompressor.flush()]
+        return [decompressor.decompress(chunk)]
+    return transform
+
+def _unpack(path, target_path, report=None):
+    """Check the checksum while unpacking the snapshot into a database file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as snapshot:
+        for chunk in iter(lambda: snapshot.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    if digest.hexdigest() != _expected_checksum(path):
+        raise BackupError(f"{path} does not match its checksum")
+    try:
+        _stream(path, target_path, _gunzip() if _is_gzip(path) else _plain, report, "Unpacked")
+    except zlib.error as error:
+        raise BackupError(f"{path} could not be decompressed: {error}")
+    _quick_check(target_path)
+
+def verify_snapshot(path, report=None):
+    """Raise BackupError unless the snapshot matches its checksum and passes quick_check"""
+    path = os.path.abspath(path)
+    unpacked = path + '.verify.db'
+    try:
+        _unpack(path, unpacked, report)
+    finally:
+        if os.path.exists(unpacked):
+            os.remove(unpacked)
+
+def restore(path, pages=PAGES_PER_STEP, bind=None, report=None):
+    """
+    Replace the live database's contents with a verified snapshot
+    Other connections keep working; their next transaction sees the
+    restored data. Returns the number of pages restored.
+    """
+    bind = bind if bind is not None else engine
+    live_path = database_path(bind)
+    path = os.path.abspath(path)
+    unpacked = live_path + '.restore.db'
+    try:
+        _unpack(path, unpacked, report)
+        source = sqlite3.connect(unpacked)
+        target = bind.raw_connection()
+        started = clock.perf_counter()
+
+        def progress(status, remaining, total):
+            if report is not None:
+                done = total - remaining
+                report(f"Restored {done:,} of {total:,} pages "
+                       f"({done / max(clock.perf_counter() - started, 1e-9):,.0f} pages/s)")
+        try:
+            source.backup(target.driver_connection, pages=pages, progress=progress)
+            return target.driver_connection.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+    finally:
+        if os.path.exists(unpacked):
+            os.remove(unpacked)
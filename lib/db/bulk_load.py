@@ -0,0 +1,63 @@
+# bulk_load.py
+"""
+Bulk inserts that skip the per-row summary and search triggers.
+
+The insert triggers from trip_summary.py and search_index.py run an UPDATE
+of trip_summaries and an FTS insert for every row, most of what a bulk
+insert costs. bulk_insert() drops them for one table inside the caller's
+write transaction, lets it insert, applies the triggers' effect to the new
+id range with one statement per index, then creates the triggers again:
+
+    BEGIN IMMEDIATE
+        DROP TRIGGER activities_summary_insert, activities_search_insert
+        INSERT INTO activities ...
+        UPDATE trip_summaries ... FROM (new activities GROUP BY trip_id)
+        INSERT INTO trip_search SELECT ... new activities
+        CREATE TRIGGER ...
+    COMMIT
+
+The schema change commits together with the rows, so other connections
+never see the table without its triggers, and a rollback restores them.
+"""
+from contextlib import contextmanager
+try:
+    from .search_index import fill_search_index, trigger_statements
+    from .trip_summary import DDL, add_to_trip_summaries
+except ImportError:  # run as a script from lib/db
+    from search_index import fill_search_index, trigger_statements
+    from trip_summary import DDL, add_to_trip_summaries
+
+def _insert_triggers(connection, table):
+    """(name, CREATE TRIGGER statement) of the summary and search insert triggers on `table` that exist"""
+    existing = set(connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,)
+    ).scalars())
+    triggers = []
+    for name in (f"{table}_summary_insert", f"{table}_search_insert"):
+        if name in existing:
+            statement = next(s for s in [*DDL, *trigger_statements()] if f" {name} " in s)
+            triggers.append((name, statement))
+    return triggers
+
+@contextmanager
+def bulk_insert(connection, table):
+    """
+    Insert into `table` in the block without its summary and search insert
+    triggers, then count and index the new rows in one pass each
+    `connection` must hold a write transaction, and the block must only
+    insert rows with ids above the current highest
+    """
+    last_id = connection.exec_driver_sql(f"SELECT coalesce(max(id), 0) FROM {table}").scalar()
+    triggers = _insert_triggers(connection, table)
+    for name, _ in triggers:
+        connection.exec_driver_sql(f"DROP TRIGGER {name}")
+    yield
+    new_last_id = connection.exec_driver_sql(f"SELECT coalesce(max(id), 0) FROM {table}").scalar()
+    names = {name for name, _ in triggers}
+    if new_last_id > last_id:
+        if f"{table}_summary_insert" in names:
+            add_to_trip_summaries(connection, table, last_id + 1, new_last_id)
+        if f"{table}_search_insert" in names:
+            fill_search_index(connection, table, last_id + 1, new_last_id)
+    for _, statement in triggers:
+        connection.exec_driver_sql(statement)
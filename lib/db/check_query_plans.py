@@ -0,0 +1,103 @@
+"""
+Fail when a hot itinerary query stops using an index.
+
+Runs EXPLAIN QUERY PLAN for the statements list_trips, trip_details,
+list-trips windows and destination lookups run, built by the same
+read_models/date_index functions, and exits non-zero if any of them scans
+a whole table or sorts in a temporary b-tree. Keyset pages that pick their
+rows from another index may sort: the LIMIT keeps the sort to one page.
+tests/test_query_plans.py runs the same check.
+
+    alembic upgrade head && python check_query_plans.py
+    python check_query_plans.py --memory   # schema straight from models.py
+"""
+import re
+import sys
+import argparse
+from datetime import date, time
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+try:
+    from .date_index import join_window, window_trip_ids
+    from .models import engine, ensure_schema
+    from .read_models import (
+        select_trips, select_activities, select_bookings, destination_ids, destination_starts_with, trip_page,
+        trips,
+    )
+except ImportError:  # run as a script from lib/db
+    from date_index import join_window, window_trip_ids
+    from models import engine, ensure_schema
+    from read_models import (
+        select_trips, select_activities, select_bookings, destination_ids, destination_starts_with, trip_page,
+        trips,
+    )
+
+WINDOW = ("overlapping", date(2025, 7, 1), date(2025, 7, 31))
+
+# name -> (statement, may sort a page in a temporary b-tree)
+HOT_QUERIES = {
+    "trip by id": (select_trips().where(trips.c.id == 1), False),
+    "trip page": (trip_page(0, 50), False),
+    "trips by destination prefix": (select_trips().where(destination_starts_with("Par")), False),
+    "trip page by destination prefix": (trip_page(0, 50, "Par", walk_trips=False), True),
+    "destination prefix count": (destination_ids("Par"), False),
+    "trips in date window": (window_trip_ids(*WINDOW), False),
+    "window page, few matches": (join_window(trip_page(0, 50, walk_trips=False), trips.c.id, *WINDOW), True),
+    "window page, many matches": (join_window(trip_page(0, 50), trips.c.id, *WINDOW, walk_trips=True), False),
+    "bookings for trip": (select_bookings([1]), False),
+    "activities for trip": (select_activities([1]), False),
+}
+
+def explain(connection, stmt):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(
+        str(value) if isinstance(value, (date, time)) else value
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+    return [row[-1] for row in rows]
+
+# A virtual table "scan" that passes constraints (e.g. INDEX 2:D1B0) is an
+# R*Tree search; INDEX 1: is its lookup by id
+CONSTRAINED_VIRTUAL_TABLE = re.compile(r"VIRTUAL TABLE INDEX (1:|\d+:\S)")
+
+def plan_problems(detail_lines, sorts=False):
+    """Plan lines that mean the query is not served by an index"""
+    return [
+        line for line in detail_lines
+        if (line.startswith("SCAN") and not CONSTRAINED_VIRTUAL_TABLE.search(line))
+        or ("USE TEMP B-TREE" in line and not sorts)
+    ]
+
+def check(bind):
+    failures = 0
+    with bind.connect() as connection:
+        for name, (stmt, sorts) in HOT_QUERIES.items():
+            try:
+                lines = explain(connection, stmt)
+                problems = plan_problems(lines, sorts)
+            except OperationalError as error:
+                # e.g. the R*Tree is missing because migrations haven't run
+                lines = problems = [str(error.orig)]
+            status = "FAIL" if problems else "ok"
+            print(f"[{status:>4}] {name}: {' | '.join(lines)}")
+            failures += bool(problems)
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--memory", action="store_true",
+                        help="check a fresh in-memory schema built from the models")
+    args = parser.parse_args()
+
+    bind = engine
+    if args.memory:
+        bind = create_engine("sqlite://")
+        ensure_schema(bind)
+
+    failures = check(bind)
+    if failures:
+        print(f"{failures} hot quer{'y' if failures == 1 else 'ies'} not using an index")
+        sys.exit(1)
+    print("All hot queries use indexes")
@@ -0,0 +1,130 @@
+# config.py
+"""
+Database configuration: where the database lives and how SQLite is tuned.
+
+The URL, performance profile and archive file are looked up in this order:
+    1. TRAVEL_DB_URL / TRAVEL_DB_PROFILE / TRAVEL_DB_ARCHIVE environment variables
+    2. the [database] section of the config file (TRAVEL_DB_CONFIG, or
+       travel_itinerary.ini in the working directory)
+    3. the defaults below
+
+    [database]
+    url = sqlite:////var/lib/travel/travel_itinerary.db
+    profile = balanced
+    archive = /var/lib/travel/travel_itinerary.archive.db
+
+Without an archive setting, the archive sits next to the database file.
+"""
+import os
+import configparser
+from functools import partial
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+DEFAULT_URL = 'sqlite:///travel_itinerary.db'
+DEFAULT_PROFILE = 'balanced'
+CONFIG_FILE = 'travel_itinerary.ini'
+
+# PRAGMAs applied to every new SQLite connection, in order. busy_timeout
+# goes first so switching journal_mode waits for other connections.
+PROFILES = {
+    # SQLite's own defaults: rollback journal with synchronous=FULL
+    'default': {},
+    # WAL lets readers carry on during a write; NORMAL only syncs at checkpoints
+    'balanced': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,        # 64 MiB
+        'mmap_size': 268435456,      # 256 MiB
+        'temp_store': 'MEMORY',
+    },
+    # Every commit is durable on disk, still without blocking readers
+    'durable': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+    },
+    # Seeding and imports: a crash can lose the last commits
+    'bulk': {
+        'busy_timeout': 30000,
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -262144,       # 256 MiB
+        'mmap_size': 1073741824,     # 1 GiB
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Applied before the profile on every connection: these are about
+# correctness, not speed (ON DELETE CASCADE needs foreign_keys)
+REQUIRED_PRAGMAS = {'foreign_keys': 'ON'}
+
+# Everything a profile can set, for reporting what is in effect
+PRAGMA_NAMES = ('foreign_keys', 'journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+
+def load_settings():
+    """Return {'url': ..., 'profile': ..., 'archive': ...} from the environment, config file and defaults"""
+    settings = {'url': DEFAULT_URL, 'profile': DEFAULT_PROFILE, 'archive': None}
+
+    parser = configparser.ConfigParser()
+    parser.read(os.environ.get('TRAVEL_DB_CONFIG', CONFIG_FILE))
+    if parser.has_section('database'):
+        settings.update({key: parser.get('database', key) for key in settings if parser.has_option('database', key)})
+
+    settings['url'] = os.environ.get('TRAVEL_DB_URL', settings['url'])
+    settings['profile'] = os.environ.get('TRAVEL_DB_PROFILE', settings['profile'])
+    settings['archive'] = os.environ.get('TRAVEL_DB_ARCHIVE', settings['archive'])
+    return settings
+
+def database_url(default=None):
+    """The configured URL; `default` replaces DEFAULT_URL when nothing else is set"""
+    settings = load_settings()
+    if default and settings['url'] == DEFAULT_URL and 'TRAVEL_DB_URL' not in os.environ:
+        return default
+    return settings['url']
+
+def apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def _resolve(url, profile):
+    settings = load_settings()
+    profile = profile or settings['profile']
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile '{profile}'. Choose from: {', '.join(PROFILES)}")
+    return make_url(url or settings['url']), {**REQUIRED_PRAGMAS, **PROFILES[profile]}
+
+def create_db_engine(url=None, profile=None, **kwargs):
+    """
+    Build an engine for the configured database
+    SQLite connections get the profile's PRAGMAs through a connect hook
+    """
+    url, pragmas = _resolve(url, profile)
+    engine = create_engine(url, **kwargs)
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', partial(apply_pragmas, pragmas))
+    return engine
+
+def create_async_db_engine(url=None, profile=None, **kwargs):
+    """
+    Async engine for the same database and profile
+    Plain sqlite:// URLs are switched to the aiosqlite driver
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url, pragmas = _resolve(url, profile)
+    if url.drivername == 'sqlite':
+        url = url.set(drivername='sqlite+aiosqlite')
+    engine = create_async_engine(url, **kwargs)
+    if engine.dialect.name == 'sqlite':
+        # Connect events fire on the sync facade with an adapted DBAPI connection
+        event.listen(engine.sync_engine, 'connect', partial(apply_pragmas, pragmas))
+    return engine
+
+def effective_pragmas(engine):
+    """Read back the PRAGMA values a pooled connection is actually using"""
+    with engine.connect() as connection:
+        return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in PRAGMA_NAMES}
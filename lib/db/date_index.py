@@ -0,0 +1,137 @@
+# date_index.py
+"""
+R*Tree interval index over trip dates.
+
+`trip_date_index` is an SQLite rtree_i32 virtual table holding one
+(start_day, end_day) box per trip, with days counted from 1970-01-01.
+Triggers on `trips` keep it in sync with every insert, update and delete,
+including Core bulk inserts that bypass the ORM.
+
+An ordinary B-tree on (start_date, end_date) can only bound one side of
+an overlap test, so "which trips are active during this week" still
+walks every trip that started before the week ends. The R*Tree bounds
+both sides at once.
+"""
+from datetime import date
+from sqlalchemy import MetaData, Table, Column, Integer, select
+
+EPOCH = date(1970, 1, 1)
+
+# Kept out of Base.metadata: create_all cannot build virtual tables
+metadata = MetaData()
+trip_dates = Table(
+    'trip_date_index', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('start_day', Integer),
+    Column('end_day', Integer),
+)
+
+# 'YYYY-MM-DD' -> days since EPOCH, matching day_number()
+_DAY = "CAST(julianday({}) - 2440587.5 AS INTEGER)"
+
+DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS trip_date_index USING rtree_i32(id, start_day, end_day)",
+    f"""CREATE TRIGGER IF NOT EXISTS trips_date_index_insert AFTER INSERT ON trips
+        WHEN new.start_date IS NOT NULL AND new.end_date IS NOT NULL
+        BEGIN
+            INSERT INTO trip_date_index VALUES (new.id, {_DAY.format('new.start_date')}, {_DAY.format('new.end_date')});
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trips_date_index_update AFTER UPDATE OF id, start_date, end_date ON trips
+        BEGIN
+            DELETE FROM trip_date_index WHERE id = old.id;
+            INSERT INTO trip_date_index
+                SELECT new.id, {_DAY.format('new.start_date')}, {_DAY.format('new.end_date')}
+                WHERE new.start_date IS NOT NULL AND new.end_date IS NOT NULL;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trips_date_index_delete AFTER DELETE ON trips
+        BEGIN
+            DELETE FROM trip_date_index WHERE id = old.id;
+        END""",
+]
+
+BACKFILL = f"""
+    INSERT OR REPLACE INTO trip_date_index
+    SELECT id, {_DAY.format('start_date')}, {_DAY.format('end_date')} FROM trips
+    WHERE start_date IS NOT NULL AND end_date IS NOT NULL
+"""
+
+DROP = [
+    "DROP TRIGGER IF EXISTS trips_date_index_delete",
+    "DROP TRIGGER IF EXISTS trips_date_index_update",
+    "DROP TRIGGER IF EXISTS trips_date_index_insert",
+    "DROP TABLE IF EXISTS trip_date_index",
+]
+
+# How a trip's date range must relate to a query window
+WINDOW_MODES = ('overlapping', 'containing', 'starting')
+
+def day_number(value):
+    """A date as the integer stored in trip_date_index"""
+    return (value - EPOCH).days
+
+def window_conditions(mode, window_start, window_end, start, end):
+    """
+    WHERE conditions on a trip's `start`/`end` columns for a window
+        overlapping  active at any point in the window
+        containing   active for the whole window
+        starting     starts inside the window
+    Either side of the window may be None: unbounded, except that
+    `containing` a one-sided window means containing that single day
+    """
+    if mode not in WINDOW_MODES:
+        raise ValueError(f"Unknown window mode '{mode}'. Choose from: {', '.join(WINDOW_MODES)}")
+    if mode == 'containing':
+        window_start = window_start if window_start is not None else window_end
+        window_end = window_end if window_end is not None else window_start
+    conditions = []
+    if window_start is not None:
+        conditions.append({'overlapping': end >= window_start,
+                           'containing': start <= window_start,
+                           'starting': start >= window_start}[mode])
+    if window_end is not None:
+        conditions.append({'overlapping': start <= window_end,
+                           'containing': end >= window_end,
+                           'starting': start <= window_end}[mode])
+    return conditions
+
+def window_index_conditions(mode, window_start=None, window_end=None):
+    """window_conditions() on trip_date_index, for queries joined to it"""
+    return window_conditions(
+        mode,
+        day_number(window_start) if window_start is not None else None,
+        day_number(window_end) if window_end is not None else None,
+        trip_dates.c.start_day,
+        trip_dates.c.end_day,
+    )
+
+def window_trip_ids(mode, window_start=None, window_end=None):
+    """SELECT of the ids of trips matching a window, answered from the R*Tree"""
+    return select(trip_dates.c.id).where(*window_index_conditions(mode, window_start, window_end))
+
+def join_window(stmt, trip_id, mode, window_start=None, window_end=None, walk_trips=False):
+    """
+    `stmt` joined to trip_date_index and limited to trips matching a window
+    walk_trips=True leaves the R*Tree to id lookups, for keyset pages that
+    walk trips in id order (see read_models.walks_trips)
+    """
+    stmt = stmt.join(trip_dates, trip_dates.c.id == trip_id)
+    if not walk_trips:
+        return stmt.where(*window_index_conditions(mode, window_start, window_end))
+    # "+ 0" hides the date conditions from the R*Tree, so SQLite drives from trips
+    return stmt.where(*window_conditions(
+        mode,
+        day_number(window_start) if window_start is not None else None,
+        day_number(window_end) if window_end is not None else None,
+        trip_dates.c.start_day + 0,
+        trip_dates.c.end_day + 0,
+    ))
+
+def create_date_index(connection):
+    """Create the index and its triggers if missing, then load existing trips"""
+    for statement in DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql(BACKFILL)
+
+def drop_date_index(connection):
+    for statement in DROP:
+        connection.exec_driver_sql(statement)
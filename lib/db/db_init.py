@@ -1,9 +1,9 @@
 # db_init.py
-from sqlalchemy import create_engine
+from config import create_db_engine
 from models import Base  # Assuming your models are in models.py
 
 def initialize_database():
-    engine = create_engine('sqlite:///travel_itinerary.db')
+    engine = create_db_engine()
     Base.metadata.create_all(engine)
     print("Database tables created successfully!")
 
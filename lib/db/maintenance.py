@@ -0,0 +1,128 @@
+# maintenance.py
+"""
+Bulk maintenance jobs that work through large tables in small transactions,
+so other connections are never locked out for long.
+"""
+import time as clock
+from sqlalchemy import select, delete
+try:
+    from .models import Trip, engine
+    from .search_index import KINDS, fill_search_index, reset_search_index
+    from .trip_summary import create_trip_summaries, fill_trip_summaries, stale_trip_summaries
+except ImportError:  # run from lib/db
+    from models import Trip, engine
+    from search_index import KINDS, fill_search_index, reset_search_index
+    from trip_summary import create_trip_summaries, fill_trip_summaries, stale_trip_summaries
+
+PURGE_CHUNK_SIZE = 1000
+SEARCH_CHUNK_SIZE = 50_000
+SUMMARY_CHUNK_SIZE = 10_000
+
+def purge_trips(ended_before, chunk_size=PURGE_CHUNK_SIZE, bind=None, report=print):
+    """
+    Delete every trip that ended before `ended_before`, with its activities
+    and bookings (ON DELETE CASCADE), `chunk_size` trips per transaction
+    Walks trips in id order, so each chunk picks up where the last one
+    stopped instead of rescanning the table. Returns the number of trips deleted.
+    """
+    bind = bind if bind is not None else engine
+    deleted = 0
+    last_id = 0
+    started = clock.perf_counter()
+    while True:
+        with bind.begin() as connection:
+            ids = connection.scalars(
+                select(Trip.id)
+                .where(Trip.id > last_id, Trip.end_date < ended_before)
+                .order_by(Trip.id)
+                .limit(chunk_size)
+            ).all()
+            if not ids:
+                break
+            connection.execute(delete(Trip).where(Trip.id.in_(ids)))
+        deleted += len(ids)
+        last_id = ids[-1]
+        report(f"Purged {deleted:,} trips ({deleted / (clock.perf_counter() - started):,.0f} trips/sec)")
+    return deleted
+
+def rebuild_search_index(chunk_size=SEARCH_CHUNK_SIZE, bind=None, report=print):
+    """
+    Rebuild the trip_search full-text index from scratch, `chunk_size`
+    source ids per transaction
+    The triggers stay in place, so rows written meanwhile are indexed as
+    usual; searches only see part of the data until the rebuild finishes.
+    Returns the number of rows indexed.
+    """
+    bind = bind if bind is not None else engine
+    with bind.begin() as connection:
+        reset_search_index(connection)
+
+    indexed = 0
+    started = clock.perf_counter()
+    for table in KINDS:
+        with bind.connect() as connection:
+            first_id, last_id = connection.exec_driver_sql(f"SELECT min(id), max(id) FROM {table}").one()
+        if first_id is None:
+            continue
+        for chunk_start in range(first_id, last_id + 1, chunk_size):
+            with bind.begin() as connection:
+                indexed += fill_search_index(connection, table, chunk_start, chunk_start + chunk_size - 1)
+            report(f"Indexed {indexed:,} rows, now at {table} {chunk_start:,} "
+                   f"({indexed / (clock.perf_counter() - started):,.0f} rows/sec)")
+
+    # Merge the segments written chunk by chunk
+    report("Optimizing the index...")
+    with bind.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO trip_search(trip_search) VALUES ('optimize')")
+    return indexed
+
+def _summary_ranges(connection, chunk_size):
+    """(first_id, last_id) chunks covering every trip and every stored summary"""
+    first_id, last_id = connection.exec_driver_sql(
+        "SELECT min(low), max(high) FROM ("
+        "SELECT min(id) AS low, max(id) AS high FROM trips "
+        "UNION ALL SELECT min(trip_id), max(trip_id) FROM trip_summaries)"
+    ).one()
+    if first_id is None:
+        return []
+    return [(start, start + chunk_size - 1) for start in range(first_id, last_id + 1, chunk_size)]
+
+def verify_trip_summaries(chunk_size=SUMMARY_CHUNK_SIZE, repair=False, bind=None, report=print):
+    """
+    Recount every trip's activities and bookings and compare the result with
+    trip_summaries, `chunk_size` trip ids per read
+    With `repair`, chunks holding wrong summaries are recounted in their own
+    transaction. Returns the ids of the trips whose summary was wrong.
+    """
+    bind = bind if bind is not None else engine
+    with bind.connect() as connection:
+        ranges = _summary_ranges(connection, chunk_size)
+    stale = []
+    started = clock.perf_counter()
+    for checked, (first_id, last_id) in enumerate(ranges, 1):
+        with bind.begin() as connection:
+            found = stale_trip_summaries(connection, first_id, last_id)
+            if found and repair:
+                fill_trip_summaries(connection, first_id, last_id)
+        stale.extend(found)
+        report(f"Checked trips up to {last_id:,}, {len(stale):,} wrong "
+               f"({checked * chunk_size / (clock.perf_counter() - started):,.0f} trips/sec)")
+    return stale
+
+def rebuild_trip_summaries(chunk_size=SUMMARY_CHUNK_SIZE, bind=None, report=print):
+    """
+    Recount every trip summary from scratch, `chunk_size` trip ids per
+    transaction, recreating the triggers first if they are missing
+    Returns the number of trips counted.
+    """
+    bind = bind if bind is not None else engine
+    with bind.begin() as connection:
+        create_trip_summaries(connection, fill=False)
+        ranges = _summary_ranges(connection, chunk_size)
+    counted = 0
+    started = clock.perf_counter()
+    for first_id, last_id in ranges:
+        with bind.begin() as connection:
+            counted += fill_trip_summaries(connection, first_id, last_id)
+        report(f"Counted {counted:,} trips ({counted / (clock.perf_counter() - started):,.0f} trips/sec)")
+    return counted
@@ -0,0 +1,214 @@
+# batched.py
+"""
+Batched, resumable data migrations for large tables.
+
+Everything an upgrade() does normally runs as one transaction. A backfill
+of a 20M-row table then holds the write lock until it is done, and an
+interrupted run throws all of it away. These helpers step out of that
+transaction (Alembic's autocommit_block) and work through a table in id
+ranges instead, `batch_size` ids per transaction:
+
+    backfill(name, 'activities', "duration = 60", "duration IS NULL")
+        UPDATE ... WHERE id BETWEEN first AND last
+    copy_rows(name, 'activities', 'activities_new', columns)
+        INSERT OR REPLACE INTO new ... SELECT ... WHERE id BETWEEN first AND last,
+        with triggers mirroring writes to rows already copied
+    swap_tables('activities', 'activities_new', statements)
+        RENAME both tables and recreate the old table's triggers in one
+        short transaction, then empty the old table in batches and drop it
+
+Each batch saves the last id it covered in `migration_checkpoints` in the
+same transaction, under the step's `name`. Running the migration again
+after an interruption resumes after that id. Steps must therefore be safe
+to repeat: add columns only if they are missing, and so on (see
+has_column and has_table). A finished step deletes its checkpoint, and
+the table goes when no step is left in it, so autogenerate never sees it.
+
+Writers get the lock between batches; `pause` seconds between batches
+leaves them room. SQLite only.
+"""
+import time as clock
+from collections.abc import Mapping
+from alembic import op
+
+BATCH_SIZE = 10_000
+PAUSE = 0.005
+CHECKPOINTS = 'migration_checkpoints'
+
+
+def has_column(table, column):
+    """True when `table` already has `column`, for steps that must be safe to repeat"""
+    rows = op.get_bind().exec_driver_sql(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in rows)
+
+
+def has_table(table):
+    """True when `table` exists, for steps that must be safe to repeat"""
+    return op.get_bind().exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).first() is not None
+
+
+def _load_checkpoint(connection, name):
+    connection.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {CHECKPOINTS} "
+        "(name TEXT PRIMARY KEY, last_id INTEGER NOT NULL, rows INTEGER NOT NULL, seconds REAL NOT NULL)"
+    )
+    row = connection.exec_driver_sql(
+        f"SELECT last_id, rows, seconds FROM {CHECKPOINTS} WHERE name = ?", (name,)
+    ).first()
+    return tuple(row) if row is not None else (0, 0, 0.0)
+
+
+def _finish(connection, name):
+    connection.exec_driver_sql(f"DELETE FROM {CHECKPOINTS} WHERE name = ?", (name,))
+    if connection.exec_driver_sql(f"SELECT count(*) FROM {CHECKPOINTS}").scalar() == 0:
+        connection.exec_driver_sql(f"DROP TABLE {CHECKPOINTS}")
+
+
+def run_in_batches(name, table, statement, batch_size=BATCH_SIZE, pause=PAUSE, report=print):
+    """
+    Run `statement` once per id range of `table`, with :first and :last
+    bound to the range, one transaction and checkpoint per range
+    Ranges start at the next id present, so gaps in the ids cost nothing.
+    Returns the number of rows the statement changed.
+    """
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_id, rows, seconds = _load_checkpoint(connection, name)
+        if last_id:
+            report(f"{name}: resuming after id {last_id:,}, {rows:,} rows done")
+        started = clock.perf_counter() - seconds
+        high = connection.exec_driver_sql(f"SELECT max(id) FROM {table}").scalar()
+        longest = 0.0
+        while True:
+            first = connection.exec_driver_sql(f"SELECT min(id) FROM {table} WHERE id > ?", (last_id,)).scalar()
+            if first is None:
+                break
+            last = first + batch_size - 1
+            batch_started = clock.perf_counter()
+            # The write lock up front: a deferred transaction could fail with
+            # SQLITE_BUSY halfway instead of waiting for it
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                rows += max(connection.exec_driver_sql(statement, {'first': first, 'last': last}).rowcount, 0)
+                connection.exec_driver_sql(
+                    f"INSERT OR REPLACE INTO {CHECKPOINTS} VALUES (?, ?, ?, ?)",
+                    (name, last, rows, clock.perf_counter() - started),
+                )
+                connection.exec_driver_sql("COMMIT")
+            except BaseException:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            longest = max(longest, clock.perf_counter() - batch_started)
+            last_id = last
+            elapsed = clock.perf_counter() - started
+            report(f"{name}: {rows:,} rows, ids up to {min(last, high or last):,} of {high or last:,} "
+                   f"({rows / elapsed:,.0f} rows/sec)")
+            if pause:
+                clock.sleep(pause)
+        _finish(connection, name)
+    report(f"{name}: done, {rows:,} rows in {clock.perf_counter() - started:,.1f}s, "
+           f"longest batch {longest * 1000:,.0f} ms")
+    return rows
+
+
+def backfill(name, table, assignments, where=None, batch_size=BATCH_SIZE, pause=PAUSE, report=print):
+    """UPDATE `table` SET `assignments` [WHERE `where`], in id batches; returns the rows changed"""
+    condition = f" AND ({where})" if where else ""
+    return run_in_batches(
+        name, table, f"UPDATE {table} SET {assignments} WHERE id BETWEEN :first AND :last{condition}",
+        batch_size, pause, report,
+    )
+
+
+def _pairs(columns):
+    """(target, source) column pairs from a list of names or a {target: source} mapping"""
+    return list(columns.items()) if isinstance(columns, Mapping) else [(column, column) for column in columns]
+
+
+def _mirror_names(target):
+    return [f"{target}_mirror_{event}" for event in ('insert', 'update', 'delete')]
+
+
+def _mirror_triggers(source, target, columns):
+    targets = ", ".join(column for column, _ in columns)
+    values = ", ".join(f"new.{column}" for _, column in columns)
+    upsert = f"INSERT OR REPLACE INTO {target} ({targets}) VALUES ({values});"
+    return dict(zip(_mirror_names(target), (
+        f"AFTER INSERT ON {source} BEGIN {upsert} END",
+        f"AFTER UPDATE ON {source} BEGIN DELETE FROM {target} WHERE id = old.id; {upsert} END",
+        f"AFTER DELETE ON {source} BEGIN DELETE FROM {target} WHERE id = old.id; END",
+    )))
+
+
+def copy_rows(name, source, target, columns, batch_size=BATCH_SIZE, pause=PAUSE, report=print):
+    """
+    Copy every row of `source` into the existing table `target`, ids
+    included, in id batches
+    `columns` lists the columns to copy, or maps target columns to source
+    columns for renames. Until swap_tables() drops them, triggers on
+    `source` repeat every insert, update and delete in `target`, so rows
+    written during the copy are not lost. Returns the rows copied.
+    """
+    pairs = _pairs(columns)
+    if 'id' not in dict(pairs):
+        raise ValueError("copy_rows needs the id column")
+    connection = op.get_bind()
+    for trigger, body in _mirror_triggers(source, target, pairs).items():
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {trigger} {body}")
+    return run_in_batches(
+        name, source,
+        f"INSERT OR REPLACE INTO {target} ({', '.join(column for column, _ in pairs)}) "
+        f"SELECT {', '.join(column for _, column in pairs)} FROM {source} WHERE id BETWEEN :first AND :last",
+        batch_size, pause, report,
+    )
+
+
+def swap_tables(table, new_table, statements=(), batch_size=BATCH_SIZE, pause=PAUSE, report=print):
+    """
+    Put the copy in `new_table` in place of `table`, then run `statements`
+    (the triggers `table` had) in the same transaction
+    That transaction only renames: `table` becomes `table`_old, emptied
+    afterwards in id batches and then dropped, since dropping millions of
+    rows at once would hold the write lock for as long as it takes. For
+    the same reason, build indexes on `new_table` before copy_rows(), under
+    new names (SQLite cannot rename an index), and not in `statements`.
+    The renames run with foreign keys off, as SQLite's rebuild recipe asks,
+    and legacy_alter_table on, so foreign keys and triggers elsewhere that
+    name `table` are left pointing at the new table. Copied rows need no
+    foreign key check: the copy inserted them with foreign keys on.
+    """
+    old_table = f"{table}_old"
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        if has_table(new_table):
+            started = clock.perf_counter()
+            foreign_keys = connection.exec_driver_sql("PRAGMA foreign_keys").scalar()
+            # Has no effect inside a transaction
+            connection.exec_driver_sql("PRAGMA foreign_keys = OFF")
+            connection.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+            try:
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+                try:
+                    triggers = connection.exec_driver_sql(
+                        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,)
+                    ).scalars().all()
+                    for trigger in triggers + _mirror_names(new_table):
+                        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+                    connection.exec_driver_sql(f"ALTER TABLE {table} RENAME TO {old_table}")
+                    connection.exec_driver_sql(f"ALTER TABLE {new_table} RENAME TO {table}")
+                    for statement in statements:
+                        connection.exec_driver_sql(statement)
+                    connection.exec_driver_sql("COMMIT")
+                except BaseException:
+                    connection.exec_driver_sql("ROLLBACK")
+                    raise
+            finally:
+                connection.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+                connection.exec_driver_sql(f"PRAGMA foreign_keys = {foreign_keys}")
+            report(f"Swapped {new_table} in for {table} in {(clock.perf_counter() - started) * 1000:,.0f} ms")
+    if has_table(old_table):
+        run_in_batches(f"{old_table}_drop", old_table,
+                       f"DELETE FROM {old_table} WHERE id BETWEEN :first AND :last", batch_size, pause, report)
+        op.drop_table(old_table)
@@ -0,0 +1,30 @@
+"""add hot query indexes
+
+Revision ID: 4b1c9e2d7a60
+Revises: d5303797971f
+Create Date: 2026-10-18 09:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b1c9e2d7a60'
+down_revision: Union[str, None] = 'd5303797971f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_activities_trip_date_time', 'activities', ['trip_id', 'date', 'time'], unique=False)
+    op.create_index('ix_bookings_trip_id', 'bookings', ['trip_id'], unique=False)
+    op.create_index('ix_trips_start_end', 'trips', ['start_date', 'end_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_trips_start_end', table_name='trips')
+    op.drop_index('ix_bookings_trip_id', table_name='bookings')
+    op.drop_index('ix_activities_trip_date_time', table_name='activities')
@@ -0,0 +1,27 @@
+"""add trip destination index
+
+Revision ID: 6d1f0b83e5a2
+Revises: f2a6c8d41b73
+Create Date: 2026-10-20 10:41:07.532918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d1f0b83e5a2'
+down_revision: Union[str, None] = 'f2a6c8d41b73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NOCASE, so destination prefix lookups can seek it (see read_models.py)
+    op.create_index('ix_trips_destination', 'trips', [sa.text('destination COLLATE NOCASE')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_trips_destination', table_name='trips')
@@ -0,0 +1,43 @@
+"""cascade trip deletes
+
+Revision ID: 7d2e5a9c3f14
+Revises: 4b1c9e2d7a60
+Create Date: 2026-10-18 11:03:27.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e5a9c3f14'
+down_revision: Union[str, None] = '4b1c9e2d7a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The original foreign keys were created without names; batch mode needs
+# a naming convention to find and drop them
+naming_convention = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+
+def _recreate_trip_fk(table, ondelete):
+    # SQLite cannot alter a constraint, so batch mode rebuilds the table
+    with op.batch_alter_table(table, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(f'fk_{table}_trip_id_trips', type_='foreignkey')
+        batch_op.create_foreign_key(
+            f'fk_{table}_trip_id_trips', 'trips', ['trip_id'], ['id'], ondelete=ondelete
+        )
+
+
+def upgrade() -> None:
+    _recreate_trip_fk('activities', 'CASCADE')
+    _recreate_trip_fk('bookings', 'CASCADE')
+
+
+def downgrade() -> None:
+    _recreate_trip_fk('bookings', None)
+    _recreate_trip_fk('activities', None)
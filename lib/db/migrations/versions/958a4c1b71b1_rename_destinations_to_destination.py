@@ -18,15 +18,12 @@ branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
 
+# This used to add `destination` and drop `destinations`, losing every
+# destination. ALTER TABLE ... RENAME COLUMN (SQLite 3.25+) keeps the data
+# and only rewrites the schema, so it takes no time on any table size.
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.add_column('trips', sa.Column('destination', sa.String(), nullable=True))
-    op.drop_column('trips', 'destinations')
-    # ### end Alembic commands ###
+    op.alter_column('trips', 'destinations', new_column_name='destination')
 
 
 def downgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.add_column('trips', sa.Column('destinations', sa.VARCHAR(), nullable=True))
-    op.drop_column('trips', 'destination')
-    # ### end Alembic commands ###
+    op.alter_column('trips', 'destination', new_column_name='destinations')
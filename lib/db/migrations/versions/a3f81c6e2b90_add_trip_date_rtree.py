@@ -0,0 +1,59 @@
+"""add trip date rtree
+
+Revision ID: a3f81c6e2b90
+Revises: 7d2e5a9c3f14
+Create Date: 2026-10-18 14:20:51.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f81c6e2b90'
+down_revision: Union[str, None] = '7d2e5a9c3f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Days since 1970-01-01 for a 'YYYY-MM-DD' column
+DAY = "CAST(julianday({}) - 2440587.5 AS INTEGER)"
+
+
+def upgrade() -> None:
+    op.execute("CREATE VIRTUAL TABLE trip_date_index USING rtree_i32(id, start_day, end_day)")
+    op.execute(f"""
+        CREATE TRIGGER trips_date_index_insert AFTER INSERT ON trips
+        WHEN new.start_date IS NOT NULL AND new.end_date IS NOT NULL
+        BEGIN
+            INSERT INTO trip_date_index VALUES (new.id, {DAY.format('new.start_date')}, {DAY.format('new.end_date')});
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER trips_date_index_update AFTER UPDATE OF id, start_date, end_date ON trips
+        BEGIN
+            DELETE FROM trip_date_index WHERE id = old.id;
+            INSERT INTO trip_date_index
+                SELECT new.id, {DAY.format('new.start_date')}, {DAY.format('new.end_date')}
+                WHERE new.start_date IS NOT NULL AND new.end_date IS NOT NULL;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER trips_date_index_delete AFTER DELETE ON trips
+        BEGIN
+            DELETE FROM trip_date_index WHERE id = old.id;
+        END
+    """)
+    op.execute(f"""
+        INSERT INTO trip_date_index
+        SELECT id, {DAY.format('start_date')}, {DAY.format('end_date')} FROM trips
+        WHERE start_date IS NOT NULL AND end_date IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER trips_date_index_delete")
+    op.execute("DROP TRIGGER trips_date_index_update")
+    op.execute("DROP TRIGGER trips_date_index_insert")
+    op.execute("DROP TABLE trip_date_index")
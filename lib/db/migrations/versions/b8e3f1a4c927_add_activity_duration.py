@@ -0,0 +1,32 @@
+"""add activity duration
+
+Revision ID: b8e3f1a4c927
+Revises: e4b7c2d9a815
+Create Date: 2026-10-18 21:14:52.306118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e3f1a4c927'
+down_revision: Union[str, None] = 'e4b7c2d9a815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ensure_schema() adds the column to databases that skipped this migration
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('activities')}
+    if 'duration' not in columns:
+        # Minutes from the activity's start time; NULL when unknown
+        op.add_column('activities', sa.Column('duration', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    # ALTER TABLE ... DROP COLUMN (SQLite 3.35+) keeps the triggers on activities,
+    # which a batch-mode table rebuild would drop
+    op.drop_column('activities', 'duration')
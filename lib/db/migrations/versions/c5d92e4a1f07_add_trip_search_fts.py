@@ -0,0 +1,51 @@
+"""add trip search fts
+
+Revision ID: c5d92e4a1f07
+Revises: a3f81c6e2b90
+Create Date: 2026-10-18 16:42:09.774153
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d92e4a1f07'
+down_revision: Union[str, None] = 'a3f81c6e2b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, trip_search columns, source columns, rowid kind, columns that trigger a reindex)
+SOURCES = [
+    ('trips', 'destination, trip_id', 'destination, id', 1, 'id, destination'),
+    ('activities', 'activity, trip_id', 'name, trip_id', 2, 'id, name, trip_id'),
+    ('bookings', 'flight, hotel, trip_id', 'flight, hotel, trip_id', 3, 'id, flight, hotel, trip_id'),
+]
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE VIRTUAL TABLE trip_search USING fts5(
+            destination, activity, flight, hotel, trip_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    for table, columns, values, kind, watched in SOURCES:
+        new_values = ', '.join(f'new.{value.strip()}' for value in values.split(','))
+        insert = f"INSERT INTO trip_search(rowid, {columns}) VALUES (new.id * 4 + {kind}, {new_values});"
+        delete = f"DELETE FROM trip_search WHERE rowid = old.id * 4 + {kind};"
+        op.execute(f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END")
+        op.execute(f"CREATE TRIGGER {table}_search_update AFTER UPDATE OF {watched} ON {table} "
+                   f"BEGIN {delete} {insert} END")
+        op.execute(f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END")
+        # Large databases can run `cli.py rebuild-search` afterwards to reindex in chunks
+        op.execute(f"INSERT INTO trip_search(rowid, {columns}) SELECT id * 4 + {kind}, {values} FROM {table}")
+
+
+def downgrade() -> None:
+    for table, *_ in reversed(SOURCES):
+        for action in ('delete', 'update', 'insert'):
+            op.execute(f"DROP TRIGGER {table}_search_{action}")
+    op.execute("DROP TABLE trip_search")
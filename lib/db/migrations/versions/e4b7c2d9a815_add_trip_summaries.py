@@ -0,0 +1,78 @@
+"""add trip summaries
+
+Revision ID: e4b7c2d9a815
+Revises: c5d92e4a1f07
+Create Date: 2026-10-18 18:05:37.412690
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7c2d9a815'
+down_revision: Union[str, None] = 'c5d92e4a1f07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EXTEND = """
+    activity_count = activity_count + 1,
+    first_activity = coalesce(min(first_activity, new.date), first_activity, new.date),
+    last_activity = coalesce(max(last_activity, new.date), last_activity, new.date)
+"""
+SHRINK = """
+    activity_count = activity_count - 1,
+    first_activity = CASE WHEN old.date = first_activity
+        THEN (SELECT min(date) FROM activities WHERE trip_id = old.trip_id) ELSE first_activity END,
+    last_activity = CASE WHEN old.date = last_activity
+        THEN (SELECT max(date) FROM activities WHERE trip_id = old.trip_id) ELSE last_activity END
+"""
+
+TRIGGERS = {
+    'trips_summary_insert': "AFTER INSERT ON trips BEGIN "
+        "INSERT OR IGNORE INTO trip_summaries (trip_id) VALUES (new.id); END",
+    'activities_summary_insert': "AFTER INSERT ON activities BEGIN "
+        f"UPDATE trip_summaries SET {EXTEND} WHERE trip_id = new.trip_id; END",
+    'activities_summary_delete': "AFTER DELETE ON activities BEGIN "
+        f"UPDATE trip_summaries SET {SHRINK} WHERE trip_id = old.trip_id; END",
+    'activities_summary_update': "AFTER UPDATE OF trip_id, date ON activities BEGIN "
+        f"UPDATE trip_summaries SET {SHRINK} WHERE trip_id = old.trip_id; "
+        f"UPDATE trip_summaries SET {EXTEND} WHERE trip_id = new.trip_id; END",
+    'bookings_summary_insert': "AFTER INSERT ON bookings BEGIN "
+        "UPDATE trip_summaries SET booking_count = booking_count + 1 WHERE trip_id = new.trip_id; END",
+    'bookings_summary_delete': "AFTER DELETE ON bookings BEGIN "
+        "UPDATE trip_summaries SET booking_count = booking_count - 1 WHERE trip_id = old.trip_id; END",
+    'bookings_summary_update': "AFTER UPDATE OF trip_id ON bookings BEGIN "
+        "UPDATE trip_summaries SET booking_count = booking_count - 1 WHERE trip_id = old.trip_id; "
+        "UPDATE trip_summaries SET booking_count = booking_count + 1 WHERE trip_id = new.trip_id; END",
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'trip_summaries',
+        sa.Column('trip_id', sa.Integer(), sa.ForeignKey('trips.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('activity_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('booking_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('first_activity', sa.Date(), nullable=True),
+        sa.Column('last_activity', sa.Date(), nullable=True),
+    )
+    for name, body in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER {name} {body}")
+    op.execute("""
+        INSERT INTO trip_summaries (trip_id, activity_count, booking_count, first_activity, last_activity)
+        SELECT id,
+            (SELECT count(*) FROM activities WHERE trip_id = trips.id),
+            (SELECT count(*) FROM bookings WHERE trip_id = trips.id),
+            (SELECT min(date) FROM activities WHERE trip_id = trips.id),
+            (SELECT max(date) FROM activities WHERE trip_id = trips.id)
+        FROM trips
+    """)
+
+
+def downgrade() -> None:
+    for name in reversed(TRIGGERS):
+        op.execute(f"DROP TRIGGER {name}")
+    op.drop_table('trip_summaries')
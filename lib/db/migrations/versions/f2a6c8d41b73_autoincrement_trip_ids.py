@@ -0,0 +1,74 @@
+"""autoincrement trip ids
+
+Revision ID: f2a6c8d41b73
+Revises: b8e3f1a4c927
+Create Date: 2026-10-19 09:12:44.218305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6c8d41b73'
+down_revision: Union[str, None] = 'b8e3f1a4c927'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# trips as of this revision; later columns come with their own migrations
+CREATE_TRIPS = """
+CREATE TABLE trips (
+	id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+	destination VARCHAR,
+	start_date DATE,
+	end_date DATE
+)"""
+COLUMNS = "id, destination, start_date, end_date"
+
+
+def upgrade() -> None:
+    # ensure_schema() runs the same rebuild on databases that skip this migration.
+    # Foreign keys can only be switched off outside a transaction.
+    with op.get_context().autocommit_block():
+        cursor = op.get_bind().connection.driver_connection.cursor()
+        try:
+            ddl = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'trips'").fetchone()
+            if 'AUTOINCREMENT' in ddl[0].upper():
+                return
+            foreign_keys = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+            cursor.execute("PRAGMA foreign_keys = OFF")
+            # References to `trips` in other tables stay as they are
+            cursor.execute("PRAGMA legacy_alter_table = ON")
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    dependents = cursor.execute(
+                        "SELECT type, name, sql FROM sqlite_master "
+                        "WHERE tbl_name = 'trips' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+                    ).fetchall()
+                    for kind, name, _ in dependents:
+                        cursor.execute(f"DROP {kind.upper()} {name}")
+                    cursor.execute("ALTER TABLE trips RENAME TO trips_rebuild")
+                    cursor.execute(CREATE_TRIPS)
+                    # Explicit ids also set sqlite_sequence to the highest one
+                    cursor.execute(f"INSERT INTO trips ({COLUMNS}) SELECT {COLUMNS} FROM trips_rebuild")
+                    cursor.execute("DROP TABLE trips_rebuild")
+                    for _, _, sql in dependents:
+                        cursor.execute(sql)
+                    cursor.execute("COMMIT")
+                except BaseException:
+                    cursor.execute("ROLLBACK")
+                    raise
+            finally:
+                cursor.execute("PRAGMA legacy_alter_table = OFF")
+                cursor.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+        finally:
+            cursor.close()
+
+
+def downgrade() -> None:
+    # Earlier revisions work with AUTOINCREMENT ids; dropping it would let
+    # archived trip ids be handed out again
+    pass
@@ -1,6 +1,22 @@
 # models.py
-from sqlalchemy import create_engine, Column, String, Integer, Date, Time, ForeignKey
-from sqlalchemy.orm import relationship, declarative_base, sessionmaker
+import itertools
+import os
+import threading
+from contextlib import contextmanager
+from sqlalchemy import Column, String, Integer, Date, Time, ForeignKey, Index, event
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import relationship, declarative_base, sessionmaker, Session as OrmSession
+try:
+    from .config import create_db_engine
+    from .date_index import create_date_index
+    from .search_index import create_search_index
+    from .trip_summary import create_trip_summaries
+except ImportError:  # imported from lib/db (alembic, seed.py)
+    from config import create_db_engine
+    from date_index import create_date_index
+    from search_index import create_search_index
+    from trip_summary import create_trip_summaries
 
 Base = declarative_base()
 
@@ -13,8 +29,22 @@ class Trip(Base):
     start_date = Column(Date)
     end_date = Column(Date)
 
-    bookings = relationship('Booking', back_populates='trip', cascade='all, delete-orphan')
-    activities = relationship('Activity', back_populates='trip', cascade='all, delete-orphan')
+    # Children are removed by ON DELETE CASCADE, so deleting a trip never loads them
+    bookings = relationship('Booking', back_populates='trip', cascade='all, delete-orphan', passive_deletes=True)
+    activities = relationship('Activity', back_populates='trip', cascade='all, delete-orphan', passive_deletes=True)
+    # Maintained by triggers (see trip_summary.py). Listings read it through
+    # read_models.select_trips(), so loading a Trip to change it skips the join
+    summary = relationship('TripSummary', uselist=False, viewonly=True)
+
+    # Date window lookups, and destination prefixes in LIKE's case-insensitive
+    # order (see read_models.destination_starts_with). AUTOINCREMENT: an id is
+    # never handed out twice, even after the highest trip is deleted or
+    # archived (see archive.py)
+    __table_args__ = (
+        Index('ix_trips_start_end', 'start_date', 'end_date'),
+        Index('ix_trips_destination', destination.collate('NOCASE')),
+        {'sqlite_autoincrement': True},
+    )
 
     def __repr__(self):
         return f"<Trip(id={self.id}, destination='{self.destination}', dates='{self.start_date} to {self.end_date}')>"
@@ -26,10 +56,12 @@ class Booking(Base):
     id = Column(Integer, primary_key=True)
     flight = Column(String)
     hotel = Column(String)
-    trip_id = Column(Integer, ForeignKey('trips.id'))
+    trip_id = Column(Integer, ForeignKey('trips.id', ondelete='CASCADE'))
 
     trip = relationship('Trip', back_populates='bookings')
 
+    __table_args__ = (Index('ix_bookings_trip_id', 'trip_id'),)
+
     def __repr__(self):
         return f"<Booking(id={self.id}, flight='{self.flight}', hotel='{self.hotel}')>"
 
@@ -41,13 +73,236 @@ class Activity(Base):
     name = Column(String)
     time = Column(Time)
     date = Column(Date)
-    trip_id = Column(Integer, ForeignKey('trips.id'))
+    # Minutes from `time`; None when unknown
+    duration = Column(Integer)
+    trip_id = Column(Integer, ForeignKey('trips.id', ondelete='CASCADE'))
 
     trip = relationship('Trip', back_populates='activities')
 
+    # Serves the per-trip itinerary: filter by trip, already ordered by (date, time)
+    __table_args__ = (Index('ix_activities_trip_date_time', 'trip_id', 'date', 'time'),)
+
     def __repr__(self):
         return f"<Activity(id={self.id}, name='{self.name}', time='{self.time}')>"
 
-engine = create_engine('sqlite:///travel_itinerary.db')
-Session = sessionmaker(bind=engine)
-session = Session()
\ No newline at end of file
+# Table -4: per-trip aggregates, written only by the triggers in trip_summary.py
+class TripSummary(Base):
+    __tablename__ = 'trip_summaries'
+
+    trip_id = Column(Integer, ForeignKey('trips.id', ondelete='CASCADE'), primary_key=True)
+    activity_count = Column(Integer, nullable=False, server_default='0')
+    booking_count = Column(Integer, nullable=False, server_default='0')
+    first_activity = Column(Date)
+    last_activity = Column(Date)
+
+    def __repr__(self):
+        return (f"<TripSummary(trip_id={self.trip_id}, activities={self.activity_count}, "
+                f"bookings={self.booking_count})>")
+
+# Bump whenever the models change, so ensure_schema() runs create_all again
+SCHEMA_VERSION = 8
+
+engine = create_db_engine()
+# Objects stay readable after their session commits and closes
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+# Data version: bumped whenever a session commits changes to trips,
+# bookings or activities, so in-process read caches know to drop stale entries
+_data_versions = itertools.count(1)
+_data_version = 0
+
+# Core statements, restores and other processes never go through a session.
+# SQLite's PRAGMA data_version moves whenever a connection other than the
+# one asking commits, so one connection is kept aside to ask it
+_watcher = None
+_watcher_lock = threading.Lock()
+
+def _database_version():
+    global _watcher
+    if engine.dialect.name != 'sqlite':
+        return None
+    with _watcher_lock:
+        # A forked process opens its own
+        if _watcher is None or _watcher[0] != os.getpid():
+            connection = engine.raw_connection()
+            _watcher = (os.getpid(), connection.driver_connection)
+            connection.detach()
+        return _watcher[1].execute("PRAGMA data_version").fetchone()[0]
+
+def data_version():
+    """Changes whenever trips, bookings or activities may have changed, whoever wrote them"""
+    return _data_version, _database_version()
+
+def _touches_itinerary(objects):
+    return any(isinstance(obj, (Trip, Booking, Activity)) for obj in objects)
+
+@event.listens_for(OrmSession, "after_flush")
+def _note_flushed_changes(session, flush_context):
+    if _touches_itinerary(session.new) or _touches_itinerary(session.dirty) or _touches_itinerary(session.deleted):
+        session.info["itinerary_changed"] = True
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _note_bulk_changes(orm_execute_state):
+    # delete(Trip)/update(...) statements never go through a flush
+    if orm_execute_state.is_delete or orm_execute_state.is_update or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Trip, Booking, Activity):
+            orm_execute_state.session.info["itinerary_changed"] = True
+
+@event.listens_for(OrmSession, "after_commit")
+def _bump_data_version(session):
+    global _data_version
+    # Releasing a SAVEPOINT fires after_commit too; wait for the real COMMIT
+    if session.in_nested_transaction():
+        return
+    if session.info.pop("itinerary_changed", False):
+        _data_version = next(_data_versions)
+
+@event.listens_for(OrmSession, "after_soft_rollback")
+def _forget_changes(session, previous_transaction):
+    # Rolling back to a SAVEPOINT keeps what the transaction did before it
+    if not previous_transaction.nested:
+        session.info.pop("itinerary_changed", None)
+
+@contextmanager
+def session_scope():
+    """
+    Session for one unit of work
+    Commits when the block succeeds, rolls back if it raises, always closes.
+    Each call gets its own session, so scopes can run on any thread.
+    """
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+@contextmanager
+def read_session():
+    """
+    Session for read-only work
+    Autoflush is off and nothing is committed; closing ends the read.
+    Loaded objects remain usable (detached) after the block.
+    """
+    session = Session(autoflush=False)
+    try:
+        yield session
+    finally:
+        session.close()
+
+# Columns added to tables that older databases already have; create_all
+# only creates missing tables, so ensure_schema() adds these by ALTER TABLE
+ADDED_COLUMNS = [Activity.__table__.c.duration]
+
+def _add_missing_columns(connection):
+    for column in ADDED_COLUMNS:
+        table = column.table.name
+        existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if column.name not in existing:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(connection.dialect)}"
+            )
+
+# The id AUTOINCREMENT would give the next trip; sqlite_sequence remembers
+# ids of deleted and archived trips
+NEXT_TRIP_ID = (
+    "SELECT max(coalesce((SELECT max(id) FROM trips), 0), "
+    "coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'trips'), 0)) + 1"
+)
+
+def next_trip_id(connection):
+    """
+    The id of the next trip inserted; callers choosing ids themselves read it
+    under BEGIN IMMEDIATE, so no other writer can take it first
+    """
+    return connection.exec_driver_sql(NEXT_TRIP_ID).scalar()
+
+def _create_missing_indexes(connection):
+    """create_all() only indexes the tables it creates"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def autoincrement_trip_ids(dbapi_connection):
+    """
+    Rebuild `trips` with AUTOINCREMENT ids, unless it already has them
+    Takes a DBAPI sqlite3 connection in autocommit mode: foreign keys
+    must be off for the rebuild, which SQLite ignores inside a transaction.
+    The rows, indexes and triggers move in one transaction; about two
+    seconds for a million trips. Returns True when the table was rebuilt.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        ddl = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'trips'").fetchone()
+        if ddl is None or 'AUTOINCREMENT' in ddl[0].upper():
+            return False
+        columns = ", ".join(column.name for column in Trip.__table__.c)
+        foreign_keys = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        # References to `trips` in other tables stay as they are
+        cursor.execute("PRAGMA legacy_alter_table = ON")
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                dependents = cursor.execute(
+                    "SELECT type, name, sql FROM sqlite_master "
+                    "WHERE tbl_name = 'trips' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+                ).fetchall()
+                for kind, name, _ in dependents:
+                    cursor.execute(f"DROP {kind.upper()} {name}")
+                cursor.execute("ALTER TABLE trips RENAME TO trips_rebuild")
+                cursor.execute(str(CreateTable(Trip.__table__).compile(dialect=sqlite.dialect())))
+                # Explicit ids also set sqlite_sequence to the highest one
+                cursor.execute(f"INSERT INTO trips ({columns}) SELECT {columns} FROM trips_rebuild")
+                cursor.execute("DROP TABLE trips_rebuild")
+                for _, _, sql in dependents:
+                    cursor.execute(sql)
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        finally:
+            cursor.execute("PRAGMA legacy_alter_table = OFF")
+            cursor.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+        return True
+    finally:
+        cursor.close()
+
+def ensure_schema(bind=None):
+    """
+    Create missing tables unless the database is already at SCHEMA_VERSION
+    SQLite keeps the version in PRAGMA user_version, so an up-to-date
+    database costs one PRAGMA read instead of a create_all reflection pass.
+    Returns True when create_all had to run.
+    """
+    bind = bind if bind is not None else engine
+    if bind.dialect.name != 'sqlite':
+        Base.metadata.create_all(bind)
+        return True
+
+    with bind.connect() as connection:
+        if connection.exec_driver_sql("PRAGMA user_version").scalar() >= SCHEMA_VERSION:
+            return False
+    Base.metadata.create_all(bind)
+    raw = bind.raw_connection()
+    try:
+        isolation_level = raw.driver_connection.isolation_level
+        raw.driver_connection.isolation_level = None
+        try:
+            autoincrement_trip_ids(raw.driver_connection)
+        finally:
+            raw.driver_connection.isolation_level = isolation_level
+    finally:
+        raw.close()
+    with bind.begin() as connection:
+        _add_missing_columns(connection)
+        _create_missing_indexes(connection)
+        create_date_index(connection)
+        create_search_index(connection)
+        create_trip_summaries(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return True
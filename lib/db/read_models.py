@@ -0,0 +1,168 @@
+# read_models.py
+"""
+Read-only records for the views that only display data.
+
+An ORM entity carries an instance state, an identity-map entry and
+instrumented attributes with lazy loaders, and a read-only view uses none
+of them. The queries here select just the columns a view shows, through
+Core, and return named tuples. A named tuple has `__slots__ = ()`, so a
+record costs no more than a tuple of its values.
+
+    TripRecord      a trip with its trip_summaries counts
+    TripDetail      a TripRecord plus its bookings and activities
+    BookingRecord / ActivityRecord
+
+Records are detached from any session and safe to share between threads
+or cache. Anything that changes data still loads the ORM classes.
+
+Every loader takes a Session or a Connection. `bench.py --records` measures
+the per-row cost of both against ORM entities.
+"""
+import math
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+from sqlalchemy import select, func, and_
+try:
+    from .models import Trip, Booking, Activity, TripSummary
+except ImportError:  # imported from lib/db
+    from models import Trip, Booking, Activity, TripSummary
+
+TripRecord = namedtuple('TripRecord', 'id destination start_date end_date '
+                                      'activity_count booking_count first_activity last_activity')
+TripDetail = namedtuple('TripDetail', TripRecord._fields + ('bookings', 'activities'))
+BookingRecord = namedtuple('BookingRecord', 'id trip_id flight hotel')
+ActivityRecord = namedtuple('ActivityRecord', 'id trip_id name date time duration')
+
+trips = Trip.__table__
+summaries = TripSummary.__table__
+bookings = Booking.__table__
+activities = Activity.__table__
+
+# Set by archive.include_archive(). There `trip_summaries` is a UNION ALL
+# view, and SQLite materializes all of it to join it; a correlated lookup
+# per trip still goes through each file's primary key
+correlated_summaries = False
+
+def _summary(column):
+    return select(column).where(summaries.c.trip_id == trips.c.id).scalar_subquery()
+
+def select_trips():
+    """
+    Trips as TripRecord columns, for callers to add WHERE/ORDER BY/LIMIT
+    Summaries are outer joined, so a trip without one counts as empty.
+    """
+    if correlated_summaries:
+        return select(
+            trips.c.id, trips.c.destination, trips.c.start_date, trips.c.end_date,
+            func.coalesce(_summary(summaries.c.activity_count), 0).label('activity_count'),
+            func.coalesce(_summary(summaries.c.booking_count), 0).label('booking_count'),
+            _summary(summaries.c.first_activity).label('first_activity'),
+            _summary(summaries.c.last_activity).label('last_activity'),
+        )
+    return select(
+        trips.c.id, trips.c.destination, trips.c.start_date, trips.c.end_date,
+        func.coalesce(summaries.c.activity_count, 0).label('activity_count'),
+        func.coalesce(summaries.c.booking_count, 0).label('booking_count'),
+        summaries.c.first_activity, summaries.c.last_activity,
+    ).select_from(trips.outerjoin(summaries, summaries.c.trip_id == trips.c.id))
+
+# NOCASE folds ASCII letters only, like LIKE
+_NOCASE = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+def destination_starts_with(prefix):
+    """
+    Condition for trips whose destination starts with `prefix`, ignoring case
+    LIKE cannot use an index here, so a NOCASE range over ix_trips_destination
+    picks the candidates and LIKE keeps its exact matching rules
+    """
+    folded = prefix.translate(_NOCASE)
+    destination = trips.c.destination.collate('NOCASE')
+    conditions = [destination >= folded, trips.c.destination.startswith(prefix, autoescape=True)]
+    # The first string past every folded match; surrogates have no UTF-8 form
+    if ord(folded[-1]) < 0xD7FF:
+        conditions.append(destination < folded[:-1] + chr(ord(folded[-1]) + 1))
+    return and_(*conditions)
+
+def destination_ids(prefix, after_id=0):
+    """Ids above `after_id` of trips whose destination starts with `prefix`"""
+    # "+ 0" keeps SQLite on ix_trips_destination instead of walking ids
+    return select(trips.c.id).where(destination_starts_with(prefix), trips.c.id + 0 > after_id)
+
+def walks_trips(connection, matching_ids, after_id=0, page_size=50):
+    """
+    Whether keyset pages of `page_size` trips above `after_id` fill sooner
+    walking trips in id order than reading all of `matching_ids` (a select
+    of the matching ids above `after_id`) from its index and keeping the
+    lowest: about page_size * span / matches probes against `matches` reads
+    """
+    span = (connection.scalar(select(func.max(trips.c.id))) or 0) - after_id
+    # Counting stops where walking trips starts to pay off
+    threshold = math.isqrt(2 * page_size * max(span, 0)) + 1
+    matches = connection.scalar(select(func.count()).select_from(matching_ids.limit(threshold).subquery()))
+    return matches >= threshold
+
+def trip_page(after_id=0, limit=50, destination=None, walk_trips=True):
+    """
+    select_trips() for one keyset page: trips above `after_id`, in id order
+    walk_trips=False hides the id bound from SQLite, so it reads the trips
+    matching the other conditions from their index and sorts just the page
+    """
+    after = trips.c.id > after_id if walk_trips else trips.c.id + 0 > after_id
+    stmt = select_trips().where(after).order_by(trips.c.id).limit(limit)
+    if destination:
+        stmt = stmt.where(destination_starts_with(destination))
+    return stmt
+
+def load_trips(connection, stmt):
+    """A list of TripRecord for a select_trips() statement"""
+    return list(map(TripRecord._make, connection.execute(stmt)))
+
+def load_trip(connection, trip_id):
+    """The TripRecord for `trip_id`, or None"""
+    row = connection.execute(select_trips().where(trips.c.id == trip_id)).first()
+    return TripRecord._make(row) if row is not None else None
+
+def select_activities(trip_ids):
+    return (
+        select(activities.c.id, activities.c.trip_id, activities.c.name, activities.c.date, activities.c.time,
+               activities.c.duration)
+        .where(activities.c.trip_id.in_(trip_ids))
+        .order_by(activities.c.trip_id, activities.c.date, activities.c.time)
+    )
+
+def load_activities(connection, trip_ids):
+    """ActivityRecords of the given trips, by trip then in (date, time) order"""
+    return list(map(ActivityRecord._make, connection.execute(select_activities(trip_ids))))
+
+def select_bookings(trip_ids):
+    return (
+        select(bookings.c.id, bookings.c.trip_id, bookings.c.flight, bookings.c.hotel)
+        .where(bookings.c.trip_id.in_(trip_ids))
+        .order_by(bookings.c.trip_id, bookings.c.id)
+    )
+
+def load_bookings(connection, trip_ids):
+    """BookingRecords of the given trips, by trip then id"""
+    return list(map(BookingRecord._make, connection.execute(select_bookings(trip_ids))))
+
+def with_children(connection, trip_records):
+    """
+    TripDetails for the given TripRecords: two queries however many trips
+    Activities come in itinerary order, all-day ones (no time) first.
+    """
+    trip_ids = [trip.id for trip in trip_records]
+    if not trip_ids:
+        return []
+    by_trip = attrgetter('trip_id')
+    trip_bookings = {key: list(rows) for key, rows in groupby(load_bookings(connection, trip_ids), by_trip)}
+    trip_activities = {key: list(rows) for key, rows in groupby(load_activities(connection, trip_ids), by_trip)}
+    return [
+        TripDetail(*trip, trip_bookings.get(trip.id, []), trip_activities.get(trip.id, []))
+        for trip in trip_records
+    ]
+
+def load_trip_detail(connection, trip_id):
+    """The TripDetail for `trip_id`, or None"""
+    trip = load_trip(connection, trip_id)
+    return with_children(connection, [trip])[0] if trip is not None else None
@@ -0,0 +1,66 @@
+# recurrence.py
+"""
+Recurring activities, expanded inside SQLite in one statement.
+
+A recurrence repeats one activity (name, time, duration) over a run of days:
+
+    step      every `step` days: 1 for daily, N for every N days
+    weekdays  or only on these days of the week (0 = Monday), any step
+
+and is clipped, per trip, to the days from `starts` to `until` that fall
+within the trip. `expand_recurrence` turns it into a single
+
+    INSERT INTO activities (...)
+    WITH RECURSIVE target(...) AS (one row per matching trip),
+                   days(...) AS (each trip's first day, then + step days)
+    SELECT ... FROM days
+
+so one rule over thousands of trips costs one statement, not one row
+per round trip. The summary and search triggers on `activities` fire for
+every inserted row as usual. SQLite only: the day arithmetic uses date()
+and strftime().
+"""
+from sqlalchemy import select, insert, func, literal, and_
+try:
+    from .models import Activity, Trip
+except ImportError:  # imported from lib/db
+    from models import Activity, Trip
+
+WEEKDAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+trips = Trip.__table__
+
+def _sqlite_weekdays(weekdays):
+    """Monday=0 weekdays as strftime('%w') values, where Sunday is '0'"""
+    return sorted(str((day + 1) % 7) for day in weekdays)
+
+def expand_recurrence(trip_condition, name, time=None, step=1, weekdays=None, starts=None, until=None,
+                      duration=None):
+    """
+    INSERT ... SELECT adding the activity on every recurring day of every
+    trip matching `trip_condition` (a WHERE clause on the trips table)
+    Returns the statement; SQLite's changes() after it counts the activities added.
+    """
+    first_day = trips.c.start_date if starts is None else func.max(trips.c.start_date, literal(starts, Trip.start_date.type))
+    last_day = trips.c.end_date if until is None else func.min(trips.c.end_date, literal(until, Trip.end_date.type))
+    target = (
+        select(trips.c.id.label('trip_id'), first_day.label('first_day'), last_day.label('last_day'))
+        .where(trip_condition)
+        .cte('target')
+    )
+    days = (
+        select(target.c.trip_id, target.c.first_day.label('day'), target.c.last_day)
+        .where(target.c.first_day <= target.c.last_day)
+        .cte('days', recursive=True)
+    )
+    next_day = func.date(days.c.day, f'+{int(step)} days')
+    days = days.union_all(
+        select(days.c.trip_id, next_day, days.c.last_day).where(next_day <= days.c.last_day)
+    )
+    occurrences = select(
+        literal(name, Activity.name.type), literal(time, Activity.time.type),
+        literal(duration, Activity.duration.type), days.c.day, days.c.trip_id,
+    )
+    if weekdays:
+        occurrences = occurrences.where(func.strftime('%w', days.c.day).in_(_sqlite_weekdays(weekdays)))
+    return insert(Activity).from_select(['name', 'time', 'duration', 'date', 'trip_id'], occurrences)
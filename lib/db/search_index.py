@@ -0,0 +1,98 @@
+# search_index.py
+"""
+FTS5 full-text index over trip destinations, activity names and booking
+flight/hotel details.
+
+`trip_search` holds one row per trip, activity and booking, each tagged
+with its owning trip. Its rowid encodes the source row (id * 4 + kind),
+so the triggers on trips, activities and bookings can update or delete
+an entry by rowid instead of searching the index for it.
+"""
+# rowid = source id * 4 + kind
+KINDS = {'trips': 1, 'activities': 2, 'bookings': 3}
+
+CREATE_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS trip_search USING fts5(
+        destination, activity, flight, hotel, trip_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+
+# (table, columns written to trip_search, source expressions)
+SOURCES = [
+    ('trips', 'destination, trip_id', 'destination, id'),
+    ('activities', 'activity, trip_id', 'name, trip_id'),
+    ('bookings', 'flight, hotel, trip_id', 'flight, hotel, trip_id'),
+]
+
+# Columns whose changes must be reindexed
+WATCHED = {
+    'trips': 'id, destination',
+    'activities': 'id, name, trip_id',
+    'bookings': 'id, flight, hotel, trip_id',
+}
+
+def trigger_statements():
+    """CREATE TRIGGER statements keeping trip_search in step with its sources"""
+    for table, columns, values in SOURCES:
+        kind = KINDS[table]
+        new_values = ', '.join(f'new.{value.strip()}' for value in values.split(','))
+        insert = (f"INSERT INTO trip_search(rowid, {columns}) "
+                  f"VALUES (new.id * 4 + {kind}, {new_values});")
+        delete = f"DELETE FROM trip_search WHERE rowid = old.id * 4 + {kind};"
+        yield f"""CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table}
+            BEGIN {insert} END"""
+        yield f"""CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {WATCHED[table]} ON {table}
+            BEGIN {delete} {insert} END"""
+        yield f"""CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table}
+            BEGIN {delete} END"""
+
+def fill_search_index(connection, table, first_id=None, last_id=None):
+    """
+    Index the rows of `table` with first_id <= id <= last_id (all rows by
+    default). Returns the number of rows indexed
+    """
+    _, columns, values = next(source for source in SOURCES if source[0] == table)
+    where = "" if first_id is None else "WHERE id BETWEEN ? AND ?"
+    return connection.exec_driver_sql(
+        f"INSERT OR REPLACE INTO trip_search(rowid, {columns}) "
+        f"SELECT id * 4 + {KINDS[table]}, {values} FROM {table} {where}",
+        () if first_id is None else (first_id, last_id),
+    ).rowcount
+
+def create_search_index(connection, fill=True):
+    """
+    Create the index and its triggers if missing, then index existing rows
+    An index that already exists is kept as is; rebuild_search_index() redoes one
+    """
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trip_search'"
+    ).first() is not None
+    connection.exec_driver_sql(CREATE_TABLE)
+    for statement in trigger_statements():
+        connection.exec_driver_sql(statement)
+    if fill and not exists:
+        for table in KINDS:
+            fill_search_index(connection, table)
+
+def reset_search_index(connection):
+    """Replace trip_search with an empty index; the triggers keep working"""
+    connection.exec_driver_sql("DROP TABLE IF EXISTS trip_search")
+    create_search_index(connection, fill=False)
+
+def drop_search_index(connection):
+    for table in KINDS:
+        for action in ('insert', 'update', 'delete'):
+            connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {table}_search_{action}")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS trip_search")
+
+# Text columns of trip_search, in order
+FIELDS = ('destination', 'activity', 'flight', 'hotel')
+
+def match_expression(text):
+    """
+    Turn user input into an FTS5 query: every word must match, as a prefix
+    Words are quoted, so FTS5 operators and punctuation are taken literally
+    """
+    words = text.split()
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
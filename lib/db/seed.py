@@ -1,76 +1,189 @@
-from models import Trip, Booking, Activity, session, Base, engine
+try:
+    from .bulk_load import bulk_insert
+    from .models import Trip, Booking, Activity, session_scope, ensure_schema, engine, next_trip_id
+except ImportError:  # run as a script from lib/db
+    from bulk_load import bulk_insert
+    from models import Trip, Booking, Activity, session_scope, ensure_schema, engine, next_trip_id
+from contextlib import nullcontext
 from faker import Faker
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import insert
+import argparse
 import random
+import time as clock
 
 fake = Faker()
 
 def create_tables():
     """Create all database tables before seeding"""
-    Base.metadata.create_all(engine)
+    ensure_schema(engine)
 
 def clear_data():
     """Clear existing data from all tables"""
     # Note the order matters due to foreign key constraints
-    session.query(Activity).delete()
-    session.query(Booking).delete()
-    session.query(Trip).delete()
-    session.commit()
+    with session_scope() as session:
+        session.query(Activity).delete()
+        session.query(Booking).delete()
+        session.query(Trip).delete()
 
 def seed_data():
-    # Create trips
-    trips = []
-    for _ in range(3):
-        start_date = fake.date_between(start_date='-30d', end_date='+30d')
-        end_date = start_date + timedelta(days=random.randint(3, 14))
-        trip = Trip(
-            destination=fake.city(),
-            start_date=start_date,
-            end_date=end_date
-        )
-        trips.append(trip)
-        session.add(trip)
+    with session_scope() as session:
+        # Create trips
+        trips = []
+        for _ in range(3):
+            start_date = fake.date_between(start_date='-30d', end_date='+30d')
+            end_date = start_date + timedelta(days=random.randint(3, 14))
+            trip = Trip(
+                destination=fake.city(),
+                start_date=start_date,
+                end_date=end_date
+            )
+            trips.append(trip)
+            session.add(trip)
     
-    session.commit()
+        session.flush()
     
-    # Create bookings for each trip
-    airlines = ["Delta", "United", "American", "Southwest", "JetBlue", "Spirit"]
-    hotel_chains = ["Marriott", "Hilton", "Hyatt", "InterContinental", "Accor", "Wyndham"]
+        # Create bookings for each trip
+        airlines = ["Delta", "United", "American", "Southwest", "JetBlue", "Spirit"]
+        hotel_chains = ["Marriott", "Hilton", "Hyatt", "InterContinental", "Accor", "Wyndham"]
     
-    for trip in trips:
-        booking = Booking(
-            flight=f"{random.choice(airlines)} {random.randint(100, 999)}",  # Generate flight info
-            hotel=f"{random.choice(hotel_chains)} {fake.city()}",  # Generate hotel info
-            trip_id=trip.id
-        )
-        session.add(booking)
+        for trip in trips:
+            booking = Booking(
+                flight=f"{random.choice(airlines)} {random.randint(100, 999)}",  # Generate flight info
+                hotel=f"{random.choice(hotel_chains)} {fake.city()}",  # Generate hotel info
+                trip_id=trip.id
+            )
+            session.add(booking)
     
-    # Create activities for each trip
-    activities = [
-        "City Tour", "Museum Visit", "Beach Day", 
-        "Hiking", "Food Tasting", "Shopping",
-        "Concert", "Theater Show", "Wine Tasting",
-        "Boat Cruise", "Cooking Class", "Local Market"
-    ]
+        # Create activities for each trip
+        activities = [
+            "City Tour", "Museum Visit", "Beach Day", 
+            "Hiking", "Food Tasting", "Shopping",
+            "Concert", "Theater Show", "Wine Tasting",
+            "Boat Cruise", "Cooking Class", "Local Market"
+        ]
     
-    for trip in trips:
-        current_date = trip.start_date
-        while current_date <= trip.end_date:
-            num_activities = random.randint(1, 3)
-            for _ in range(num_activities):
-                activity = Activity(
-                    name=random.choice(activities),
-                    time=datetime.strptime(f"{random.randint(9, 18)}:00", "%H:%M").time(),
-                    date=current_date,
-                    trip_id=trip.id
-                )
-                session.add(activity)
-            current_date += timedelta(days=1)
-    
-    session.commit()
+        for trip in trips:
+            current_date = trip.start_date
+            while current_date <= trip.end_date:
+                num_activities = random.randint(1, 3)
+                for _ in range(num_activities):
+                    activity = Activity(
+                        name=random.choice(activities),
+                        time=datetime.strptime(f"{random.randint(9, 18)}:00", "%H:%M").time(),
+                        date=current_date,
+                        trip_id=trip.id
+                    )
+                    session.add(activity)
+                current_date += timedelta(days=1)
+
+AIRLINES = ["Delta", "United", "American", "Southwest", "JetBlue", "Spirit"]
+HOTEL_CHAINS = ["Marriott", "Hilton", "Hyatt", "InterContinental", "Accor", "Wyndham"]
+ACTIVITY_NAMES = [
+    "City Tour", "Museum Visit", "Beach Day",
+    "Hiking", "Food Tasting", "Shopping",
+    "Concert", "Theater Show", "Wine Tasting",
+    "Boat Cruise", "Cooking Class", "Local Market"
+]
+# Faker is slow per call, so cities are drawn once into a pool
+CITY_POOL_SIZE = 1000
+# Trips start on a day within this many days of the anchor date
+START_SPREAD_DAYS = 730
+DEFAULT_ANCHOR = date(2025, 1, 1)
+
+def generate_trip_rows(count, first_id, rng, cities, anchor):
+    """
+    Generate rows for `count` trips with ids starting at `first_id`
+    Returns (trips, bookings, activities) as lists of column dicts
+    """
+    days = [anchor + timedelta(days=n) for n in range(START_SPREAD_DAYS + 15)]
+    times = [time(hour) for hour in range(9, 19)]
+    choices = rng.choices
+    trips, bookings, activities = [], [], []
+    # Draw whole batches with choices(); one choice() call per value is
+    # where a naive generator spends most of its time
+    starts = choices(range(START_SPREAD_DAYS), k=count)
+    lengths = choices(range(3, 15), k=count)
+    destinations = choices(cities, k=count)
+    airlines = choices(AIRLINES, k=count)
+    flight_numbers = choices(range(100, 1000), k=count)
+    hotels = choices(HOTEL_CHAINS, k=count)
+    hotel_cities = choices(cities, k=count)
+    for n, trip_id in enumerate(range(first_id, first_id + count)):
+        start, length = starts[n], lengths[n]
+        trips.append({
+            'id': trip_id,
+            'destination': destinations[n],
+            'start_date': days[start],
+            'end_date': days[start + length],
+        })
+        bookings.append({
+            'flight': f"{airlines[n]} {flight_numbers[n]}",
+            'hotel': f"{hotels[n]} {hotel_cities[n]}",
+            'trip_id': trip_id,
+        })
+        per_day = choices((1, 2, 3), k=length + 1)
+        total = sum(per_day)
+        names = iter(choices(ACTIVITY_NAMES, k=total))
+        hours = iter(choices(times, k=total))
+        for day, day_count in zip(days[start:start + length + 1], per_day):
+            for _ in range(day_count):
+                activities.append({
+                    'name': next(names),
+                    'time': next(hours),
+                    'date': day,
+                    'trip_id': trip_id,
+                })
+    return trips, bookings, activities
+
+def bulk_seed(trip_count, seed=0, chunk_size=10_000, anchor=DEFAULT_ANCHOR, bind=None, report=print,
+              bulk=False):
+    """
+    Insert `trip_count` generated trips with their bookings and activities
+    Rows are built and inserted `chunk_size` trips at a time with Core
+    executemany, one transaction per chunk, so memory stays flat. The same
+    seed on an empty database always produces the same rows. Each chunk
+    takes its trip ids under BEGIN IMMEDIATE, after every id ever used
+    (archived trips included), so concurrent writers keep theirs. bulk=True
+    skips the summary and search insert triggers (see bulk_load.py).
+    Returns the total number of rows inserted
+    """
+    bind = bind if bind is not None else engine
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    cities = [fake.city() for _ in range(CITY_POOL_SIZE)]
+
+    total_rows = 0
+    started = clock.perf_counter()
+    for offset in range(0, trip_count, chunk_size):
+        count = min(chunk_size, trip_count - offset)
+        with bind.begin() as connection:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            trips, bookings, activities = generate_trip_rows(
+                count, next_trip_id(connection), rng, cities, anchor
+            )
+            for model, rows in ((Trip, trips), (Booking, bookings), (Activity, activities)):
+                with bulk_insert(connection, model.__tablename__) if bulk else nullcontext():
+                    connection.execute(insert(model), rows)
+        total_rows += len(trips) + len(bookings) + len(activities)
+        elapsed = clock.perf_counter() - started
+        report(f"{offset + count:,}/{trip_count:,} trips, {total_rows:,} rows, {total_rows / elapsed:,.0f} rows/sec")
+    return total_rows
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed the travel itinerary database")
+    parser.add_argument("--trips", type=int, help="generate this many trips in bulk instead of the 3 sample trips")
+    parser.add_argument("--seed", type=int, default=0, help="random seed; the same seed gives the same data")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="trips per insert transaction")
+    parser.add_argument("--bulk", action="store_true",
+                        help="skip the summary and search triggers, counting and indexing each chunk at once")
+    args = parser.parse_args()
+
     create_tables()
     clear_data()
-    seed_data()
+    if args.trips:
+        bulk_seed(args.trips, args.seed, args.chunk_size, bulk=args.bulk)
+    else:
+        seed_data()
     print("Database seeded successfully!")
\ No newline at end of file
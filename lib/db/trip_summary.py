@@ -0,0 +1,154 @@
+# trip_summary.py
+"""
+Per-trip aggregates kept up to date by triggers.
+
+`trip_summaries` holds one row per trip: how many activities and bookings
+it has and the dates of its first and last activity. Triggers on trips,
+activities and bookings adjust the row on every insert, update and
+delete, including Core bulk inserts and ON DELETE CASCADE, so listing
+trips with their counts never has to count children.
+
+Adding an activity only compares its date with the stored bounds. Removing
+one re-reads the bound it held from ix_activities_trip_date_time, a single
+index probe.
+"""
+# Bound expressions for an activity dated `{0}` joining the trip; min()/max()
+# with a NULL argument return NULL, hence the coalesce
+_EXTEND = """
+    activity_count = activity_count + 1,
+    first_activity = coalesce(min(first_activity, {0}.date), first_activity, {0}.date),
+    last_activity = coalesce(max(last_activity, {0}.date), last_activity, {0}.date)
+"""
+_SHRINK = """
+    activity_count = activity_count - 1,
+    first_activity = CASE WHEN {0}.date = first_activity
+        THEN (SELECT min(date) FROM activities WHERE trip_id = {0}.trip_id) ELSE first_activity END,
+    last_activity = CASE WHEN {0}.date = last_activity
+        THEN (SELECT max(date) FROM activities WHERE trip_id = {0}.trip_id) ELSE last_activity END
+"""
+
+DDL = [
+    """CREATE TRIGGER IF NOT EXISTS trips_summary_insert AFTER INSERT ON trips
+        BEGIN
+            INSERT OR IGNORE INTO trip_summaries (trip_id) VALUES (new.id);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS activities_summary_insert AFTER INSERT ON activities
+        BEGIN
+            UPDATE trip_summaries SET {_EXTEND.format('new')} WHERE trip_id = new.trip_id;
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS activities_summary_delete AFTER DELETE ON activities
+        BEGIN
+            UPDATE trip_summaries SET {_SHRINK.format('old')} WHERE trip_id = old.trip_id;
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS activities_summary_update AFTER UPDATE OF trip_id, date ON activities
+        BEGIN
+            UPDATE trip_summaries SET {_SHRINK.format('old')} WHERE trip_id = old.trip_id;
+            UPDATE trip_summaries SET {_EXTEND.format('new')} WHERE trip_id = new.trip_id;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS bookings_summary_insert AFTER INSERT ON bookings
+        BEGIN
+            UPDATE trip_summaries SET booking_count = booking_count + 1 WHERE trip_id = new.trip_id;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS bookings_summary_delete AFTER DELETE ON bookings
+        BEGIN
+            UPDATE trip_summaries SET booking_count = booking_count - 1 WHERE trip_id = old.trip_id;
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS bookings_summary_update AFTER UPDATE OF trip_id ON bookings
+        BEGIN
+            UPDATE trip_summaries SET booking_count = booking_count - 1 WHERE trip_id = old.trip_id;
+            UPDATE trip_summaries SET booking_count = booking_count + 1 WHERE trip_id = new.trip_id;
+        END""",
+]
+
+TRIGGERS = [
+    'trips_summary_insert',
+    'activities_summary_insert', 'activities_summary_delete', 'activities_summary_update',
+    'bookings_summary_insert', 'bookings_summary_delete', 'bookings_summary_update',
+]
+
+# Summaries counted from scratch for the trips selected by `where`
+EXPECTED = """
+    SELECT id AS trip_id,
+        (SELECT count(*) FROM activities WHERE trip_id = trips.id) AS activity_count,
+        (SELECT count(*) FROM bookings WHERE trip_id = trips.id) AS booking_count,
+        (SELECT min(date) FROM activities WHERE trip_id = trips.id) AS first_activity,
+        (SELECT max(date) FROM activities WHERE trip_id = trips.id) AS last_activity
+    FROM trips {where}
+"""
+IN_RANGE = "WHERE id BETWEEN ? AND ?"
+
+def fill_trip_summaries(connection, first_id, last_id):
+    """
+    Recount the trips with first_id <= id <= last_id and drop summaries of
+    deleted trips in that range; returns how many trips were recounted
+    """
+    connection.exec_driver_sql(
+        "DELETE FROM trip_summaries WHERE trip_id BETWEEN ? AND ? AND trip_id NOT IN (SELECT id FROM trips)",
+        (first_id, last_id),
+    )
+    return connection.exec_driver_sql(
+        "INSERT OR REPLACE INTO trip_summaries "
+        "(trip_id, activity_count, booking_count, first_activity, last_activity) "
+        + EXPECTED.format(where=IN_RANGE),
+        (first_id, last_id),
+    ).rowcount
+
+# What the insert trigger of each table does, for a whole id range at once
+ADD_INSERTED = {
+    'trips': "INSERT OR IGNORE INTO trip_summaries (trip_id) SELECT id FROM trips WHERE id BETWEEN ? AND ?",
+    'activities': """
+        UPDATE trip_summaries SET
+            activity_count = activity_count + added.count,
+            first_activity = coalesce(min(first_activity, added.first_day), first_activity, added.first_day),
+            last_activity = coalesce(max(last_activity, added.last_day), last_activity, added.last_day)
+        FROM (SELECT trip_id, count(*) AS count, min(date) AS first_day, max(date) AS last_day
+              FROM activities WHERE id BETWEEN ? AND ? GROUP BY trip_id) AS added
+        WHERE trip_summaries.trip_id = added.trip_id""",
+    'bookings': """
+        UPDATE trip_summaries SET booking_count = booking_count + added.count
+        FROM (SELECT trip_id, count(*) AS count
+              FROM bookings WHERE id BETWEEN ? AND ? GROUP BY trip_id) AS added
+        WHERE trip_summaries.trip_id = added.trip_id""",
+}
+
+def add_to_trip_summaries(connection, table, first_id, last_id):
+    """
+    Count the rows of `table` with first_id <= id <= last_id, inserted while
+    its summary insert trigger was dropped, into trip_summaries
+    """
+    connection.exec_driver_sql(ADD_INSERTED[table], (first_id, last_id))
+
+def stale_trip_summaries(connection, first_id, last_id):
+    """
+    Ids of trips with first_id <= id <= last_id whose summary is missing
+    or differs from a recount, plus summaries left behind by deleted trips
+    """
+    return connection.exec_driver_sql(
+        f"""SELECT expected.trip_id FROM ({EXPECTED.format(where=IN_RANGE)}) AS expected
+            LEFT JOIN trip_summaries AS stored ON stored.trip_id = expected.trip_id
+            WHERE stored.trip_id IS NULL
+               OR stored.activity_count IS NOT expected.activity_count
+               OR stored.booking_count IS NOT expected.booking_count
+               OR stored.first_activity IS NOT expected.first_activity
+               OR stored.last_activity IS NOT expected.last_activity
+            UNION ALL
+            SELECT trip_id FROM trip_summaries
+            WHERE trip_id BETWEEN ? AND ? AND trip_id NOT IN (SELECT id FROM trips)
+            ORDER BY 1""",
+        (first_id, last_id, first_id, last_id),
+    ).scalars().all()
+
+def create_trip_summaries(connection, fill=True):
+    """Create the triggers if missing, then count trips that have no summary yet"""
+    for statement in DDL:
+        connection.exec_driver_sql(statement)
+    if not fill:
+        return
+    connection.exec_driver_sql(
+        "INSERT INTO trip_summaries (trip_id, activity_count, booking_count, first_activity, last_activity) "
+        + EXPECTED.format(where="WHERE id NOT IN (SELECT trip_id FROM trip_summaries)")
+    )
+
+def drop_trip_summaries(connection):
+    for trigger in TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
@@ -1,14 +1,49 @@
-from db.models import session, Trip, Booking, Activity
+import json
+from db.models import engine
+from db.read_models import select_trips, load_trips, with_children, trips as trip_table
+from service import trip_document
+
+# Trips loaded per round trip; each batch is 3 queries however many children it has
+BATCH_SIZE = 500
+
+def iter_trips(start_id=None, end_id=None, batch_size=BATCH_SIZE):
+    """
+    Yield TripDetails in id order, bookings and activities included
+    Works in keyset batches, each on its own short connection, so memory
+    stays flat however large the database is
+    """
+    stmt = select_trips().order_by(trip_table.c.id).limit(batch_size)
+    if end_id is not None:
+        stmt = stmt.where(trip_table.c.id <= end_id)
+
+    last_id = start_id - 1 if start_id else 0
+    while True:
+        with engine.connect() as connection:
+            trips = with_children(connection, load_trips(connection, stmt.where(trip_table.c.id > last_id)))
+        if not trips:
+            return
+        yield from trips
+        last_id = trips[-1].id
+
+def dump_trips(out, start_id=None, end_id=None, batch_size=BATCH_SIZE):
+    """
+    Write one JSON document per trip (JSON Lines) to `out` as trips stream in
+    Returns the number of trips written
+    """
+    count = 0
+    for trip in iter_trips(start_id, end_id, batch_size):
+        out.write(json.dumps(trip_document(trip)) + "\n")
+        count += 1
+    return count
 
 def debug_trips():
     """Debug function to show all trips"""
-    trips = session.query(Trip).all()
-    for trip in trips:
-        print(trip)
+    for trip in iter_trips():
+        print(trip.id, trip.destination, trip.start_date, trip.end_date)
         for booking in trip.bookings:
             print("  ", booking)
         for activity in trip.activities:
             print("  ", activity)
 
 if __name__ == '__main__':
-    debug_trips()
\ No newline at end of file
+    debug_trips()
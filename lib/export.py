@@ -0,0 +1,250 @@
+"""
+Bulk export of itineraries as iCalendar (.ics) and Markdown (.md) files.
+
+    iter_itineraries -> batches of plain tuples -> process pool -> files
+
+The parent process only streams rows. Trips come in id order, `batch_size`
+at a time, with their bookings and activities fetched by one query each.
+Activities arrive already in (date, time) order from
+ix_activities_trip_date_time. Each batch is handed to a worker process
+that renders it and writes one file per trip and format, so an export
+scales with the cores until the disk becomes the limit.
+
+Rows travel as tuples of the raw SQLite values (ISO date and time
+strings), which are cheap to pickle and need no parsing to render.
+"""
+import os
+import re
+import time as clock
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import select
+from db.models import engine, Trip
+from db.read_models import walks_trips
+from db.date_index import trip_dates, join_window, window_conditions, window_trip_ids
+
+EXPORT_BATCH_SIZE = 500
+FORMATS = ('ics', 'md')
+
+# bookings: [(flight, hotel)], activities: [(id, name, date, time, duration)] in (date, time) order
+Itinerary = namedtuple('Itinerary', 'id destination start_date end_date bookings activities')
+
+def _trip_id_batches(bind, first_id, last_id, window_start, window_end, batch_size):
+    """Lists of up to `batch_size` trip ids, in id order"""
+    after_id = (first_id if first_id is not None else 0) - 1
+    walk = True
+    stmt = select(Trip.id).order_by(Trip.id).limit(batch_size)
+    if last_id is not None:
+        stmt = stmt.where(Trip.id <= last_id)
+    if window_start is not None or window_end is not None:
+        if bind.dialect.name == 'sqlite':
+            matching = window_trip_ids('overlapping', window_start, window_end).where(trip_dates.c.id > after_id)
+            with bind.connect() as connection:
+                walk = walks_trips(connection, matching, after_id, batch_size)
+            stmt = join_window(stmt, Trip.id, 'overlapping', window_start, window_end, walk)
+        else:
+            stmt = stmt.where(
+                *window_conditions('overlapping', window_start, window_end, Trip.start_date, Trip.end_date)
+            )
+    while True:
+        # "+ 0": with few matches SQLite reads them from the R*Tree, not by id
+        after = Trip.id > after_id if walk else Trip.id + 0 > after_id
+        with bind.connect() as connection:
+            trip_ids = connection.scalars(stmt.where(after)).all()
+        if not trip_ids:
+            return
+        yield trip_ids
+        after_id = trip_ids[-1]
+
+def iter_itineraries(first_id=None, last_id=None, window_start=None, window_end=None,
+                     batch_size=EXPORT_BATCH_SIZE, bind=None):
+    """
+    Yield lists of Itinerary tuples, `batch_size` trips at a time
+    Trips can be limited to an id range and to those overlapping a date window.
+    Each batch costs three indexed queries however many children it has.
+    """
+    bind = bind if bind is not None else engine
+    for trip_ids in _trip_id_batches(bind, first_id, last_id, window_start, window_end, batch_size):
+        marks = ', '.join('?' * len(trip_ids))
+        with bind.connect() as connection:
+            trips = connection.exec_driver_sql(
+                f"SELECT id, destination, start_date, end_date FROM trips WHERE id IN ({marks}) ORDER BY id",
+                tuple(trip_ids),
+            ).all()
+            bookings = {
+                trip_id: [(flight, hotel) for _, flight, hotel in rows]
+                for trip_id, rows in groupby(connection.exec_driver_sql(
+                    f"SELECT trip_id, flight, hotel FROM bookings WHERE trip_id IN ({marks}) ORDER BY trip_id, id",
+                    tuple(trip_ids),
+                ), key=itemgetter(0))
+            }
+            activities = {
+                trip_id: [row[1:] for row in rows]
+                for trip_id, rows in groupby(connection.exec_driver_sql(
+                    f"SELECT trip_id, id, name, date, time, duration FROM activities WHERE trip_id IN ({marks}) "
+                    "ORDER BY trip_id, date, time",
+                    tuple(trip_ids),
+                ), key=itemgetter(0))
+            }
+        yield [
+            Itinerary(trip_id, destination, start_date, end_date,
+                      bookings.get(trip_id, []), activities.get(trip_id, []))
+            for trip_id, destination, start_date, end_date in trips
+        ]
+
+# iCalendar (RFC 5545)
+
+_ICS_ESCAPES = str.maketrans({'\\': '\\\\', ';': '\\;', ',': '\\,', '\n': '\\n'})
+
+def _ics_fold(line):
+    """Lines longer than 75 octets continue on the next line after a space"""
+    if len(line) <= 75 and line.isascii():
+        return line
+    parts, current, size = [], '', 0
+    for char in line:
+        width = len(char.encode())
+        if size + width > (75 if not parts else 74):
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+def _ics_property(name, text):
+    """A text property, escaped and folded; the fixed-format lines need neither"""
+    text = text or ''
+    if '\\' in text or ';' in text or ',' in text or '\n' in text:
+        text = text.translate(_ICS_ESCAPES)
+    return _ics_fold(f"{name}:{text}")
+
+def _ics_day(value):
+    return value.replace('-', '')
+
+def _ics_next_day(value):
+    return (date.fromisoformat(value) + timedelta(days=1)).strftime('%Y%m%d')
+
+def render_ics(itinerary, stamp):
+    """A VCALENDAR with an all-day event for the trip and one event per activity"""
+    description = '\n'.join(
+        line for flight, hotel in itinerary.bookings
+        for line in ((f"Flight: {flight}" if flight else None), (f"Hotel: {hotel}" if hotel else None)) if line
+    )
+    location = _ics_property('LOCATION', itinerary.destination)
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Travel Itinerary Planner//EN',
+        _ics_property('X-WR-CALNAME', itinerary.destination),
+        'BEGIN:VEVENT',
+        f'UID:trip-{itinerary.id}@travel-itinerary-planner',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART;VALUE=DATE:{_ics_day(itinerary.start_date)}',
+        f'DTEND;VALUE=DATE:{_ics_next_day(itinerary.end_date)}',
+        _ics_property('SUMMARY', f'Trip to {itinerary.destination}'),
+    ]
+    if description:
+        lines.append(_ics_property('DESCRIPTION', description))
+    lines.append('END:VEVENT')
+    for activity_id, name, day, time, duration in itinerary.activities:
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:activity-{activity_id}@travel-itinerary-planner',
+            f'DTSTAMP:{stamp}',
+        ]
+        if time:
+            lines.append(f'DTSTART:{_ics_day(day)}T{time[:8].replace(":", "")}')
+            if duration:
+                lines.append(f'DURATION:PT{duration}M')
+        else:
+            lines += [f'DTSTART;VALUE=DATE:{_ics_day(day)}', f'DTEND;VALUE=DATE:{_ics_next_day(day)}']
+        lines += [_ics_property('SUMMARY', name), location, 'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(lines) + '\r\n'
+
+# Markdown
+
+_MD_SPECIAL = re.compile(r'[\\`*_\[\]<>#|]')
+_MD_ESCAPES = str.maketrans({char: '\\' + char for char in '\\`*_[]<>#|'})
+
+def _md_text(value):
+    value = value or ''
+    return value.translate(_MD_ESCAPES) if _MD_SPECIAL.search(value) else value
+
+def render_markdown(itinerary, stamp=None):
+    """The itinerary as Markdown: overview, bookings, then activities grouped by day"""
+    days = (date.fromisoformat(itinerary.end_date) - date.fromisoformat(itinerary.start_date)).days + 1
+    lines = [f"# {_md_text(itinerary.destination)}", "",
+             f"**{itinerary.start_date} to {itinerary.end_date}** ({days} days)", ""]
+    if itinerary.bookings:
+        lines += ["## Bookings", ""]
+        for flight, hotel in itinerary.bookings:
+            if flight:
+                lines.append(f"- ✈️ Flight: {_md_text(flight)}")
+            if hotel:
+                lines.append(f"- 🏨 Hotel: {_md_text(hotel)}")
+        lines.append("")
+    lines.append("## Itinerary")
+    if not itinerary.activities:
+        lines += ["", "_No activities planned yet._"]
+    for day, activities in groupby(itinerary.activities, key=itemgetter(2)):
+        lines += ["", f"### {day}", ""]
+        lines += [f"- {time[:5] if time else 'All day'} · {_md_text(name)}" + (f" ({duration} min)" if duration else "")
+                  for _, name, _, time, duration in activities]
+    return '\n'.join(lines) + '\n'
+
+RENDERERS = {'ics': render_ics, 'md': render_markdown}
+
+def export_batch(itineraries, out_dir, formats, stamp):
+    """Render and write one batch (runs in a worker process); returns (trips, bytes)"""
+    written = 0
+    for itinerary in itineraries:
+        for extension in formats:
+            data = RENDERERS[extension](itinerary, stamp).encode()
+            with open(os.path.join(out_dir, f"trip-{itinerary.id}.{extension}"), 'wb') as out:
+                out.write(data)
+            written += len(data)
+    return len(itineraries), written
+
+def export_itineraries(out_dir, formats=FORMATS, first_id=None, last_id=None, window_start=None, window_end=None,
+                       workers=None, batch_size=EXPORT_BATCH_SIZE, bind=None, report=print):
+    """
+    Write trip-<id>.ics and/or trip-<id>.md into `out_dir` for the selected trips
+    `workers` processes render batches in parallel (default: one per CPU;
+    0 or 1 renders in this process). At most two batches per worker are
+    in flight, so memory stays flat however many trips are exported.
+    Returns (trips, bytes) written.
+    """
+    unknown = set(formats) - set(RENDERERS)
+    if unknown:
+        raise ValueError(f"Unknown export format '{', '.join(sorted(unknown))}'. Choose from: {', '.join(RENDERERS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    batches = iter_itineraries(first_id, last_id, window_start, window_end, batch_size, bind)
+    totals = [0, 0]
+    started = clock.perf_counter()
+
+    def tally(result):
+        totals[0] += result[0]
+        totals[1] += result[1]
+        report(f"Exported {totals[0]:,} trips, {totals[1] / 1e6:,.1f} MB "
+               f"({totals[0] / (clock.perf_counter() - started):,.0f} trips/sec)")
+
+    if workers <= 1:
+        for batch in batches:
+            tally(export_batch(batch, out_dir, formats, stamp))
+        return tuple(totals)
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(export_batch, batch, out_dir, formats, stamp))
+            if len(pending) >= 2 * workers:
+                tally(pending.popleft().result())
+        while pending:
+            tally(pending.popleft().result())
+    return tuple(totals)
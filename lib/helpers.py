@@ -1,17 +1,95 @@
-from datetime import datetime
-from db.models import session, Trip, Activity
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from sqlalchemy import select, func
+from db.models import read_session, Trip, engine
+from db.date_index import trip_dates, join_window, window_conditions, window_trip_ids
+from db.read_models import (
+    load_trips, load_trip, load_activities, destination_ids, trip_page, walks_trips, trips as trip_table,
+)
 
 def get_trip_by_id(trip_id):
-    """Helper function to get a trip by ID"""
-    return session.query(Trip).get(trip_id)
+    """Helper function to get a trip by ID, as a TripRecord (None if unknown)"""
+    with engine.connect() as connection:
+        return load_trip(connection, trip_id)
+
+def _uses_date_index():
+    return engine.dialect.name == "sqlite"
+
+def _keyset_pages(page, page_size, last_id):
+    while True:
+        with engine.connect() as connection:
+            trips = load_trips(connection, page(last_id))
+        if not trips:
+            return
+        yield trips
+        if len(trips) < page_size:
+            return
+        last_id = trips[-1].id
+
+def iter_trip_pages(page_size=50, destination_prefix=None, window_start=None, window_end=None, after_id=0,
+                    match="overlapping"):
+    """
+    Keyset-paginate trips ordered by id
+    Returns an iterator of pages, each a list of TripRecords; raises
+    ValueError for a page_size below 1. Every page is its own
+    `WHERE id > last_id ORDER BY id LIMIT page_size` query, so fetching
+    the first page costs the same however many trips are stored
+    """
+    if page_size < 1:
+        raise ValueError("page_size must be at least 1")
+    window = window_start is not None or window_end is not None
+    # Few matches are read from their index instead of walking every trip id
+    matching = []
+    if destination_prefix:
+        matching.append(destination_ids(destination_prefix, after_id))
+    if window and _uses_date_index():
+        matching.append(window_trip_ids(match, window_start, window_end).where(trip_dates.c.id > after_id))
+    with engine.connect() as connection:
+        walk = all(walks_trips(connection, ids, after_id, page_size) for ids in matching)
+
+    def page(last_id):
+        stmt = trip_page(last_id, page_size, destination_prefix, walk)
+        if not window:
+            return stmt
+        if _uses_date_index():
+            return join_window(stmt, trip_table.c.id, match, window_start, window_end, walk)
+        return stmt.where(*window_conditions(match, window_start, window_end,
+                                             trip_table.c.start_date, trip_table.c.end_date))
+    return _keyset_pages(page, page_size, after_id)
+
+def trips_overlapping(window_start, window_end, page_size=50):
+    """Pages of trips active at any point between the two dates"""
+    return iter_trip_pages(page_size, window_start=window_start, window_end=window_end, match="overlapping")
+
+def trips_containing(window_start, window_end, page_size=50):
+    """Pages of trips active for the whole of the window"""
+    return iter_trip_pages(page_size, window_start=window_start, window_end=window_end, match="containing")
+
+def trips_upcoming(days, today=None, page_size=50):
+    """Pages of trips starting within the next `days` days"""
+    today = today or date.today()
+    return iter_trip_pages(page_size, window_start=today, window_end=today + timedelta(days=days),
+                           match="starting")
+
+def count_trips_in_window(window_start=None, window_end=None, match="overlapping"):
+    """How many trips match a window, without loading them"""
+    if _uses_date_index():
+        stmt = select(func.count()).select_from(window_trip_ids(match, window_start, window_end).subquery())
+    else:
+        stmt = select(func.count()).select_from(Trip).where(
+            *window_conditions(match, window_start, window_end, Trip.start_date, Trip.end_date)
+        )
+    with read_session() as session:
+        return session.scalar(stmt)
 
 def get_activities_for_trip(trip_id):
     """
     Helper function to get activities for a trip, sorted by date and time
-    Returns a list of activities sorted by date and time
+    Returns a list of ActivityRecords sorted by date and time
     """
-    activities = session.query(Activity).filter_by(trip_id=trip_id).all()
-    return sorted(activities, key=lambda x: (x.date, x.time))
+    # ix_activities_trip_date_time returns rows already in (date, time) order
+    with engine.connect() as connection:
+        return load_activities(connection, [trip_id])
 
 def create_daily_schedule(activities):
     """
@@ -20,23 +98,40 @@ def create_daily_schedule(activities):
     """
     schedule = {}
     for activity in activities:
-        date_str = activity.date.strftime("%Y-%m-%d")
-        if date_str not in schedule:
-            schedule[date_str] = []
-        schedule[date_str].append({
-            'time': activity.time.strftime('%H:%M'),
+        schedule.setdefault(activity.date.isoformat(), []).append({
+            # All-day activities have no time
+            'time': activity.time.isoformat('minutes') if activity.time is not None else None,
+            'duration': activity.duration,
             'name': activity.name
         })
     return schedule
 
+@lru_cache(maxsize=65536)
+def _parse_date(date_str):
+    try:
+        # Canonical YYYY-MM-DD goes through the C parser; anything else
+        # falls back to strptime so the accepted formats are unchanged
+        if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+            return date.fromisoformat(date_str)
+        return datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
 def validate_date(date_str):
     """
     Validate date format (YYYY-MM-DD)
     Returns datetime.date object if valid, None otherwise
     """
+    # Only strings reach the cache: lists and dicts are unhashable
+    return _parse_date(date_str) if isinstance(date_str, str) else None
+
+@lru_cache(maxsize=4096)
+def _parse_time(time_str):
     try:
-        return datetime.strptime(date_str, "%Y-%m-%d").date()
-    except (ValueError, TypeError):
+        if len(time_str) == 5 and time_str[2] == ':' and time_str[:2].isdigit() and time_str[3:].isdigit():
+            return time(int(time_str[:2]), int(time_str[3:]))
+        return datetime.strptime(time_str, "%H:%M").time()
+    except ValueError:
         return None
 
 def validate_time(time_str):
@@ -44,7 +139,20 @@ def validate_time(time_str):
     Validate time format (HH:MM)
     Returns datetime.time object if valid, None otherwise
     """
+    return _parse_time(time_str) if isinstance(time_str, str) else None
+
+# Largest integer a SQLite column holds
+MAX_INTEGER = 2 ** 63 - 1
+
+def validate_duration(duration):
+    """
+    Validate a duration in whole minutes ("90")
+    Returns a positive int if valid, None otherwise
+    """
+    if isinstance(duration, bool):
+        return None
     try:
-        return datetime.strptime(time_str, "%H:%M").time()
+        minutes = int(duration)
     except (ValueError, TypeError):
-        return None
\ No newline at end of file
+        return None
+    return minutes if 0 < minutes <= MAX_INTEGER else None
@@ -0,0 +1,330 @@
+"""
+Bulk import of trips, bookings and activities from CSV or JSON Lines files.
+
+Each file is streamed through a generator pipeline:
+
+    read_records -> validate -> chunked -> resolve trips -> insert
+
+Rows that fail validation are written to a reject file (one JSON object per
+line with the file, line number, reason and original record) instead of
+aborting the run. Valid rows are inserted with one executemany per chunk,
+each chunk in its own transaction. With bulk=True the summary and search
+insert triggers are skipped and each chunk is counted and indexed in one
+pass instead (see db/bulk_load.py).
+
+Columns:
+    trips       ref (optional), destination, start_date, end_date
+    activities  trip_id or trip_ref, name, date, time (optional), duration (optional, minutes)
+    bookings    trip_id or trip_ref, flight, hotel (at least one of them)
+
+`trip_ref` points at the `ref` of a trip imported in the same run;
+`trip_id` points at a trip already in the database.
+"""
+import csv
+import json
+import time as clock
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+from sqlalchemy import insert, select
+from db.bulk_load import bulk_insert
+from db.models import Trip, Booking, Activity, engine, next_trip_id
+from helpers import validate_date, validate_time, validate_duration
+
+CHUNK_SIZE = 10_000
+
+class RejectedRow(ValueError):
+    """Raised by the validators with the reason a row was rejected"""
+
+class RejectFile:
+    """Collects rejected rows as JSON Lines; opened lazily on first reject"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def write(self, source, line_no, reason, record):
+        if self._file is None:
+            self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write(json.dumps(
+            {"file": source, "line": line_no, "error": reason, "record": record},
+            default=str
+        ) + "\n")
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def read_records(path):
+    """Yield (line_no, record) from a .csv or .jsonl/.ndjson file"""
+    with open(path, newline="", encoding="utf-8") as handle:
+        if path.endswith(".csv"):
+            # DictReader line numbers count the header as line 1
+            for line_no, record in enumerate(csv.DictReader(handle), start=2):
+                yield line_no, record
+        else:
+            for line_no, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = line.rstrip("\n")
+                yield line_no, record
+
+def _text(record, field):
+    value = record.get(field)
+    if value is None or value == "":
+        return None
+    if value.__class__ is not str:
+        value = str(value)
+    return value.strip() or None
+
+def _date(record, field):
+    value = validate_date(_text(record, field))
+    if value is None:
+        raise RejectedRow(f"invalid {field} '{record.get(field)}', use YYYY-MM-DD")
+    return value
+
+def _trip_reference(record):
+    trip_id = _text(record, "trip_id")
+    if trip_id is not None:
+        if not trip_id.isdigit():
+            raise RejectedRow(f"invalid trip_id '{trip_id}'")
+        return ("id", int(trip_id))
+    trip_ref = _text(record, "trip_ref")
+    if trip_ref is None:
+        raise RejectedRow("missing trip_id or trip_ref")
+    return ("ref", trip_ref)
+
+def validate_trip(record):
+    """Same rules as add_trip"""
+    destination = _text(record, "destination")
+    if destination is None:
+        raise RejectedRow("missing destination")
+    start_date = _date(record, "start_date")
+    end_date = _date(record, "end_date")
+    if end_date < start_date:
+        raise RejectedRow("end_date is before start_date")
+    return {
+        "ref": _text(record, "ref"),
+        "destination": destination,
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+
+def validate_activity(record):
+    """Same rules as add_activity; the date window is checked once the trip is resolved"""
+    name = _text(record, "name")
+    if name is None:
+        raise RejectedRow("missing name")
+    time_str = _text(record, "time")
+    time_obj = None
+    if time_str is not None:
+        time_obj = validate_time(time_str)
+        if time_obj is None:
+            raise RejectedRow(f"invalid time '{time_str}', use HH:MM")
+    duration_str = _text(record, "duration")
+    duration = None
+    if duration_str is not None:
+        duration = validate_duration(duration_str)
+        if duration is None:
+            raise RejectedRow(f"invalid duration '{duration_str}', use whole minutes")
+        if time_obj is None:
+            raise RejectedRow("duration needs a time")
+    return {
+        "trip": _trip_reference(record),
+        "name": name,
+        "date": _date(record, "date"),
+        "time": time_obj,
+        "duration": duration,
+    }
+
+def validate_booking(record):
+    """Same rules as add_booking"""
+    flight = _text(record, "flight")
+    hotel = _text(record, "hotel")
+    if flight is None and hotel is None:
+        raise RejectedRow("booking has neither flight nor hotel")
+    return {"trip": _trip_reference(record), "flight": flight, "hotel": hotel}
+
+VALIDATORS = {
+    "trips": validate_trip,
+    "activities": validate_activity,
+    "bookings": validate_booking,
+}
+
+def validated(records, validator, source, rejects):
+    """Yield (line_no, record, row) for valid records, rejecting the rest"""
+    for line_no, record in records:
+        try:
+            if not isinstance(record, dict):
+                raise RejectedRow("not a JSON object")
+            yield line_no, record, validator(record)
+        except RejectedRow as error:
+            rejects.write(source, line_no, str(error), record)
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+@lru_cache(maxsize=None)
+def _storage_format(column):
+    """
+    SQLAlchemy's bind processor for a column, memoized per value
+    Dates and times repeat heavily in an import, so each distinct value is
+    converted to its SQLite storage format once
+    """
+    process = column.type.dialect_impl(engine.dialect).bind_processor(engine.dialect)
+    if process is None:
+        return None
+    return lru_cache(maxsize=65536)(process)
+
+def executemany(connection, table, rows):
+    """
+    Insert dict rows with a single DBAPI executemany
+    Values are converted to their storage format up front, which skips
+    SQLAlchemy's per-row parameter processing
+    """
+    compiled = insert(table).compile(dialect=connection.dialect, column_keys=list(rows[0]))
+    names = compiled.positiontup
+    converters = [_storage_format(table.c[name]) for name in names]
+    params = [
+        tuple(
+            value if convert is None or value is None else convert(value)
+            for value, convert in zip((row[name] for name in names), converters)
+        )
+        for row in rows
+    ]
+    connection.exec_driver_sql(str(compiled), params)
+
+class Importer:
+    """
+    Runs imports against one database and remembers the trips it created,
+    so activity and booking files can refer to them by `trip_ref`
+    """
+
+    def __init__(self, rejects, chunk_size=CHUNK_SIZE, bind=None, bulk=False):
+        self.bind = bind if bind is not None else engine
+        self.rejects = rejects
+        self.chunk_size = chunk_size
+        self.bulk = bulk
+        # ref/id -> (trip id, start_date, end_date)
+        self.trips_by_ref = {}
+        self.trips_by_id = {}
+
+    def _load_trips(self, connection, trip_ids):
+        """Fetch the date windows of database trips not seen yet"""
+        missing = [trip_id for trip_id in trip_ids if trip_id not in self.trips_by_id]
+        if not missing:
+            return
+        rows = connection.execute(
+            select(Trip.id, Trip.start_date, Trip.end_date).where(Trip.id.in_(missing))
+        )
+        for trip_id, start_date, end_date in rows:
+            self.trips_by_id[trip_id] = (trip_id, start_date, end_date)
+
+    def _resolve(self, connection, chunk, source):
+        """
+        Swap each row's trip reference for a trip id, rejecting unknown trips
+        Returns (line_no, record, row, trip) tuples
+        """
+        self._load_trips(connection, {row["trip"][1] for _, _, row in chunk if row["trip"][0] == "id"})
+        resolved = []
+        for line_no, record, row in chunk:
+            kind, key = row.pop("trip")
+            trip = (self.trips_by_id if kind == "id" else self.trips_by_ref).get(key)
+            if trip is None:
+                self.rejects.write(source, line_no, f"unknown trip {kind} '{key}'", record)
+                continue
+            row["trip_id"] = trip[0]
+            resolved.append((line_no, record, row, trip))
+        return resolved
+
+    def _insert_trips(self, connection, chunk, source):
+        # Read under the chunk's write lock, so no other writer can take these ids first
+        trip_id = next_trip_id(connection)
+        rows = []
+        for line_no, record, row in chunk:
+            ref = row.pop("ref")
+            if ref is not None and ref in self.trips_by_ref:
+                self.rejects.write(source, line_no, f"duplicate ref '{ref}'", record)
+                continue
+            row["id"] = trip_id
+            trip_id += 1
+            if ref is not None:
+                self.trips_by_ref[ref] = (row["id"], row["start_date"], row["end_date"])
+            rows.append(row)
+        if rows:
+            executemany(connection, Trip.__table__, rows)
+        return len(rows)
+
+    def _insert_activities(self, connection, chunk, source):
+        rows = []
+        for line_no, record, row, (_, start_date, end_date) in self._resolve(connection, chunk, source):
+            if not start_date <= row["date"] <= end_date:
+                self.rejects.write(
+                    source, line_no, f"date must be between {start_date} and {end_date}", record
+                )
+                continue
+            rows.append(row)
+        if rows:
+            # Inserting in index order keeps ix_activities_trip_date_time page writes local
+            rows.sort(key=itemgetter("trip_id", "date"))
+            executemany(connection, Activity.__table__, rows)
+        return len(rows)
+
+    def _insert_bookings(self, connection, chunk, source):
+        rows = [row for _, _, row, _ in self._resolve(connection, chunk, source)]
+        if rows:
+            executemany(connection, Booking.__table__, rows)
+        return len(rows)
+
+    def import_file(self, kind, path, report=print):
+        """
+        Stream one file of `kind` ('trips', 'activities' or 'bookings')
+        into the database. Returns the number of rows inserted
+        """
+        writer = {
+            "trips": self._insert_trips,
+            "activities": self._insert_activities,
+            "bookings": self._insert_bookings,
+        }[kind]
+        rows = validated(read_records(path), VALIDATORS[kind], path, self.rejects)
+
+        inserted = 0
+        started = clock.perf_counter()
+        for chunk in chunked(rows, self.chunk_size):
+            with self.bind.begin() as connection:
+                # The write lock up front, so another writer cannot slip in
+                # between reading trips and inserting
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+                with bulk_insert(connection, kind) if self.bulk else nullcontext():
+                    inserted += writer(connection, chunk, path)
+        elapsed = clock.perf_counter() - started
+        report(f"{kind}: {inserted:,} rows from {path} in {elapsed:.2f}s "
+               f"({inserted / elapsed if elapsed else 0:,.0f} rows/sec)")
+        return inserted
+
+def import_files(trips=None, activities=None, bookings=None, rejects_path="rejects.jsonl",
+                 chunk_size=CHUNK_SIZE, report=print, bulk=False):
+    """Import trips first so activities and bookings can reference them"""
+    rejects = RejectFile(rejects_path)
+    try:
+        importer = Importer(rejects, chunk_size, bulk=bulk)
+        totals = {}
+        for kind, path in (("trips", trips), ("activities", activities), ("bookings", bookings)):
+            if path:
+                totals[kind] = importer.import_file(kind, path, report)
+    finally:
+        rejects.close()
+    if rejects.count:
+        report(f"{rejects.count:,} rejected rows written to {rejects_path}")
+    return totals
@@ -0,0 +1,139 @@
+"""
+Query instrumentation: what SQL each command sends, and how long it takes.
+
+Hooks before_cursor_execute/after_cursor_execute on an engine and books
+every statement against the command running at the time:
+
+    with instrumentation.command("Trip Details"):
+        trip_details()
+
+For each command it keeps the number of statements, the time spent in the
+database and, per distinct statement text, how often it ran and for how
+long. Statements slower than `slow_ms` are passed to `log` as they finish.
+
+A statement text that runs `repeat_threshold` times or more on one
+connection checkout (one session transaction, one `with engine.connect()`)
+is reported as a suspected N+1: the same query issued once per row of an
+earlier result, where one IN (...) or join would do. Keyset pages and
+id-range chunks repeat a statement too, but each page or chunk checks out
+its own connection, so they are not counted. A loop that does repeat a
+statement on one connection on purpose can run it with the execution
+option batched=True.
+
+Statements are SQL with placeholders, so "identical" means the same query
+shape with any parameters. An executemany counts as one statement.
+"""
+import time as clock
+from collections import defaultdict
+from contextlib import contextmanager
+from sqlalchemy import event
+
+SLOW_MS = 100
+REPEAT_THRESHOLD = 10
+NO_COMMAND = "(outside commands)"
+# Per-checkout statement counts, kept in the pooled connection's info
+_REPEATS = "instrumentation_repeats"
+
+class StatementStats:
+    __slots__ = ("count", "seconds", "slowest")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+
+class CommandStats:
+    """Totals for one command, accumulated over every time it ran"""
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.wall_seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slow = 0
+        self.statements = defaultdict(StatementStats)
+        # Statements repeated on one connection, and the most repeats seen
+        self.repeated = {}
+
+class Instrumentation:
+    """
+    Collects per-command statement counts and timings from an engine
+    Call install() to start listening and remove() to stop.
+    """
+
+    def __init__(self, engine, slow_ms=SLOW_MS, repeat_threshold=REPEAT_THRESHOLD, log=None):
+        self.engine = engine
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.log = log
+        self.commands = {}
+        self._current = None
+
+    def install(self):
+        event.listen(self.engine, "checkout", self._checkout)
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        event.listen(self.engine, "after_cursor_execute", self._after)
+        return self
+
+    def remove(self):
+        event.remove(self.engine, "checkout", self._checkout)
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+
+    def _stats(self, name):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats(name)
+        return stats
+
+    @contextmanager
+    def command(self, name):
+        """Book the statements sent inside the block against `name`"""
+        outer = self._current
+        self._current = stats = self._stats(name)
+        started = clock.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.runs += 1
+            stats.wall_seconds += clock.perf_counter() - started
+            self._current = outer
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info[_REPEATS] = defaultdict(int)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(clock.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = clock.perf_counter() - conn.info["query_started"].pop()
+        stats = self._current or self._stats(NO_COMMAND)
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        statement_stats = stats.statements[statement]
+        statement_stats.count += 1
+        statement_stats.seconds += elapsed
+        statement_stats.slowest = max(statement_stats.slowest, elapsed)
+        if not context.execution_options.get("batched"):
+            repeats = conn.info.setdefault(_REPEATS, defaultdict(int))
+            repeats[statement] += 1
+            if repeats[statement] >= self.repeat_threshold:
+                stats.repeated[statement] = max(repeats[statement], stats.repeated.get(statement, 0))
+        if elapsed * 1000 >= self.slow_ms:
+            stats.slow += 1
+            if self.log is not None:
+                self.log(f"Slow query ({elapsed * 1000:,.1f} ms) in {stats.name}: "
+                         f"{' '.join(statement.split())} {_short(parameters)}")
+
+    def suspected_n_plus_one(self):
+        """[(command, statement, most repeats on one connection)], most repeats first"""
+        return sorted(
+            ((stats.name, statement, count)
+             for stats in self.commands.values() for statement, count in stats.repeated.items()),
+            key=lambda found: found[2], reverse=True,
+        )
+
+def _short(parameters, limit=120):
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit - 3] + "..."
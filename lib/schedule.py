@@ -0,0 +1,198 @@
+"""
+Conflicts and free time in trip schedules, found with one sweep per trip.
+
+An activity with a time takes up [start, start + duration). One without a
+duration counts as `default_minutes` long, and all-day activities (no
+time) are left out. Activities come out of ix_activities_trip_date_time
+already in start order, so sorting them is a single pass, and a sweep
+that keeps only the latest end seen so far finds every overlap:
+
+    conflicts(activities)     runs of activities that overlap each other
+    free_slots(...)           the first gaps of at least `minutes` within
+                              each trip day's hours, in date order
+
+Both are O(n log n) in the number of activities; pairs are never compared.
+
+For many trips, iter_schedules() streams (trip, activities) in trip id
+batches, each batch two range queries on its own short connection, and
+the reports write one JSON line per trip or conflict as they go, so a
+report over millions of trips runs in flat memory.
+"""
+import json
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+from operator import attrgetter, itemgetter
+from sqlalchemy import select
+from db.models import engine
+from db.read_models import ActivityRecord, trips as trip_table
+
+DEFAULT_MINUTES = 60
+DAY_START = time(8, 0)
+DAY_END = time(22, 0)
+SLOT_COUNT = 5
+BATCH_SIZE = 1000
+
+# A run of overlapping activities: from the first start to the last end
+Conflict = namedtuple('Conflict', 'trip_id start end activities')
+FreeSlot = namedtuple('FreeSlot', 'start end')
+Interval = namedtuple('Interval', 'start end activity')
+TripDates = namedtuple('TripDates', 'id start_date end_date')
+
+def intervals(activities, default_minutes=DEFAULT_MINUTES):
+    """Intervals of the timed activities, in start order"""
+    return sorted(
+        (Interval(start, start + timedelta(minutes=activity.duration or default_minutes), activity)
+         for activity in activities if activity.time is not None
+         for start in (datetime.combine(activity.date, activity.time),)),
+        key=attrgetter('start'),
+    )
+
+def conflicts(activities, default_minutes=DEFAULT_MINUTES):
+    """
+    Conflicts among one trip's activities
+    An activity that starts before every earlier one has ended joins their
+    run; one that ends exactly as the next starts does not clash.
+    """
+    found = []
+    run = []
+    run_end = None
+    for interval in intervals(activities, default_minutes) + [None]:
+        if run and (interval is None or interval.start >= run_end):
+            if len(run) > 1:
+                found.append(Conflict(run[0].activity.trip_id, run[0].start, run_end,
+                                      [placed.activity for placed in run]))
+            run = []
+        if interval is not None:
+            run_end = max(run_end, interval.end) if run else interval.end
+            run.append(interval)
+    return found
+
+def busy_periods(activities, default_minutes=DEFAULT_MINUTES):
+    """Merged (start, end) periods during which some activity is on"""
+    merged = []
+    for interval in intervals(activities, default_minutes):
+        if merged and interval.start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], interval.end)
+        else:
+            merged.append([interval.start, interval.end])
+    return merged
+
+def free_slots(start_date, end_date, activities, minutes, count=SLOT_COUNT, day_start=DAY_START,
+               day_end=DAY_END, default_minutes=DEFAULT_MINUTES):
+    """
+    The first `count` free gaps at least `minutes` long, between `day_start`
+    and `day_end` on each day from `start_date` to `end_date`
+    """
+    if day_end <= day_start:
+        raise ValueError("day_end must be after day_start")
+    busy = busy_periods(activities, default_minutes)
+    length = timedelta(minutes=minutes)
+    slots = []
+    first = 0
+    day = start_date
+    while day <= end_date and len(slots) < count:
+        cursor = datetime.combine(day, day_start)
+        closes = datetime.combine(day, day_end)
+        # Periods are in order, so those over before today never matter again
+        while first < len(busy) and busy[first][1] <= cursor:
+            first += 1
+        index = first
+        while index < len(busy) and busy[index][0] < closes and len(slots) < count:
+            if busy[index][0] - cursor >= length:
+                slots.append(FreeSlot(cursor, busy[index][0]))
+            cursor = max(cursor, busy[index][1])
+            index += 1
+        if closes - cursor >= length and len(slots) < count:
+            slots.append(FreeSlot(cursor, closes))
+        day += timedelta(days=1)
+    return slots
+
+# Timed activities of a trip id range, straight off ix_activities_trip_date_time
+ACTIVITY_RANGE = (
+    "SELECT id, trip_id, name, date, time, duration FROM activities "
+    "WHERE time IS NOT NULL AND trip_id BETWEEN ? AND ? ORDER BY trip_id, date, time"
+)
+
+def _activity(row):
+    # The raw ISO text through fromisoformat costs about half of SQLAlchemy's
+    # result processing, which dominates a scan of millions of rows
+    activity_id, trip_id, name, day, start, duration = row
+    return ActivityRecord(activity_id, trip_id, name, date.fromisoformat(day), time.fromisoformat(start), duration)
+
+def iter_schedules(first_id=None, last_id=None, batch_size=BATCH_SIZE):
+    """
+    Yield (TripDates, [ActivityRecord]) for trips in id order, timed
+    activities only, `batch_size` trips per round trip
+    """
+    trip_stmt = select(trip_table.c.id, trip_table.c.start_date, trip_table.c.end_date) \
+        .order_by(trip_table.c.id).limit(batch_size)
+    if last_id is not None:
+        trip_stmt = trip_stmt.where(trip_table.c.id <= last_id)
+
+    after_id = first_id - 1 if first_id else 0
+    while True:
+        with engine.connect() as connection:
+            trips = list(map(TripDates._make, connection.execute(trip_stmt.where(trip_table.c.id > after_id))))
+            if not trips:
+                return
+            # One range scan for the whole batch
+            rows = connection.exec_driver_sql(ACTIVITY_RANGE, (trips[0].id, trips[-1].id)).all()
+        by_trip = {trip_id: list(map(_activity, group)) for trip_id, group in groupby(rows, itemgetter(1))}
+        for trip in trips:
+            yield trip, by_trip.get(trip.id, [])
+        after_id = trips[-1].id
+
+def _minute(value):
+    return value.isoformat(sep=' ', timespec='minutes')
+
+def conflict_document(conflict, default_minutes=DEFAULT_MINUTES):
+    return {
+        "trip_id": conflict.trip_id,
+        "start": _minute(conflict.start),
+        "end": _minute(conflict.end),
+        "activities": [
+            {"id": activity.id, "name": activity.name,
+             "start": _minute(datetime.combine(activity.date, activity.time)),
+             "minutes": activity.duration or default_minutes}
+            for activity in conflict.activities
+        ],
+    }
+
+def slot_document(slot):
+    return {"start": _minute(slot.start), "end": _minute(slot.end),
+            "minutes": int((slot.end - slot.start).total_seconds() // 60)}
+
+def write_conflicts(out, first_id=None, last_id=None, default_minutes=DEFAULT_MINUTES,
+                    batch_size=BATCH_SIZE, report=None):
+    """
+    Write one JSON line per conflict as the trips stream past
+    Returns (trips checked, conflicts found)
+    """
+    checked = found = 0
+    for trip, activities in iter_schedules(first_id, last_id, batch_size):
+        for conflict in conflicts(activities, default_minutes):
+            out.write(json.dumps(conflict_document(conflict, default_minutes)) + "\n")
+            found += 1
+        checked += 1
+        if report is not None and checked % (batch_size * 10) == 0:
+            report(f"Checked {checked:,} trips, {found:,} conflicts")
+    return checked, found
+
+def write_free_slots(out, minutes, count=SLOT_COUNT, day_start=DAY_START, day_end=DAY_END,
+                     first_id=None, last_id=None, default_minutes=DEFAULT_MINUTES,
+                     batch_size=BATCH_SIZE, report=None):
+    """
+    Write one JSON line per trip with its first free slots
+    Returns (trips checked, trips with at least one slot)
+    """
+    checked = with_slots = 0
+    for trip, activities in iter_schedules(first_id, last_id, batch_size):
+        slots = free_slots(trip.start_date, trip.end_date, activities, minutes, count,
+                           day_start, day_end, default_minutes)
+        out.write(json.dumps({"trip_id": trip.id, "slots": [slot_document(slot) for slot in slots]}) + "\n")
+        checked += 1
+        with_slots += bool(slots)
+        if report is not None and checked % (batch_size * 10) == 0:
+            report(f"Checked {checked:,} trips")
+    return checked, with_slots
@@ -0,0 +1,252 @@
+"""
+Local HTTP/JSON API over AsyncItineraryService, for scripts and load tests.
+
+A small asyncio HTTP/1.1 server (keep-alive, JSON bodies) that only
+listens on localhost by default. Each connection is a task, so thousands
+of concurrent requests cost no threads; reads share the async engine's
+connection pool and writes are serialized by the service.
+
+    GET    /trips?after_id=0&limit=50&destination=Par   page of trips with counts
+    POST   /trips                     {"destination", "start_date", "end_date"}
+    GET    /trips/<id>                trip with bookings and activities
+    PATCH  /trips/<id>                any of destination, start_date, end_date
+    DELETE /trips/<id>
+    POST   /trips/<id>/activities     {"name", "date", "time", "duration"}
+    POST   /trips/<id>/activities/recurring
+                                      {"name", "time", "duration", "every", "weekdays", "starts", "until"}
+    POST   /trips/<id>/bookings       {"flight", "hotel"}
+    GET    /trips/<id>/conflicts      overlapping activities
+    GET    /trips/<id>/free-slots?minutes=90&count=5&day_start=08:00&day_end=22:00
+    GET    /search?q=louvre&limit=20  trips ranked by full-text match
+
+    python server.py --port 8080
+"""
+import re
+import json
+import asyncio
+import argparse
+from urllib.parse import urlsplit, parse_qs
+from service import (
+    AsyncItineraryService, ServiceError, TripNotFound, PAGE_SIZE, SEARCH_LIMIT, recurrence,
+    trip_summary, summary_document, trip_document, activity_document, booking_document,
+)
+from helpers import MAX_INTEGER
+from schedule import DEFAULT_MINUTES, SLOT_COUNT, conflict_document, slot_document
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+MAX_BODY = 1024 * 1024
+MAX_PAGE_SIZE = 1000
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _int(query, name, default):
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError:
+        raise HTTPError(400, f"{name} must be a number")
+    if abs(value) > MAX_INTEGER:
+        raise HTTPError(400, f"{name} is out of range")
+    return value
+
+def _limit(query, name, default):
+    value = _int(query, name, default)
+    if not 1 <= value <= MAX_PAGE_SIZE:
+        raise HTTPError(400, f"{name} must be between 1 and {MAX_PAGE_SIZE}")
+    return value
+
+async def list_trips(service, query, body):
+    limit = _limit(query, "limit", PAGE_SIZE)
+    trips = await service.list_trips(_int(query, "after_id", 0), limit, query.get("destination", [None])[0])
+    return 200, {
+        "trips": [{**trip_summary(trip), **summary_document(trip)} for trip in trips],
+        "next_after_id": trips[-1].id if trips and len(trips) == limit else None,
+    }
+
+async def create_trip(service, query, body):
+    trip = await service.create_trip(body.get("destination"), body.get("start_date"), body.get("end_date"))
+    return 201, trip_summary(trip)
+
+async def get_trip(service, query, body, trip_id):
+    return 200, trip_document(await service.trip_details(trip_id))
+
+async def update_trip(service, query, body, trip_id):
+    trip = await service.update_trip(trip_id, body.get("destination"), body.get("start_date"), body.get("end_date"))
+    return 200, trip_summary(trip)
+
+async def delete_trip(service, query, body, trip_id):
+    await service.delete_trip(trip_id)
+    return 200, {"deleted": trip_id}
+
+async def add_activity(service, query, body, trip_id):
+    activity = await service.add_activity(trip_id, body.get("name"), body.get("date"), body.get("time"),
+                                          body.get("duration"))
+    return 201, activity_document(activity)
+
+async def add_recurring_activity(service, query, body, trip_id):
+    rule = recurrence(body.get("every", 1), body.get("weekdays"), body.get("starts"), body.get("until"))
+    added = await service.add_recurring_activity(trip_id, body.get("name"), rule, body.get("time"),
+                                                 body.get("duration"))
+    return 201, {"trip_id": trip_id, "added": added}
+
+async def add_booking(service, query, body, trip_id):
+    booking = await service.add_booking(trip_id, body.get("flight"), body.get("hotel"))
+    return 201, booking_document(booking)
+
+async def conflicts(service, query, body, trip_id):
+    default_minutes = _int(query, "default_minutes", DEFAULT_MINUTES)
+    found = await service.trip_conflicts(trip_id, default_minutes)
+    return 200, {"trip_id": trip_id, "conflicts": [conflict_document(conflict, default_minutes) for conflict in found]}
+
+async def free_slots(service, query, body, trip_id):
+    slots = await service.free_slots(
+        trip_id, query.get("minutes", [None])[0], _limit(query, "count", SLOT_COUNT),
+        query.get("day_start", [None])[0], query.get("day_end", [None])[0],
+        _int(query, "default_minutes", DEFAULT_MINUTES),
+    )
+    return 200, {"trip_id": trip_id, "slots": [slot_document(slot) for slot in slots]}
+
+async def search(service, query, body):
+    text = query.get("q", [""])[0]
+    results = await service.search_trips(text, _limit(query, "limit", SEARCH_LIMIT))
+    return 200, {"results": [
+        {**trip_summary(trip), "matches": [{"field": field, "value": value} for field, value in matches]}
+        for trip, matches in results
+    ]}
+
+ROUTES = [
+    (re.compile(r"/trips"), {"GET": list_trips, "POST": create_trip}),
+    (re.compile(r"/trips/(\d+)"), {"GET": get_trip, "PATCH": update_trip, "DELETE": delete_trip}),
+    (re.compile(r"/trips/(\d+)/activities"), {"POST": add_activity}),
+    (re.compile(r"/trips/(\d+)/activities/recurring"), {"POST": add_recurring_activity}),
+    (re.compile(r"/trips/(\d+)/bookings"), {"POST": add_booking}),
+    (re.compile(r"/trips/(\d+)/conflicts"), {"GET": conflicts}),
+    (re.compile(r"/trips/(\d+)/free-slots"), {"GET": free_slots}),
+    (re.compile(r"/search"), {"GET": search}),
+]
+
+async def dispatch(service, method, target, body):
+    """Route one request; returns (status, JSON-ready payload)"""
+    url = urlsplit(target)
+    for pattern, handlers in ROUTES:
+        match = pattern.fullmatch(url.path.rstrip("/") or "/")
+        if match is None:
+            continue
+        handler = handlers.get(method)
+        if handler is None:
+            raise HTTPError(405, f"{method} is not supported on {url.path}")
+        if body:
+            try:
+                body = json.loads(body)
+            except ValueError:
+                raise HTTPError(400, "Request body is not valid JSON")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "Request body must be a JSON object")
+        else:
+            body = {}
+        trip_ids = [int(group) for group in match.groups()]
+        for trip_id in trip_ids:
+            # Too large for SQLite, so no trip has it
+            if trip_id > MAX_INTEGER:
+                raise TripNotFound(trip_id)
+        return await handler(service, parse_qs(url.query), body, *trip_ids)
+    raise HTTPError(404, f"No route for {url.path}")
+
+async def read_request(reader):
+    """(method, target, headers, body), or None once the client has gone"""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise HTTPError(413, "Request body is too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+def response(status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    head = (
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+class Server:
+    def __init__(self, service, log=print):
+        self.service = service
+        self.log = log
+
+    async def handle(self, reader, writer):
+        """Serve requests on one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as error:
+                    writer.write(response(error.status, {"error": str(error)}, False))
+                    break
+                except (ValueError, asyncio.IncompleteReadError):
+                    writer.write(response(400, {"error": "Malformed request"}, False))
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    status, payload = await dispatch(self.service, method, target, body)
+                except HTTPError as error:
+                    status, payload = error.status, {"error": str(error)}
+                except TripNotFound as error:
+                    status, payload = 404, {"error": str(error)}
+                except ServiceError as error:
+                    status, payload = 400, {"error": str(error)}
+                except Exception as error:
+                    self.log(f"{method} {target} failed: {error!r}")
+                    status, payload = 500, {"error": "Internal server error"}
+                writer.write(response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, log=print):
+    from db.models import engine, ensure_schema
+
+    ensure_schema(engine)
+    service = AsyncItineraryService()
+    server = await asyncio.start_server(Server(service, log).handle, host, port, backlog=1024)
+    log(f"Serving the itinerary API on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local JSON API for the itinerary")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
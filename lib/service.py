@@ -0,0 +1,545 @@
+"""
+The itinerary business rules, without any prompts.
+
+Every operation is a plain function of an ORM session, so the same code
+runs behind both front ends:
+
+    ItineraryService        blocking calls, used by the interactive menu
+    AsyncItineraryService   asyncio calls on an aiosqlite engine, used by server.py
+
+Bad input raises ServiceError (TripNotFound for unknown trips) with a
+message meant for the user. Reads return the named tuples from
+db/read_models.py; writes return ORM objects.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import date as date_type, time as time_type
+from sqlalchemy import select, delete, func, and_, text as text_sql
+from db.models import Trip, Booking, Activity, TripSummary, session_scope, read_session, data_version
+from db.read_models import (
+    select_trips, load_trips, load_trip, load_trip_detail, load_activities, destination_starts_with,
+    destination_ids, trip_page, walks_trips, trips as trip_table,
+)
+from db.date_index import window_trip_ids
+from db.recurrence import WEEKDAY_NAMES, expand_recurrence
+from db.search_index import FIELDS, match_expression
+from helpers import validate_date, validate_time, validate_duration
+import schedule
+
+PAGE_SIZE = 50
+SEARCH_LIMIT = 20
+CACHE_SIZE = 256
+
+class ServiceError(ValueError):
+    """Raised with a message that can be shown to the user as is"""
+
+class TripNotFound(ServiceError):
+    def __init__(self, trip_id):
+        super().__init__(f"No trip found with ID {trip_id}")
+        self.trip_id = trip_id
+
+def _date(value, field):
+    if isinstance(value, date_type):
+        return value
+    parsed = validate_date(value)
+    if parsed is None:
+        raise ServiceError(f"Invalid {field} '{value}'. Please use YYYY-MM-DD.")
+    return parsed
+
+def _time(value):
+    if value is None or value == "" or isinstance(value, time_type):
+        return value or None
+    parsed = validate_time(value)
+    if parsed is None:
+        raise ServiceError(f"Invalid time '{value}'. Please use HH:MM.")
+    return parsed
+
+def _duration(value, time):
+    if value is None or value == "":
+        return None
+    minutes = validate_duration(value)
+    if minutes is None:
+        raise ServiceError(f"Invalid duration '{value}'. Please give whole minutes, such as 90.")
+    if time is None:
+        raise ServiceError("A duration needs a start time")
+    return minutes
+
+def _text(value, field):
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ServiceError(f"{field} must be text")
+    return value.strip() or None
+
+def _trip(session, trip_id):
+    trip = session.get(Trip, trip_id)
+    if trip is None:
+        raise TripNotFound(trip_id)
+    return trip
+
+# Operations: each takes a session and leaves committing to the caller
+
+def get_trip(session, trip_id):
+    """The trip's TripRecord"""
+    trip = load_trip(session, trip_id)
+    if trip is None:
+        raise TripNotFound(trip_id)
+    return trip
+
+def list_trips(session, after_id=0, limit=PAGE_SIZE, destination=None):
+    """One keyset page of TripRecords ordered by id, summaries included"""
+    walk = not destination or walks_trips(session, destination_ids(destination, after_id), after_id, limit)
+    return load_trips(session, trip_page(after_id, limit, destination, walk))
+
+def trip_details(session, trip_id):
+    """The trip's TripDetail, with its bookings and activities"""
+    trip = load_trip_detail(session, trip_id)
+    if trip is None:
+        raise TripNotFound(trip_id)
+    return trip
+
+# Destination hits are few and ranked by bm25. Activity and booking names
+# repeat across thousands of trips, where ranking every hit costs more than
+# it tells apart, so those come newest first and the scan stops early
+SEARCH_TIERS = (
+    ("{destination}", "rank"),
+    ("{activity flight hotel}", "rowid DESC"),
+)
+
+def search_trips(session, text, limit=SEARCH_LIMIT):
+    """
+    Full-text search over destinations, activity names and booking details
+    Returns up to `limit` (trip, matches) pairs, trips whose destination
+    matches first, where `matches` lists the (field, value) pairs found
+    """
+    query = match_expression(text)
+    if not query:
+        return []
+    matches = {}
+    for columns, order in SEARCH_TIERS:
+        # Several rows can belong to one trip, so fetch more rows than trips wanted
+        rows = session.execute(
+            text_sql(f"SELECT trip_id, {', '.join(FIELDS)} FROM trip_search "
+                     f"WHERE trip_search MATCH :query ORDER BY {order} LIMIT :rows"),
+            {"query": f"{columns} : ({query})", "rows": limit * 10},
+        )
+        for trip_id, *values in rows:
+            if trip_id not in matches:
+                if len(matches) == limit:
+                    continue
+                matches[trip_id] = []
+            for found in zip(FIELDS, values):
+                if found[1] is not None and found not in matches[trip_id]:
+                    matches[trip_id].append(found)
+        if len(matches) == limit:
+            break
+
+    trips = {trip.id: trip for trip in load_trips(session, select_trips().where(trip_table.c.id.in_(matches)))}
+    return [(trips[trip_id], found) for trip_id, found in matches.items() if trip_id in trips]
+
+def count_children(session, trip_id):
+    """(activity_count, booking_count), read from the trip's summary row"""
+    counts = session.execute(
+        select(TripSummary.activity_count, TripSummary.booking_count).where(TripSummary.trip_id == trip_id)
+    ).first()
+    if counts is None:
+        raise TripNotFound(trip_id)
+    return tuple(counts)
+
+def _count(value, field):
+    if value is None or value == "":
+        raise ServiceError(f"{field} is required")
+    count = validate_duration(value)
+    if count is None:
+        raise ServiceError(f"{field} must be a whole number above 0, not '{value}'")
+    return count
+
+def trip_conflicts(session, trip_id, default_minutes=schedule.DEFAULT_MINUTES):
+    """Runs of overlapping activities, as schedule.Conflict tuples in time order"""
+    get_trip(session, trip_id)
+    return schedule.conflicts(load_activities(session, [trip_id]), _count(default_minutes, "Default minutes"))
+
+def free_slots(session, trip_id, minutes, count=schedule.SLOT_COUNT, day_start=None, day_end=None,
+               default_minutes=schedule.DEFAULT_MINUTES):
+    """
+    The trip's first `count` free gaps of at least `minutes`, as
+    schedule.FreeSlot tuples, looking only between day_start and day_end
+    """
+    trip = get_trip(session, trip_id)
+    day_start = _time(day_start) or schedule.DAY_START
+    day_end = _time(day_end) or schedule.DAY_END
+    if day_end <= day_start:
+        raise ServiceError("The day must end after it starts")
+    return schedule.free_slots(
+        trip.start_date, trip.end_date, load_activities(session, [trip_id]), _count(minutes, "Minutes"),
+        _count(count, "Slot count"), day_start, day_end, _count(default_minutes, "Default minutes"),
+    )
+
+def create_trip(session, destination, start_date, end_date):
+    destination = _text(destination, "Destination")
+    if destination is None:
+        raise ServiceError("Destination is required")
+    start_date = _date(start_date, "start date")
+    end_date = _date(end_date, "end date")
+    if end_date < start_date:
+        raise ServiceError("End date must be after start date")
+    trip = Trip(destination=destination, start_date=start_date, end_date=end_date)
+    session.add(trip)
+    session.flush()
+    return trip
+
+def update_trip(session, trip_id, destination=None, start_date=None, end_date=None):
+    """Change the given fields; None keeps the current value"""
+    trip = _trip(session, trip_id)
+    start_date = trip.start_date if start_date is None else _date(start_date, "start date")
+    end_date = trip.end_date if end_date is None else _date(end_date, "end date")
+    if end_date < start_date:
+        raise ServiceError("End date must be after start date")
+    trip.destination = _text(destination, "Destination") or trip.destination
+    trip.start_date = start_date
+    trip.end_date = end_date
+    session.flush()
+    return trip
+
+def delete_trip(session, trip_id):
+    """Activities and bookings go with it through ON DELETE CASCADE"""
+    if session.execute(delete(Trip).where(Trip.id == trip_id)).rowcount == 0:
+        raise TripNotFound(trip_id)
+
+def add_activity(session, trip_id, name, date, time=None, duration=None):
+    """`duration` is in minutes and needs a `time` to count from"""
+    trip = _trip(session, trip_id)
+    name = _text(name, "Activity name")
+    if name is None:
+        raise ServiceError("Activity name is required")
+    date = _date(date, "date")
+    if not trip.start_date <= date <= trip.end_date:
+        raise ServiceError(f"Date must be between {trip.start_date} and {trip.end_date}")
+    time = _time(time)
+    activity = Activity(name=name, date=date, time=time, duration=_duration(duration, time), trip_id=trip.id)
+    session.add(activity)
+    session.flush()
+    return activity
+
+def add_booking(session, trip_id, flight=None, hotel=None):
+    trip = _trip(session, trip_id)
+    flight, hotel = _text(flight, "Flight"), _text(hotel, "Hotel")
+    if flight is None and hotel is None:
+        raise ServiceError("A booking needs flight or hotel details")
+    booking = Booking(flight=flight, hotel=hotel, trip_id=trip.id)
+    session.add(booking)
+    session.flush()
+    return booking
+
+# A recurring activity: every `every` days, or only on `weekdays` (0 = Monday),
+# between the optional `starts` and `until` dates and within each trip
+Recurrence = namedtuple('Recurrence', 'every weekdays starts until')
+
+WEEKDAY_GROUPS = {'weekdays': (0, 1, 2, 3, 4), 'weekends': (5, 6)}
+
+def _weekdays(value):
+    """Day numbers from numbers, names ('mon,wed'), 'weekdays' or 'weekends'"""
+    if value is None or value == "":
+        return ()
+    if isinstance(value, str):
+        value = [part.strip().lower() for part in value.split(",") if part.strip()]
+    elif not isinstance(value, (list, tuple)):
+        raise ServiceError(f"Weekdays must be a list or comma-separated names, not '{value}'")
+    days = set()
+    for day in value:
+        if isinstance(day, str) and day in WEEKDAY_GROUPS:
+            days.update(WEEKDAY_GROUPS[day])
+        elif isinstance(day, int) and not isinstance(day, bool) and 0 <= day <= 6:
+            days.add(day)
+        elif isinstance(day, str) and day[:3] in WEEKDAY_NAMES:
+            days.add(WEEKDAY_NAMES.index(day[:3]))
+        else:
+            raise ServiceError(f"Unknown weekday '{day}'. Use {', '.join(WEEKDAY_NAMES)}, weekdays or weekends.")
+    return tuple(sorted(days))
+
+def recurrence(every=1, weekdays=None, starts=None, until=None):
+    """
+    A checked Recurrence
+        daily           recurrence()
+        weekly days     recurrence(weekdays="mon,wed")
+        every N days    recurrence(every=3)
+    """
+    try:
+        every = int(every)
+    except (TypeError, ValueError):
+        raise ServiceError(f"Repeat interval must be a whole number of days, not '{every}'")
+    if every < 1:
+        raise ServiceError("Repeat interval must be at least 1 day")
+    starts = None if starts in (None, "") else _date(starts, "first date")
+    until = None if until in (None, "") else _date(until, "last date")
+    if starts is not None and until is not None and until < starts:
+        raise ServiceError("The last date must be on or after the first date")
+    return Recurrence(every, _weekdays(weekdays), starts, until)
+
+def _expand(session, trip_condition, name, time, duration, rule):
+    """Insert every occurrence in one statement; returns how many were added"""
+    name = _text(name, "Activity name")
+    if name is None:
+        raise ServiceError("Activity name is required")
+    time = _time(time)
+    session.execute(expand_recurrence(
+        trip_condition, name, time, rule.every, rule.weekdays, rule.starts, rule.until, _duration(duration, time),
+    ))
+    # rowcount is not reported for WITH ... INSERT; changes() leaves out trigger rows
+    return session.scalar(select(func.changes()))
+
+def add_recurring_activity(session, trip_id, name, rule, time=None, duration=None):
+    """
+    Add the activity on every day of the trip that `rule` picks
+    The rule's dates must fall within the trip. Returns the number added.
+    """
+    trip = _trip(session, trip_id)
+    for value in (rule.starts, rule.until):
+        if value is not None and not trip.start_date <= value <= trip.end_date:
+            raise ServiceError(f"Repeat dates must be between {trip.start_date} and {trip.end_date}")
+    added = _expand(session, trip_table.c.id == trip.id, name, time, duration, rule)
+    if added == 0:
+        raise ServiceError("The repeat rule picks no day of this trip")
+    return added
+
+def apply_recurring_activity(session, name, rule, time=None, duration=None, trip_ids=None, destination=None,
+                             window_start=None, window_end=None):
+    """
+    Add the activity to every matching trip in one statement and transaction
+    Trips are picked by id, destination prefix and/or dates overlapping
+    the window; each gets the days of `rule` that fall within it, and
+    trips with no such day are left alone. Returns the number added.
+    """
+    conditions = []
+    if trip_ids:
+        conditions.append(trip_table.c.id.in_(list(trip_ids)))
+    if destination:
+        conditions.append(destination_starts_with(destination))
+    if window_start is not None or window_end is not None:
+        conditions.append(trip_table.c.id.in_(window_trip_ids(
+            'overlapping', _date(window_start, "window start") if window_start is not None else None,
+            _date(window_end, "window end") if window_end is not None else None,
+        )))
+    if not conditions:
+        raise ServiceError("Choose the trips by ID, destination or dates")
+    return _expand(session, and_(*conditions), name, time, duration, rule)
+
+class ReadCache:
+    """
+    Bounded LRU of read results, emptied whenever data_version() moves
+    Entries are shared between callers, so treat cached trips as read-only.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """The cached value for `key`, calling load() to fill a miss"""
+        with self._lock:
+            version = data_version()
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        # Loaded outside the lock; a write meanwhile moves the version, and
+        # the next get() drops this entry with the rest
+        value = load()
+        with self._lock:
+            if self._version == version:
+                self._entries[key] = value
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+class ItineraryService:
+    """
+    Blocking entry points: each call is its own session and transaction
+    Trip lookups, listings and details are answered from a ReadCache while
+    no trip, booking or activity has been written. Given a WriteQueue
+    (write_queue.py), writes go through its group commits instead, which
+    lets many threads write without each paying for its own commit.
+    """
+
+    def __init__(self, cache_size=CACHE_SIZE, writer=None):
+        self.cache = ReadCache(cache_size)
+        self.writer = writer
+
+    def _read(self, operation, *args):
+        with read_session() as session:
+            return operation(session, *args)
+
+    def _cached(self, operation, *args):
+        return self.cache.get((operation.__name__, args), lambda: self._read(operation, *args))
+
+    def _write(self, operation, *args):
+        if self.writer is not None:
+            return self.writer.submit(operation, *args).result()
+        with session_scope() as session:
+            return operation(session, *args)
+
+    def get_trip(self, trip_id):
+        return self._cached(get_trip, trip_id)
+
+    def list_trips(self, after_id=0, limit=PAGE_SIZE, destination=None):
+        return self._cached(list_trips, after_id, limit, destination)
+
+    def trip_details(self, trip_id):
+        return self._cached(trip_details, trip_id)
+
+    def search_trips(self, text, limit=SEARCH_LIMIT):
+        return self._read(search_trips, text, limit)
+
+    def count_children(self, trip_id):
+        return self._cached(count_children, trip_id)
+
+    def trip_conflicts(self, trip_id, default_minutes=schedule.DEFAULT_MINUTES):
+        return self._cached(trip_conflicts, trip_id, default_minutes)
+
+    def free_slots(self, trip_id, minutes, count=schedule.SLOT_COUNT, day_start=None, day_end=None,
+                   default_minutes=schedule.DEFAULT_MINUTES):
+        return self._cached(free_slots, trip_id, minutes, count, day_start, day_end, default_minutes)
+
+    def create_trip(self, destination, start_date, end_date):
+        return self._write(create_trip, destination, start_date, end_date)
+
+    def update_trip(self, trip_id, destination=None, start_date=None, end_date=None):
+        return self._write(update_trip, trip_id, destination, start_date, end_date)
+
+    def delete_trip(self, trip_id):
+        return self._write(delete_trip, trip_id)
+
+    def add_activity(self, trip_id, name, date, time=None, duration=None):
+        return self._write(add_activity, trip_id, name, date, time, duration)
+
+    def add_booking(self, trip_id, flight=None, hotel=None):
+        return self._write(add_booking, trip_id, flight, hotel)
+
+    def add_recurring_activity(self, trip_id, name, rule, time=None, duration=None):
+        return self._write(add_recurring_activity, trip_id, name, rule, time, duration)
+
+    def apply_recurring_activity(self, name, rule, time=None, duration=None, trip_ids=None, destination=None,
+                                 window_start=None, window_end=None):
+        return self._write(apply_recurring_activity, name, rule, time, duration, trip_ids, destination,
+                           window_start, window_end)
+
+class AsyncItineraryService:
+    """
+    asyncio entry points over SQLAlchemy's async engine (aiosqlite)
+    Reads run concurrently on pooled connections. SQLite allows one writer
+    at a time, so writes from this process take turns on a lock instead of
+    piling up on the database lock.
+    """
+
+    def __init__(self, engine=None):
+        import asyncio
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        from db.config import create_async_db_engine
+
+        self.engine = engine if engine is not None else create_async_db_engine()
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self._write_lock = asyncio.Lock()
+
+    async def _read(self, operation, *args):
+        async with self.sessions() as session:
+            return await session.run_sync(operation, *args)
+
+    async def _write(self, operation, *args):
+        async with self._write_lock:
+            async with self.sessions.begin() as session:
+                return await session.run_sync(operation, *args)
+
+    async def close(self):
+        await self.engine.dispose()
+
+    async def get_trip(self, trip_id):
+        return await self._read(get_trip, trip_id)
+
+    async def list_trips(self, after_id=0, limit=PAGE_SIZE, destination=None):
+        return await self._read(list_trips, after_id, limit, destination)
+
+    async def trip_details(self, trip_id):
+        return await self._read(trip_details, trip_id)
+
+    async def search_trips(self, text, limit=SEARCH_LIMIT):
+        return await self._read(search_trips, text, limit)
+
+    async def count_children(self, trip_id):
+        return await self._read(count_children, trip_id)
+
+    async def trip_conflicts(self, trip_id, default_minutes=schedule.DEFAULT_MINUTES):
+        return await self._read(trip_conflicts, trip_id, default_minutes)
+
+    async def free_slots(self, trip_id, minutes, count=schedule.SLOT_COUNT, day_start=None, day_end=None,
+                         default_minutes=schedule.DEFAULT_MINUTES):
+        return await self._read(free_slots, trip_id, minutes, count, day_start, day_end, default_minutes)
+
+    async def create_trip(self, destination, start_date, end_date):
+        return await self._write(create_trip, destination, start_date, end_date)
+
+    async def update_trip(self, trip_id, destination=None, start_date=None, end_date=None):
+        return await self._write(update_trip, trip_id, destination, start_date, end_date)
+
+    async def delete_trip(self, trip_id):
+        return await self._write(delete_trip, trip_id)
+
+    async def add_activity(self, trip_id, name, date, time=None, duration=None):
+        return await self._write(add_activity, trip_id, name, date, time, duration)
+
+    async def add_booking(self, trip_id, flight=None, hotel=None):
+        return await self._write(add_booking, trip_id, flight, hotel)
+
+    async def add_recurring_activity(self, trip_id, name, rule, time=None, duration=None):
+        return await self._write(add_recurring_activity, trip_id, name, rule, time, duration)
+
+def trip_summary(trip):
+    return {
+        "id": trip.id,
+        "destination": trip.destination,
+        "start_date": trip.start_date.isoformat(),
+        "end_date": trip.end_date.isoformat(),
+    }
+
+def summary_document(summary):
+    """Counts and activity span from a TripRecord (or TripSummary)"""
+    return {
+        "activity_count": summary.activity_count,
+        "booking_count": summary.booking_count,
+        "first_activity": summary.first_activity.isoformat() if summary.first_activity else None,
+        "last_activity": summary.last_activity.isoformat() if summary.last_activity else None,
+    }
+
+def booking_document(booking):
+    return {"id": booking.id, "flight": booking.flight, "hotel": booking.hotel}
+
+def activity_document(activity):
+    return {
+        "id": activity.id,
+        "name": activity.name,
+        "date": activity.date.isoformat(),
+        "time": activity.time.strftime("%H:%M") if activity.time is not None else None,
+        "duration": activity.duration,
+    }
+
+def sorted_activities(activities):
+    """Itinerary order; all-day activities (no time) come first"""
+    return sorted(activities, key=lambda a: (a.date, a.time or time_type.min))
+
+def trip_document(trip):
+    """A trip and its children as a JSON-ready dict"""
+    return {
+        **trip_summary(trip),
+        "bookings": [booking_document(b) for b in trip.bookings],
+        "activities": [activity_document(a) for a in sorted_activities(trip.activities)],
+    }
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# db.models builds its engine from the configuration when first imported,
+# so point it at a scratch database before any test module imports it
+os.environ["TRAVEL_DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'travel_itinerary.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,21 @@
+from datetime import date
+
+from db.archive import archive_trips
+from db.models import ensure_schema, engine
+from service import ItineraryService
+
+
+def test_new_trip_never_gets_an_archived_id(tmp_path):
+    ensure_schema(engine)
+    service = ItineraryService()
+    finished = [service.create_trip("Lisbon", "2020-05-01", "2020-05-04").id for _ in range(3)]
+    newest = service.create_trip("Oslo", "2031-01-01", "2031-01-05").id
+    service.add_activity(finished[-1], "Tram 28", "2020-05-02", "10:00")
+
+    assert archive_trips(date(2026, 10, 18), path=tmp_path / "archive.db", report=lambda message: None) == 3
+    # The hot file is left without any trip at or above the archived ids
+    service.delete_trip(newest)
+
+    created = service.create_trip("Porto", "2031-02-01", "2031-02-03")
+    assert created.id > newest
+    assert service.trip_details(created.id).activities == []
@@ -0,0 +1,76 @@
+import hashlib
+
+import pytest
+
+from db.backup import BackupError, backup, restore, verify_snapshot
+from db.config import create_db_engine
+from db.models import ensure_schema
+from db.seed import bulk_seed
+
+TABLES = ["trips", "activities", "bookings", "trip_summaries"]
+
+
+def contents(bind):
+    with bind.connect() as connection:
+        return {table: connection.exec_driver_sql(f"SELECT * FROM {table} ORDER BY 1").all() for table in TABLES}
+
+
+@pytest.fixture
+def bind(tmp_path):
+    bind = create_db_engine(f"sqlite:///{tmp_path / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    bulk_seed(40, seed=3, bind=bind, report=lambda message: None)
+    yield bind
+    bind.dispose()
+
+
+@pytest.mark.parametrize("level", [0, 1])
+def test_backup_verify_restore_round_trip(bind, tmp_path, level):
+    before = contents(bind)
+    snapshot = backup(tmp_path / "snapshots" / "before.db.gz", level=level, bind=bind)
+    assert snapshot.sha256 == hashlib.sha256(open(snapshot.path, "rb").read()).hexdigest()
+    assert (snapshot.snapshot_bytes < snapshot.database_bytes) == bool(level)
+    verify_snapshot(snapshot.path)
+
+    with bind.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM trips WHERE id % 2 = 0")
+        connection.exec_driver_sql(
+            "INSERT INTO trips (destination, start_date, end_date) VALUES ('After', '2031-01-01', '2031-01-02')"
+        )
+    assert contents(bind) != before
+
+    restore(snapshot.path, pages=3, bind=bind)
+    assert contents(bind) == before
+    with bind.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA quick_check").scalar() == "ok"
+        assert connection.exec_driver_sql(
+            "SELECT count(*) FROM trip_search WHERE trip_search MATCH 'after'"
+        ).scalar() == 0
+
+
+def test_damaged_snapshots_are_refused(bind, tmp_path):
+    snapshot = backup(tmp_path / "good.db.gz", bind=bind)
+    data = open(snapshot.path, "rb").read()
+    before = contents(bind)
+
+    flipped = tmp_path / "flipped.db.gz"
+    flipped.write_bytes(data[:100] + bytes([data[100] ^ 1]) + data[101:])
+    (tmp_path / "flipped.db.gz.sha256").write_text(f"{snapshot.sha256}  flipped.db.gz\n")
+    with pytest.raises(BackupError, match="does not match its checksum"):
+        verify_snapshot(flipped)
+
+    # A checksum taken of the damage does not make the snapshot whole
+    truncated = tmp_path / "truncated.db.gz"
+    truncated.write_bytes(data[:len(data) // 2])
+    digest = hashlib.sha256(truncated.read_bytes()).hexdigest()
+    (tmp_path / "truncated.db.gz.sha256").write_text(f"{digest}  truncated.db.gz\n")
+    with pytest.raises(BackupError, match="truncated"):
+        restore(truncated, bind=bind)
+
+    unchecked = tmp_path / "unchecked.db.gz"
+    unchecked.write_bytes(data)
+    with pytest.raises(BackupError, match="No checksum"):
+        restore(unchecked, bind=bind)
+
+    assert contents(bind) == before
+    assert not list(tmp_path.glob("*.restore.db")) and not list(tmp_path.glob("*.verify.db"))
@@ -0,0 +1,133 @@
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine
+
+from db.migrations.batched import CHECKPOINTS, backfill, copy_rows, swap_tables
+
+ROWS = 95
+BATCH = 10
+
+
+class Interrupted(Exception):
+    pass
+
+
+def stop_after(batches, messages):
+    """A report callback that stops the run once `batches` batches have committed"""
+    def report(message):
+        messages.append(message)
+        if sum("ids up to" in m for m in messages) == batches:
+            raise Interrupted
+    return report
+
+
+@pytest.fixture
+def bind(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    with bind.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, size INTEGER)")
+        connection.exec_driver_sql("CREATE TABLE sizes_changed (item_id INTEGER)")
+        connection.exec_driver_sql(
+            "CREATE TRIGGER items_size_update AFTER UPDATE OF size ON items "
+            "BEGIN INSERT INTO sizes_changed VALUES (new.id); END"
+        )
+        # Every other id, so batches skip gaps
+        connection.exec_driver_sql(
+            "INSERT INTO items (id, name, size) "
+            f"WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {ROWS}) "
+            "SELECT i * 2, 'item ' || i, CASE WHEN i % 3 THEN i END FROM n"
+        )
+    yield bind
+    bind.dispose()
+
+
+def migrate(bind, step):
+    """Run `step` the way an upgrade() does, with `op` bound to a migration context"""
+    with bind.connect() as connection:
+        context = MigrationContext.configure(connection)
+        # The transaction run_migrations() opens around each revision
+        with context.begin_transaction(_per_migration=True), Operations.context(context):
+            return step()
+
+
+def rows(bind, query):
+    with bind.connect() as connection:
+        return connection.exec_driver_sql(query).all()
+
+
+def tables(bind):
+    return {name for name, in rows(bind, "SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def test_backfill_resumes_after_an_interruption(bind):
+    unsized = rows(bind, "SELECT count(*) FROM items WHERE size IS NULL")[0][0]
+    step = lambda report: backfill("fill sizes", "items", "size = 0", "size IS NULL",
+                                   batch_size=BATCH, pause=0, report=report)
+    first_run = []
+    with pytest.raises(Interrupted):
+        migrate(bind, lambda: step(stop_after(3, first_run)))
+    # Three batches cover ids up to the third range; the checkpoint remembers where they stopped
+    checkpoint = rows(bind, f"SELECT name, last_id FROM {CHECKPOINTS}")
+    assert checkpoint == [("fill sizes", 2 + 3 * BATCH - 1)]
+    assert rows(bind, "SELECT count(*) FROM items WHERE size = 0 AND id > 31") == [(0,)]
+
+    second_run = []
+    assert migrate(bind, lambda: step(second_run.append)) == unsized
+    assert second_run[0] == "fill sizes: resuming after id 31, 5 rows done"
+    assert rows(bind, "SELECT count(*) FROM items WHERE size IS NULL") == [(0,)]
+    assert rows(bind, "SELECT count(*) FROM items WHERE size = 0") == [(unsized,)]
+    assert CHECKPOINTS not in tables(bind)
+
+
+def test_copy_and_swap_keep_writes_made_during_the_copy(bind):
+    with bind.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE items_new (id INTEGER PRIMARY KEY, title TEXT NOT NULL, size INTEGER)"
+        )
+    columns = {"id": "id", "title": "name", "size": "size"}
+    first_run = []
+    with pytest.raises(Interrupted):
+        migrate(bind, lambda: copy_rows("copy items", "items", "items_new", columns,
+                                        batch_size=BATCH, pause=0, report=stop_after(2, first_run)))
+    assert rows(bind, "SELECT max(id) FROM items_new") == [(20,)]
+
+    # Writes between the runs, to rows copied already and rows not yet copied
+    with bind.begin() as connection:
+        connection.exec_driver_sql("UPDATE items SET name = 'renamed' WHERE id IN (4, 150)")
+        connection.exec_driver_sql("DELETE FROM items WHERE id IN (6, 160)")
+        connection.exec_driver_sql("INSERT INTO items (id, name, size) VALUES (1000, 'late', 7)")
+        connection.exec_driver_sql("DELETE FROM sizes_changed")
+    expected = rows(bind, "SELECT id, name, size FROM items ORDER BY id")
+
+    migrate(bind, lambda: copy_rows("copy items", "items", "items_new", columns,
+                                    batch_size=BATCH, pause=0, report=lambda message: None))
+    trigger = rows(bind, "SELECT sql FROM sqlite_master WHERE name = 'items_size_update'")[0][0]
+    migrate(bind, lambda: swap_tables("items", "items_new", [trigger], batch_size=BATCH, pause=0,
+                                      report=lambda message: None))
+
+    assert rows(bind, "SELECT id, title, size FROM items ORDER BY id") == expected
+    assert tables(bind) == {"items", "sizes_changed"}
+    triggers = rows(bind, "SELECT name FROM sqlite_master WHERE type = 'trigger'")
+    assert triggers == [("items_size_update",)]
+    # The recreated trigger fires on the new table
+    with bind.begin() as connection:
+        connection.exec_driver_sql("UPDATE items SET size = 1 WHERE id = 2")
+    assert rows(bind, "SELECT item_id FROM sizes_changed") == [(2,)]
+
+
+def test_swap_resumes_emptying_the_old_table(bind):
+    with bind.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE items_new AS SELECT * FROM items")
+    first_run = []
+    with pytest.raises(Interrupted):
+        migrate(bind, lambda: swap_tables("items", "items_new", batch_size=BATCH, pause=0,
+                                          report=stop_after(1, first_run)))
+    # The swap itself committed; only the old rows are left to delete
+    assert {"items", "items_old"} <= tables(bind)
+    assert rows(bind, "SELECT count(*) FROM items") == [(ROWS,)]
+
+    migrate(bind, lambda: swap_tables("items", "items_new", batch_size=BATCH, pause=0,
+                                      report=lambda message: None))
+    assert tables(bind) == {"items", "sizes_changed"}
+    assert rows(bind, "SELECT count(*) FROM items") == [(ROWS,)]
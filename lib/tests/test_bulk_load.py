@@ -0,0 +1,48 @@
+import csv
+
+from db.config import create_db_engine
+from db.models import ensure_schema
+from db.seed import bulk_seed
+from importer import Importer, RejectFile
+
+SNAPSHOT = [
+    "SELECT * FROM trip_summaries ORDER BY trip_id",
+    "SELECT rowid, * FROM trip_search ORDER BY rowid",
+    "SELECT name FROM sqlite_master WHERE type = 'trigger' ORDER BY name",
+]
+
+
+def load(directory, bulk):
+    bind = create_db_engine(f"sqlite:///{directory / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    bulk_seed(120, seed=7, chunk_size=50, bind=bind, report=lambda message: None, bulk=bulk)
+    # A second run lands on a database that already has summaries and search rows
+    bulk_seed(30, seed=8, chunk_size=50, bind=bind, report=lambda message: None, bulk=bulk)
+
+    # Activities on the last day of existing trips widen their stored bounds
+    activities = directory / "activities.csv"
+    with bind.connect() as connection, open(activities, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["trip_id", "name", "date"])
+        for trip_id, end_date in connection.exec_driver_sql(
+            "SELECT id, end_date FROM trips WHERE id IN (1, 5, 40, 140)"
+        ):
+            writer.writerow([trip_id, f"Walk {trip_id}", end_date])
+            writer.writerow([trip_id, f"Ferry {trip_id}", end_date])
+    rejects = RejectFile(directory / "rejects.jsonl")
+    Importer(rejects, chunk_size=3, bind=bind, bulk=bulk).import_file(
+        "activities", str(activities), report=lambda message: None
+    )
+    assert rejects.count == 0
+
+    with bind.connect() as connection:
+        return [connection.exec_driver_sql(query).all() for query in SNAPSHOT]
+
+
+def test_bulk_mode_matches_the_triggers(tmp_path):
+    (tmp_path / "triggers").mkdir()
+    (tmp_path / "bulk").mkdir()
+    with_triggers = load(tmp_path / "triggers", bulk=False)
+
+    assert load(tmp_path / "bulk", bulk=True) == with_triggers
+    assert len(with_triggers[0]) == 150
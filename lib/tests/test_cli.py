@@ -0,0 +1,20 @@
+import pytest
+
+from cli import build_parser
+
+
+@pytest.mark.parametrize("arguments", [
+    ["list-trips", "--page-size", "0"],
+    ["dump", "--batch-size", "0"],
+    ["export", "out", "--batch-size", "-5"],
+    ["import", "trips", "trips.csv", "--chunk-size", "0"],
+    ["search", "louvre", "--limit", "0"],
+])
+def test_sizes_below_one_are_refused(arguments, capsys):
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(arguments)
+    assert "use a whole number of at least 1" in capsys.readouterr().err
+
+
+def test_page_size_is_parsed():
+    assert build_parser().parse_args(["list-trips", "--page-size", "25"]).page_size == 25
@@ -0,0 +1,95 @@
+import csv
+import json
+
+from db.config import create_db_engine
+from db.models import ensure_schema
+from importer import Importer, RejectFile
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def write_jsonl(path, lines):
+    path.write_text("".join((line if isinstance(line, str) else json.dumps(line)) + "\n" for line in lines))
+    return str(path)
+
+
+def test_import_assigns_new_ids_and_rejects_bad_rows(tmp_path):
+    bind = create_db_engine(f"sqlite:///{tmp_path / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    with bind.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO trips (destination, start_date, end_date) VALUES "
+            "('Oslo', '2030-01-01', '2030-01-03'), ('Gone', '2030-01-01', '2030-01-03')"
+        )
+        # Ids of deleted trips are never handed out again
+        connection.exec_driver_sql("DELETE FROM trips WHERE destination = 'Gone'")
+
+    trips = write_csv(tmp_path / "trips.csv", ["ref", "destination", "start_date", "end_date"], [
+        ["r1", "Rome", "2030-03-01", "2030-03-05"],
+        ["r2", "", "2030-03-01", "2030-03-05"],
+        ["r3", "Lima", "2030-03-05", "2030-03-01"],
+        ["r1", "Rome again", "2030-03-01", "2030-03-05"],
+        ["r4", "Kyiv", "2030-04-01", "2030-04-02"],
+        ["", "Nara", "2030-13-01", "2030-04-02"],
+    ])
+    activities = write_jsonl(tmp_path / "activities.jsonl", [
+        {"trip_ref": "r1", "name": "Forum", "date": "2030-03-02", "time": "09:00", "duration": 120},
+        {"trip_id": 1, "name": "Fjord", "date": "2030-01-02"},
+        {"trip_ref": "r4", "name": "Too late", "date": "2030-04-03"},
+        {"trip_ref": "r2", "name": "Nowhere", "date": "2030-03-02"},
+        {"trip_id": 2, "name": "Deleted", "date": "2030-01-02"},
+        {"trip_ref": "r1", "name": "Opera", "date": "2030-03-03", "duration": 90},
+        {"trip_ref": "r1", "name": "Dawn", "date": "2030-03-03", "time": "25:00"},
+        "not json",
+        ["a", "list"],
+        {"name": "Orphan", "date": "2030-03-02"},
+    ])
+    bookings = write_csv(tmp_path / "bookings.csv", ["trip_id", "trip_ref", "flight", "hotel"], [
+        ["", "r4", "PS101", ""],
+        ["1", "", "", ""],
+        ["x1", "", "LH1", ""],
+    ])
+
+    rejects = RejectFile(tmp_path / "rejects.jsonl")
+    importer = Importer(rejects, chunk_size=2, bind=bind)
+    quiet = lambda message: None
+    assert importer.import_file("trips", trips, quiet) == 2
+    assert importer.import_file("activities", activities, quiet) == 2
+    assert importer.import_file("bookings", bookings, quiet) == 1
+    rejects.close()
+
+    with bind.connect() as connection:
+        assert connection.exec_driver_sql("SELECT id, destination FROM trips ORDER BY id").all() == [
+            (1, "Oslo"), (3, "Rome"), (4, "Kyiv"),
+        ]
+        assert connection.exec_driver_sql(
+            "SELECT trip_id, name, time, duration FROM activities ORDER BY id"
+        ).all() == [(1, "Fjord", None, None), (3, "Forum", "09:00:00.000000", 120)]
+        assert connection.exec_driver_sql("SELECT trip_id, flight FROM bookings").all() == [(4, "PS101")]
+
+    # Resolving trips happens a chunk at a time, after validation, so sort by line
+    entries = map(json.loads, (tmp_path / "rejects.jsonl").read_text().splitlines())
+    reasons = [(entry["file"].rsplit("/", 1)[1], entry["line"], entry["error"]) for entry in entries]
+    assert sorted(reasons, key=lambda reason: (reason[0] != "trips.csv", reason[0], reason[1])) == [
+        ("trips.csv", 3, "missing destination"),
+        ("trips.csv", 4, "end_date is before start_date"),
+        ("trips.csv", 5, "duplicate ref 'r1'"),
+        ("trips.csv", 7, "invalid start_date '2030-13-01', use YYYY-MM-DD"),
+        ("activities.jsonl", 3, "date must be between 2030-04-01 and 2030-04-02"),
+        ("activities.jsonl", 4, "unknown trip ref 'r2'"),
+        ("activities.jsonl", 5, "unknown trip id '2'"),
+        ("activities.jsonl", 6, "duration needs a time"),
+        ("activities.jsonl", 7, "invalid time '25:00', use HH:MM"),
+        ("activities.jsonl", 8, "not a JSON object"),
+        ("activities.jsonl", 9, "not a JSON object"),
+        ("activities.jsonl", 10, "missing trip_id or trip_ref"),
+        ("bookings.csv", 3, "booking has neither flight nor hotel"),
+        ("bookings.csv", 4, "invalid trip_id 'x1'"),
+    ]
+    assert rejects.count == len(reasons)
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+
+from db.config import create_db_engine
+
+DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db")
+
+SCHEMA = "SELECT type, name, tbl_name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY type, name"
+
+
+@pytest.fixture
+def alembic(tmp_path, monkeypatch):
+    """Alembic's config for lib/db/migrations, pointed at a scratch database"""
+    url = f"sqlite:///{tmp_path / 'travel_itinerary.db'}"
+    monkeypatch.setenv("TRAVEL_DB_URL", url)
+    # env.py imports config and models the way alembic does when run from lib/db
+    monkeypatch.syspath_prepend(DB)
+    config = Config()
+    config.set_main_option("script_location", os.path.join(DB, "migrations"))
+    bind = create_db_engine(url)
+    yield config, bind
+    bind.dispose()
+
+
+def schema(bind):
+    """
+    Each table's columns, foreign keys and indexes, and every trigger
+    Batch-mode rebuilds write the same schema with different CREATE text
+    """
+    shape = []
+    with bind.connect() as connection:
+        for kind, name, table in connection.exec_driver_sql(SCHEMA):
+            if kind == "table":
+                shape.append((kind, name, [
+                    connection.exec_driver_sql(f'PRAGMA table_info("{name}")').all(),
+                    [row[2:] for row in connection.exec_driver_sql(f'PRAGMA foreign_key_list("{name}")')],
+                ]))
+            elif kind == "index":
+                shape.append((kind, name, table, connection.exec_driver_sql(f'PRAGMA index_xinfo("{name}")').all()))
+            else:
+                shape.append((kind, name, table))
+    return shape
+
+
+def test_every_revision_downgrades_and_upgrades_again(alembic):
+    config, bind = alembic
+    command.upgrade(config, "head")
+    head = schema(bind)
+    assert ("index", "ix_trips_destination") in [entry[:2] for entry in head]
+
+    # One step down and back up at a time, from head to the first revision
+    revisions = [script.revision for script in ScriptDirectory.from_config(config).walk_revisions()]
+    for revision in revisions:
+        upgraded = schema(bind)
+        command.downgrade(config, "-1")
+        command.upgrade(config, "+1")
+        assert schema(bind) == upgraded, revision
+        command.downgrade(config, "-1")
+    assert [entry[1] for entry in schema(bind)] == ["alembic_version"]
+
+    command.upgrade(config, "head")
+    assert schema(bind) == head
+
+
+def test_data_survives_a_downgrade_and_upgrade(alembic):
+    config, bind = alembic
+    command.upgrade(config, "head")
+    with bind.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO trips (destination, start_date, end_date) VALUES ('Oslo', '2030-01-01', '2030-01-03')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO activities (trip_id, name, date, time) VALUES (1, 'Fjord', '2030-01-02', '10:00:00.000000')"
+        )
+        connection.exec_driver_sql("INSERT INTO bookings (trip_id, flight) VALUES (1, 'SK1')")
+
+    # Back past the summaries, search, date index and duration revisions
+    command.downgrade(config, "4b1c9e2d7a60")
+    command.upgrade(config, "head")
+    with bind.connect() as connection:
+        assert connection.exec_driver_sql("SELECT id, destination FROM trips").all() == [(1, "Oslo")]
+        assert connection.exec_driver_sql("SELECT name, duration FROM activities").all() == [("Fjord", None)]
+        assert connection.exec_driver_sql(
+            "SELECT activity_count, booking_count FROM trip_summaries WHERE trip_id = 1"
+        ).all() == [(1, 1)]
+        assert connection.exec_driver_sql(
+            "SELECT DISTINCT trip_id FROM trip_search WHERE trip_search MATCH 'fjord'"
+        ).scalars().all() == [1]
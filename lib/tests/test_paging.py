@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+import helpers
+from db.models import Trip, engine, ensure_schema
+from export import iter_itineraries
+
+WINDOW = (date(2025, 7, 1), date(2025, 7, 7))
+
+
+@pytest.fixture(scope="module")
+def trip_ids():
+    ensure_schema(engine)
+    first = date(2025, 6, 1)
+    rows = [
+        {"destination": f"Paging {n}", "start_date": first + timedelta(days=n % 60),
+         "end_date": first + timedelta(days=n % 60 + n % 5)}
+        for n in range(300)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(Trip), rows)
+        return connection.exec_driver_sql(
+            "SELECT id, start_date, end_date FROM trips WHERE destination LIKE 'Paging %' ORDER BY id"
+        ).all()
+
+
+def expected(trip_ids, keep):
+    return [trip_id for trip_id, start, end in trip_ids
+            if keep(date.fromisoformat(start), date.fromisoformat(end))]
+
+
+@pytest.mark.parametrize("page_size", [1, 7, 50, 1000])
+def test_window_pages_follow_id_order(trip_ids, page_size):
+    start, end = WINDOW
+    matches = {
+        "overlapping": lambda s, e: e >= start and s <= end,
+        "containing": lambda s, e: s <= start and e >= end,
+        "starting": lambda s, e: start <= s <= end,
+    }
+    for match, keep in matches.items():
+        pages = list(helpers.iter_trip_pages(page_size, "Paging", start, end, match=match))
+        assert all(len(page) == page_size for page in pages[:-1])
+        assert [trip.id for page in pages for trip in page] == expected(trip_ids, keep)
+
+
+def test_pages_resume_after_an_id(trip_ids):
+    after = trip_ids[100][0]
+    pages = helpers.iter_trip_pages(25, "Paging", after_id=after)
+    assert [trip.id for page in pages for trip in page] == [row[0] for row in trip_ids[101:]]
+
+
+def test_export_batches_match_the_window(trip_ids):
+    start, end = WINDOW
+    first, last = trip_ids[10][0], trip_ids[250][0]
+    batches = list(iter_itineraries(first, last, start, end, batch_size=9))
+    assert all(len(batch) == 9 for batch in batches[:-1])
+    exported = [itinerary.id for batch in batches for itinerary in batch]
+    overlapping = expected(trip_ids, lambda s, e: e >= start and s <= end)
+    assert exported == [trip_id for trip_id in overlapping if first <= trip_id <= last]
+
+
+def test_page_size_below_one_is_rejected():
+    with pytest.raises(ValueError):
+        helpers.iter_trip_pages(0)
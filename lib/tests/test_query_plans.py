@@ -0,0 +1,22 @@
+from db.check_query_plans import check
+from db.config import create_db_engine
+from db.models import ensure_schema
+
+
+def test_hot_queries_use_indexes(tmp_path, capsys):
+    bind = create_db_engine(f"sqlite:///{tmp_path / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    assert check(bind) == 0, capsys.readouterr().out
+
+
+def test_a_missing_index_fails_the_check(tmp_path, capsys):
+    bind = create_db_engine(f"sqlite:///{tmp_path / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    with bind.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_trips_destination")
+    # Every destination prefix query reads that index
+    assert check(bind) == 3
+    out = capsys.readouterr().out
+    assert "[FAIL] trips by destination prefix:" in out
+    assert "[FAIL] trip page by destination prefix:" in out
+    assert "[FAIL] destination prefix count:" in out
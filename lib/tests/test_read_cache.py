@@ -0,0 +1,36 @@
+from db.backup import backup, restore
+from db.models import engine, ensure_schema
+from service import ItineraryService
+
+
+def destinations(service, prefix):
+    return [trip.destination for trip in service.list_trips(destination=prefix)]
+
+
+def test_core_writes_empty_the_cache():
+    ensure_schema(engine)
+    service = ItineraryService()
+    trip = service.create_trip("Cache Core", "2031-01-01", "2031-01-02")
+    assert destinations(service, "Cache Core") == ["Cache Core"]
+    assert service.count_children(trip.id) == (0, 0)
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO activities (trip_id, name, date) VALUES (?, 'Walk', '2031-01-01')", (trip.id,)
+        )
+    assert service.count_children(trip.id) == (1, 0)
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM trips WHERE id = ?", (trip.id,))
+    assert destinations(service, "Cache Core") == []
+
+
+def test_a_restore_empties_the_cache(tmp_path):
+    ensure_schema(engine)
+    service = ItineraryService()
+    backup(tmp_path / "before.db.gz", bind=engine)
+    service.create_trip("Cache Restore", "2031-02-01", "2031-02-02")
+    assert destinations(service, "Cache Restore") == ["Cache Restore"]
+
+    restore(tmp_path / "before.db.gz", bind=engine)
+    assert destinations(service, "Cache Restore") == []
@@ -0,0 +1,32 @@
+from sqlalchemy import insert, select
+
+from db.config import create_db_engine
+from db.models import Trip, ensure_schema
+from db.read_models import destination_starts_with, trips
+
+DESTINATIONS = [
+    "Paris", "paris", "PARIS, France", "Parma", "Pb", "P[x", "p@ris", "Zurich", "zagreb", "Z[1]",
+    "Ayia_Napa", "AyiaXNapa", "100% Bali", "1000 Islands", "Éze", "éze", "Oslo",
+]
+PREFIXES = ["Par", "pAR", "P", "p@", "z", "Z", "Z[", "Ayia_", "100%", "É", "é", "O", "Q", "x"]
+
+
+def test_destination_prefix_matches_like_and_seeks_the_index(tmp_path):
+    bind = create_db_engine(f"sqlite:///{tmp_path / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    with bind.begin() as connection:
+        connection.execute(insert(Trip), [{"destination": destination} for destination in DESTINATIONS])
+
+    with bind.connect() as connection:
+        for prefix in PREFIXES:
+            like = connection.scalars(
+                select(trips.c.id).where(trips.c.destination.startswith(prefix, autoescape=True))
+            ).all()
+            ranged = connection.scalars(select(trips.c.id).where(destination_starts_with(prefix))).all()
+            assert sorted(ranged) == sorted(like), prefix
+
+        stmt = select(trips.c.id).where(destination_starts_with("Par")).compile(bind)
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {stmt}", tuple(stmt.params[name] for name in stmt.positiontup)
+        ).all()
+        assert "ix_trips_destination" in plan[0][-1]
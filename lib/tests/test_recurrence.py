@@ -0,0 +1,75 @@
+from datetime import date, time
+
+import pytest
+from sqlalchemy.orm import Session
+
+from db.config import create_db_engine
+from db.models import ensure_schema
+from service import (
+    ServiceError, add_recurring_activity, apply_recurring_activity, create_trip, recurrence,
+)
+
+
+@pytest.fixture
+def session(tmp_path):
+    bind = create_db_engine(f"sqlite:///{tmp_path / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    with Session(bind) as session:
+        yield session
+    bind.dispose()
+
+
+def days(session, trip_id, name):
+    rows = session.connection().exec_driver_sql(
+        "SELECT date FROM activities WHERE trip_id = ? AND name = ? ORDER BY date", (trip_id, name)
+    )
+    return [int(day[-2:]) for day, in rows]
+
+
+@pytest.mark.parametrize("rule, expected", [
+    (recurrence(), list(range(1, 11))),
+    (recurrence(every=3), [1, 4, 7, 10]),
+    (recurrence(weekdays="weekends"), [4, 5]),
+    (recurrence(weekdays=[0, "fri"]), [3, 6, 10]),
+    (recurrence(every=2, starts="2030-05-03", until="2030-05-08"), [3, 5, 7]),
+    # Every other day from the start, on Mondays and Fridays only
+    (recurrence(every=2, weekdays="mon,fri"), [3]),
+])
+def test_rules_pick_the_trip_days(session, rule, expected):
+    # Wednesday 1 to Friday 10 May
+    trip = create_trip(session, "Porto", "2030-05-01", "2030-05-10")
+    assert add_recurring_activity(session, trip.id, "Run", rule, "07:30", "45") == len(expected)
+    assert days(session, trip.id, "Run") == expected
+    times = session.connection().exec_driver_sql(
+        "SELECT DISTINCT time, duration FROM activities WHERE trip_id = ?", (trip.id,)
+    ).all()
+    assert times == [("07:30:00.000000", 45)]
+
+
+def test_rules_outside_the_trip_are_refused(session):
+    trip = create_trip(session, "Porto", "2030-05-01", "2030-05-03")
+    with pytest.raises(ServiceError, match="between 2030-05-01 and 2030-05-03"):
+        add_recurring_activity(session, trip.id, "Run", recurrence(until="2030-05-09"))
+    with pytest.raises(ServiceError, match="picks no day"):
+        add_recurring_activity(session, trip.id, "Run", recurrence(weekdays="mon"))
+    with pytest.raises(ServiceError, match="at least 1 day"):
+        recurrence(every=0)
+
+
+def test_one_rule_over_many_trips(session):
+    first = create_trip(session, "Porto", "2030-05-01", "2030-05-04")
+    second = create_trip(session, "porto alegre", "2030-05-06", "2030-05-10")
+    weekend = create_trip(session, "Porto", "2030-05-04", "2030-05-05")
+    other = create_trip(session, "Lisbon", "2030-05-01", "2030-05-10")
+
+    rule = recurrence(weekdays="weekdays", until=date(2030, 5, 8))
+    assert apply_recurring_activity(session, "Coffee", rule, time(8), destination="port") == 6
+    assert days(session, first.id, "Coffee") == [1, 2, 3]
+    assert days(session, second.id, "Coffee") == [6, 7, 8]
+    assert days(session, weekend.id, "Coffee") == []
+    assert days(session, other.id, "Coffee") == []
+
+    assert apply_recurring_activity(session, "Tea", recurrence(), trip_ids=[weekend.id, other.id],
+                                    window_start="2030-05-05", window_end="2030-05-06") == 12
+    with pytest.raises(ServiceError, match="Choose the trips"):
+        apply_recurring_activity(session, "Tea", recurrence())
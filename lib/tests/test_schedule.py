@@ -0,0 +1,54 @@
+from datetime import date, datetime, time
+
+from db.read_models import ActivityRecord
+from schedule import FreeSlot, conflicts, free_slots
+
+DAY = date(2030, 6, 1)
+
+
+def activity(activity_id, start=None, duration=None, day=DAY):
+    return ActivityRecord(activity_id, 7, f"Activity {activity_id}", day, start, duration)
+
+
+def at(hour, minute=0, day=DAY):
+    return datetime.combine(day, time(hour, minute))
+
+
+ACTIVITIES = [
+    activity(1, time(9), 60),
+    activity(2, time(9, 30)),              # default 60 minutes: overlaps 1
+    activity(3, time(10, 30), 30),         # starts as 2 ends: no clash
+    activity(4),                           # all day: never clashes
+    activity(5, time(14), 120),
+    activity(6, time(14, 30), 15),
+    activity(7, time(15, 45), 30),         # inside 5, after 6 ended
+    activity(8, time(18), 30, DAY.replace(day=2)),
+]
+
+
+def test_conflicts_group_overlapping_runs():
+    found = conflicts(reversed(ACTIVITIES))
+    assert [(conflict.start, conflict.end, [a.id for a in conflict.activities]) for conflict in found] == [
+        (at(9), at(10, 30), [1, 2]),
+        (at(14), at(16, 15), [5, 6, 7]),
+    ]
+    assert {conflict.trip_id for conflict in found} == {7}
+    # A shorter default no longer reaches activity 3
+    assert [len(conflict.activities) for conflict in conflicts(ACTIVITIES, default_minutes=30)] == [2, 3]
+
+
+def test_free_slots_fill_the_days_in_order():
+    slots = free_slots(DAY, DAY.replace(day=3), ACTIVITIES, 90)
+    assert slots == [
+        FreeSlot(at(11), at(14)),
+        FreeSlot(at(16, 15), at(22)),
+        FreeSlot(at(8, day=DAY.replace(day=2)), at(18, day=DAY.replace(day=2))),
+        FreeSlot(at(18, 30, day=DAY.replace(day=2)), at(22, day=DAY.replace(day=2))),
+        FreeSlot(at(8, day=DAY.replace(day=3)), at(22, day=DAY.replace(day=3))),
+    ]
+    assert free_slots(DAY, DAY.replace(day=3), ACTIVITIES, 90, count=2) == slots[:2]
+    # Shorter gaps count once they are long enough, and the day's hours bound them
+    assert free_slots(DAY, DAY, ACTIVITIES, 60, day_start=time(8), day_end=time(12)) == [
+        FreeSlot(at(8), at(9)), FreeSlot(at(11), at(12)),
+    ]
+    assert free_slots(DAY, DAY, ACTIVITIES, 600) == []
@@ -0,0 +1,25 @@
+from datetime import date
+
+from db.archive import archive_trips
+from db.config import create_db_engine
+from db.models import ensure_schema
+from db.seed import bulk_seed
+
+
+def trip_ids(bind):
+    with bind.connect() as connection:
+        return connection.exec_driver_sql("SELECT id FROM trips ORDER BY id").scalars().all()
+
+
+def test_seeding_after_an_archive_never_reuses_archived_ids(tmp_path):
+    bind = create_db_engine(f"sqlite:///{tmp_path / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    quiet = lambda message: None
+    bulk_seed(5, seed=1, chunk_size=2, anchor=date(2020, 1, 1), bind=bind, report=quiet)
+    assert trip_ids(bind) == [1, 2, 3, 4, 5]
+
+    assert archive_trips(date(2030, 1, 1), bind=bind, path=tmp_path / "archive.db", report=quiet) == 5
+    assert trip_ids(bind) == []
+
+    bulk_seed(5, seed=1, chunk_size=2, anchor=date(2020, 1, 1), bind=bind, report=quiet)
+    assert trip_ids(bind) == [6, 7, 8, 9, 10]
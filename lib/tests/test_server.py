@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+from db.config import create_async_db_engine
+from db.models import engine, ensure_schema
+from server import Server
+from service import AsyncItineraryService
+
+
+async def exchange(requests):
+    """Send (method, target, body) requests to a server on a free port; returns [(status, payload)]"""
+    errors = []
+    service = AsyncItineraryService(create_async_db_engine())
+    server = await asyncio.start_server(Server(service, errors.append).handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    answers = []
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for method, target, body in requests:
+            data = json.dumps(body).encode() if body is not None else b""
+            writer.write(f"{method} {target} HTTP/1.1\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            answers.append((status, json.loads(await reader.readexactly(int(headers["content-length"])))))
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await service.close()
+    assert errors == []
+    return answers
+
+
+@pytest.fixture(scope="module")
+def trip_id():
+    ensure_schema(engine)
+    [(status, trip)] = asyncio.run(exchange([
+        ("POST", "/trips", {"destination": "Server Test", "start_date": "2030-05-01", "end_date": "2030-05-04"}),
+    ]))
+    assert status == 201
+    return trip["id"]
+
+
+@pytest.mark.parametrize("target", [
+    "/trips/99999999999999999999999",
+    "/trips/9223372036854775808/conflicts",
+])
+def test_ids_beyond_sqlite_integers_are_not_found(trip_id, target):
+    [(status, _)] = asyncio.run(exchange([("GET", target, None)]))
+    assert status == 404
+
+
+def test_query_numbers_beyond_sqlite_integers_are_rejected(trip_id):
+    [(status, payload)] = asyncio.run(exchange([("GET", "/trips?after_id=99999999999999999999999", None)]))
+    assert status == 400
+    assert "after_id" in payload["error"]
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("POST", "/trips", {"destination": ["x"], "start_date": "2030-05-01", "end_date": "2030-05-02"}),
+    ("POST", "/trips", {"destination": "x", "start_date": ["2030-05-01"], "end_date": "2030-05-02"}),
+    ("PATCH", "/trips/{}", {"destination": {"name": "x"}}),
+    ("POST", "/trips/{}/activities", {"name": 5, "date": "2030-05-02"}),
+    ("POST", "/trips/{}/activities", {"name": "Walk", "date": "2030-05-02", "time": 930}),
+    ("POST", "/trips/{}/activities", {"name": "Walk", "date": "2030-05-02", "time": "09:30", "duration": True}),
+    ("POST", "/trips/{}/activities", {"name": "Walk", "date": "2030-05-02", "time": "09:30", "duration": 10 ** 30}),
+    ("POST", "/trips/{}/bookings", {"flight": ["AF1"], "hotel": "Ritz"}),
+    ("POST", "/trips/{}/activities/recurring", {"name": "Swim", "weekdays": [["mon"]]}),
+    ("POST", "/trips/{}/activities/recurring", {"name": "Swim", "weekdays": 3}),
+])
+def test_fields_of_the_wrong_type_are_rejected(trip_id, method, path, body):
+    [(status, payload), (_, trip)] = asyncio.run(exchange([
+        (method, path.format(trip_id), body), ("GET", f"/trips/{trip_id}", None),
+    ]))
+    assert status == 400, payload
+    assert trip["destination"] == "Server Test"
+    assert trip["activities"] == [] and trip["bookings"] == []
@@ -0,0 +1,78 @@
+from db.config import create_db_engine
+from db.models import ensure_schema
+from db.trip_summary import stale_trip_summaries
+
+# What trip_search should hold, rebuilt from the source tables
+EXPECTED_SEARCH = """
+    SELECT id * 4 + 1, destination, NULL, NULL, NULL, id FROM trips
+    UNION ALL SELECT id * 4 + 2, NULL, name, NULL, NULL, trip_id FROM activities
+    UNION ALL SELECT id * 4 + 3, NULL, NULL, flight, hotel, trip_id FROM bookings
+    ORDER BY 1
+"""
+SEARCH = "SELECT rowid, destination, activity, flight, hotel, trip_id FROM trip_search ORDER BY rowid"
+
+CHANGES = [
+    # Activities moved between trips, redated, renamed and removed
+    "UPDATE activities SET trip_id = 2, date = '2030-02-03' WHERE name = 'Museum'",
+    "UPDATE activities SET date = '2030-01-04' WHERE name = 'Boat'",
+    "UPDATE activities SET name = 'Night walk' WHERE name = 'Walk'",
+    "DELETE FROM activities WHERE name = 'Lunch'",
+    # Bookings moved and edited
+    "UPDATE bookings SET trip_id = 3 WHERE flight = 'AB1'",
+    "UPDATE bookings SET hotel = 'Grand' WHERE flight = 'CD2'",
+    "UPDATE trips SET destination = 'Bergen' WHERE id = 1",
+    # Children go with their trip through ON DELETE CASCADE
+    "DELETE FROM trips WHERE id = 3",
+]
+
+
+def check(connection):
+    assert stale_trip_summaries(connection, 1, 10) == []
+    assert connection.exec_driver_sql(SEARCH).all() == connection.exec_driver_sql(EXPECTED_SEARCH).all()
+
+
+def test_summaries_and_search_follow_updates_and_deletes(tmp_path):
+    bind = create_db_engine(f"sqlite:///{tmp_path / 'travel_itinerary.db'}")
+    ensure_schema(bind)
+    with bind.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO trips (destination, start_date, end_date) VALUES "
+            "('Oslo', '2030-01-01', '2030-01-05'), ('Rome', '2030-02-01', '2030-02-05'), "
+            "('Lima', '2030-03-01', '2030-03-05')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO activities (trip_id, name, date) VALUES "
+            "(1, 'Museum', '2030-01-01'), (1, 'Boat', '2030-01-02'), (1, 'Walk', '2030-01-03'), "
+            "(2, 'Lunch', '2030-02-05'), (3, 'Hike', '2030-03-02')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO bookings (trip_id, flight, hotel) VALUES (1, 'AB1', NULL), (2, 'CD2', 'Inn')"
+        )
+        check(connection)
+        assert connection.exec_driver_sql(
+            "SELECT trip_id, activity_count, booking_count, first_activity, last_activity "
+            "FROM trip_summaries ORDER BY trip_id"
+        ).all() == [
+            (1, 3, 1, "2030-01-01", "2030-01-03"),
+            (2, 1, 1, "2030-02-05", "2030-02-05"),
+            (3, 1, 0, "2030-03-02", "2030-03-02"),
+        ]
+
+        for change in CHANGES:
+            connection.exec_driver_sql(change)
+            check(connection)
+
+        assert connection.exec_driver_sql(
+            "SELECT trip_id, activity_count, booking_count, first_activity, last_activity "
+            "FROM trip_summaries ORDER BY trip_id"
+        ).all() == [
+            (1, 2, 0, "2030-01-03", "2030-01-04"),
+            (2, 1, 1, "2030-02-03", "2030-02-03"),
+        ]
+        assert connection.exec_driver_sql(
+            "SELECT DISTINCT trip_id FROM trip_search WHERE trip_search MATCH 'bergen OR night OR grand' "
+            "ORDER BY trip_id"
+        ).scalars().all() == [1, 2]
+        assert connection.exec_driver_sql(
+            "SELECT count(*) FROM trip_search WHERE trip_search MATCH 'oslo OR lunch OR lima OR hike'"
+        ).scalar() == 0
@@ -0,0 +1,182 @@
+"""
+Group commit: many callers, one writer thread, one transaction per batch.
+
+SQLite takes one writer at a time, and every commit pays for its own
+journal sync. When many threads each commit their own row, they queue up
+on the database lock and pay for one sync per row. A WriteQueue takes
+service operations from any number of callers instead:
+
+    submit(add_booking, trip_id, ...) -> Future
+        queue -> writer thread: up to `max_batch` jobs or `max_delay`
+        seconds, whichever comes first -> one BEGIN IMMEDIATE ... COMMIT
+
+The service operations raise ServiceError before they change anything,
+so such a job simply reaches its caller through the future while the rest
+of the batch commits. Any other error rolls the batch back and runs it
+again with a SAVEPOINT around each job, so only the failing job is lost.
+Futures resolve only after the COMMIT succeeded.
+
+When another process holds the database (SQLITE_BUSY, "database is locked"),
+the whole batch is rolled back and retried with jittered exponential
+backoff, on top of the busy_timeout the connection already waits.
+"""
+import queue
+import random
+import sqlite3
+import threading
+import time as clock
+from concurrent.futures import Future
+from sqlalchemy.exc import OperationalError
+from db.models import Session
+from service import ServiceError
+
+MAX_BATCH = 256
+MAX_DELAY = 0.002
+BUSY_RETRIES = 8
+BACKOFF = 0.01
+MAX_BACKOFF = 1.0
+
+_STOP = object()
+
+def is_busy(error):
+    """True for SQLITE_BUSY/SQLITE_LOCKED, including extended codes such as BUSY_SNAPSHOT"""
+    orig = getattr(error, "orig", error)
+    if not isinstance(orig, sqlite3.OperationalError):
+        return False
+    code = getattr(orig, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(orig) or "busy" in str(orig)
+
+class WriteQueue:
+    """
+    Runs submitted service operations on one writer thread, in group commits
+    Use as a context manager, or call close() to finish queued jobs and stop.
+    """
+
+    def __init__(self, max_batch=MAX_BATCH, max_delay=MAX_DELAY, retries=BUSY_RETRIES,
+                 backoff=BACKOFF, max_backoff=MAX_BACKOFF, sessions=Session):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sessions = sessions
+        self.writes = 0
+        self.commits = 0
+        self.busy_retries = 0
+        self.largest_batch = 0
+        self._jobs = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args):
+        """Queue operation(session, *args); the Future holds its result once committed"""
+        if self._closed:
+            raise RuntimeError("WriteQueue is closed")
+        future = Future()
+        self._jobs.put((future, operation, args))
+        return future
+
+    def close(self):
+        """Commit whatever is queued, then stop the writer thread"""
+        if not self._closed:
+            self._closed = True
+            self._jobs.put(_STOP)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def info(self):
+        return {"writes": self.writes, "commits": self.commits, "busy_retries": self.busy_retries,
+                "largest_batch": self.largest_batch}
+
+    def _collect(self):
+        """Block for one job, then take more until the batch is full or max_delay has passed"""
+        batch = [self._jobs.get()]
+        deadline = clock.monotonic() + self.max_delay
+        while batch[-1] is not _STOP and len(batch) < self.max_batch:
+            remaining = deadline - clock.monotonic()
+            try:
+                batch.append(self._jobs.get(timeout=remaining) if remaining > 0 else self._jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is _STOP
+            jobs = [job for job in batch if job is not _STOP and job[0].set_running_or_notify_cancel()]
+            if jobs:
+                self._commit(jobs)
+            if stop:
+                return
+
+    def _begin(self, session):
+        connection = session.connection()
+        if connection.dialect.name == "sqlite":
+            # Take the write lock up front: a deferred transaction that reads
+            # first fails with BUSY_SNAPSHOT instead of waiting for the lock
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    def _run_jobs(self, session, jobs, savepoints):
+        """[(result, error)] per job; without savepoints only ServiceErrors are caught"""
+        outcomes = []
+        for _, operation, args in jobs:
+            try:
+                if savepoints:
+                    with session.begin_nested():
+                        outcomes.append((operation(session, *args), None))
+                else:
+                    outcomes.append((operation(session, *args), None))
+            except ServiceError as error:
+                outcomes.append((None, error))
+            except Exception as error:
+                if is_busy(error) or not savepoints:
+                    raise
+                outcomes.append((None, error))
+        return outcomes
+
+    def _commit(self, jobs):
+        savepoints = False
+        attempt = 0
+        while True:
+            try:
+                with self.sessions() as session:
+                    self._begin(session)
+                    outcomes = self._run_jobs(session, jobs, savepoints)
+                    session.commit()
+            except OperationalError as error:
+                if is_busy(error) and attempt < self.retries:
+                    self.busy_retries += 1
+                    clock.sleep(min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0))
+                    attempt += 1
+                    continue
+                if not savepoints and not is_busy(error):
+                    savepoints = True
+                    continue
+                for future, _, _ in jobs:
+                    future.set_exception(error)
+                return
+            except Exception as error:
+                if not savepoints:
+                    savepoints = True
+                    continue
+                for future, _, _ in jobs:
+                    future.set_exception(error)
+                return
+            self.commits += 1
+            self.writes += len(jobs)
+            self.largest_batch = max(self.largest_batch, len(jobs))
+            for (future, _, _), (result, error) in zip(jobs, outcomes):
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            return